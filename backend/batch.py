@@ -0,0 +1,420 @@
+#!/usr/bin/env python3
+"""
+Пакетное конспектирование каталога PDF без запуска API.
+
+PDF извлекаются параллельно в пуле процессов, главы всех книг попадают
+в одну общую очередь запросов к LM Studio. Результаты каждой книги
+сохраняются в отдельный подкаталог output_dir, уже готовые книги пропускаются.
+
+Пример:
+    python batch.py "D:\\Books" --workers 4
+    python batch.py "D:\\Books\\**\\*.pdf" --output-dir D:\\Conspects
+"""
+import argparse
+import asyncio
+import glob
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+from processor import PDFProcessor
+from lm_studio_client import LMStudioClient
+from extractive import CompressionStats, compression_available
+from throughput import DEFAULT_CHARS_PER_TOKEN
+from checkpoint import JobCheckpoint, config_snapshot, file_sha256
+from library import Library, settings_hash
+from resource_usage import PeakRSSMonitor
+from sandbox import ExtractionSandbox
+from packing import plan_packs, DEFAULT_PACK_CHAPTER_CHARS, DEFAULT_PACK_MAX_CHAPTERS
+
+
+def load_config(path: Path) -> dict:
+    """Загрузка config.json (тот же файл, что использует backend)"""
+    if path.exists():
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    return {}
+
+
+def find_pdfs(inputs: List[str]) -> List[Path]:
+    """Поиск PDF по каталогам и glob-шаблонам"""
+    found = []
+    for item in inputs:
+        path = Path(item)
+        if path.is_dir():
+            found.extend(sorted(path.rglob("*.pdf")))
+        elif path.is_file():
+            found.append(path)
+        else:
+            found.extend(sorted(Path(p) for p in glob.glob(item, recursive=True)))
+    # Убираем дубликаты, сохраняя порядок
+    unique = {}
+    for path in found:
+        if path.suffix.lower() == ".pdf":
+            unique.setdefault(path.resolve(), path)
+    return list(unique.values())
+
+
+def book_dirs(pdfs: List[Path], output_dir: Path) -> Dict[Path, Path]:
+    """
+    Подкаталоги книг в output_dir: путь PDF без расширения относительно общего каталога входных файлов
+
+    Одноименные книги из разных каталогов (a/intro.pdf и b/intro.pdf) не пишут в один подкаталог.
+    """
+    resolved = {path: path.resolve() for path in pdfs}
+    try:
+        root = Path(os.path.commonpath([str(path.parent) for path in resolved.values()]))
+    except ValueError:
+        # Файлы на разных дисках: путь от корня диска
+        root = None
+    dirs = {}
+    for path, full in resolved.items():
+        relative = full.relative_to(root) if root is not None else full.relative_to(full.anchor)
+        dirs[path] = output_dir / relative.with_suffix("")
+    return dirs
+
+
+def book_config(config: dict, book_dir: Path) -> dict:
+    """Конфигурация книги: промежуточные файлы пишутся в ее подкаталог"""
+    cfg = dict(config)
+    cfg["output_dir"] = str(book_dir)
+    return cfg
+
+
+def extract_book(pdf_path: str, config: dict) -> dict:
+    """Извлечение и нарезка одной книги (выполняется в отдельном процессе)"""
+    started = time.time()
+    monitor = PeakRSSMonitor().start()
+    # Зависшая страница или раздутая память не останавливают процесс пула: страницы читает воркер песочницы
+    sandbox = ExtractionSandbox.from_config(config) if config.get("extraction_sandbox", True) else None
+    try:
+        chapters = PDFProcessor(config, sandbox=sandbox).process_pdf(pdf_path)
+    finally:
+        peak_rss_mb = monitor.stop()
+        if sandbox is not None:
+            sandbox.close()
+    return {
+        "chapters": chapters,
+        "chars": sum(len(ch) for ch in chapters),
+        "seconds": time.time() - started,
+        "peak_rss_mb": peak_rss_mb
+    }
+
+
+def format_chapter(idx: int, summary: str) -> str:
+    return f"## Глава {idx + 1}\n\n{summary}\n\n"
+
+
+class BatchRunner:
+    """Извлечение книг в пуле процессов и общая очередь глав для LM Studio"""
+
+    def __init__(self, config: dict, output_dir: Path, workers: int, llm_workers: int, force: bool):
+        self.config = config
+        self.output_dir = output_dir
+        self.jobs_dir = output_dir / ".jobs"
+        self.workers = workers
+        self.llm_workers = llm_workers
+        self.force = force
+        self.max_chunk_size = config.get("max_chunk_size", 15000)
+        self.chunk_overlap = config.get("chunk_overlap", 0)
+        # Небольшие главы подряд - одним запросом, пока модель соблюдает разделы ответа
+        self.pack_chapters = config.get("pack_chapters", True)
+        self.library = Library(Path(config.get("library_path") or output_dir / "library.sqlite3"))
+        self.settings = settings_hash(config)
+        self.lm_client = LMStudioClient(
+            base_url=config.get("lm_studio_url", "http://localhost:1234"),
+            model_name=config.get("lm_studio_model", "local-model"),
+            max_workers=llm_workers,
+            prompt_cache=config.get("prompt_cache", True),
+            slot_count=config.get("llm_slots", 0),
+            routes=config.get("model_routes")
+        )
+        self.compression = None
+        if config.get("fast_mode", False) and compression_available():
+            self.compression = CompressionStats(config.get("fast_mode_ratio", 0.4))
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.books = {}  # job_id -> состояние книги
+        self.book_dirs: Dict[Path, Path] = {}
+        self.stats = {
+            "books_total": 0, "books_done": 0, "books_skipped": 0, "books_failed": 0,
+            "chapters": 0, "chapter_errors": 0, "input_chars": 0,
+            "packs": 0, "packed_chapters": 0,
+            "extract_seconds": 0.0, "llm_seconds": 0.0
+        }
+
+    def book_dir(self, pdf_path: Path) -> Path:
+        return self.book_dirs[pdf_path]
+
+    async def run(self, pdfs: List[Path]) -> dict:
+        started = time.time()
+        self.stats["books_total"] = len(pdfs)
+        self.book_dirs = book_dirs(pdfs, self.output_dir)
+        consumers = [asyncio.create_task(self.consume()) for _ in range(self.llm_workers)]
+
+        loop = asyncio.get_event_loop()
+        with ProcessPoolExecutor(max_workers=self.workers) as pool:
+            pending = []
+            for pdf_path in pdfs:
+                document_id = file_sha256(str(pdf_path))
+                self.library.add_document(document_id, pdf_path.name, pdf_path.stat().st_size)
+                checkpoint = JobCheckpoint(self.jobs_dir, document_id[:16])
+                book_dir = self.book_dir(pdf_path)
+                cfg = book_config(self.config, book_dir)
+
+                if self.force and checkpoint.exists():
+                    checkpoint.state = {}
+                if checkpoint.exists() and checkpoint.is_compatible(cfg):
+                    if checkpoint.status == "completed" and (book_dir / "summary.md").exists():
+                        print(f"[SKIP] {pdf_path.name}: уже обработана")
+                        self.stats["books_skipped"] += 1
+                        continue
+                    # Незавершенная книга: главы берем из чекпоинта без повторного извлечения
+                    resume_from = checkpoint.first_unfinished()
+                    if resume_from is not None:
+                        print(f"[RESUME] {pdf_path.name}: продолжение с главы {resume_from + 1}")
+                    self.enqueue_book(pdf_path, checkpoint, checkpoint.load_chapters())
+                    continue
+
+                future = loop.run_in_executor(pool, extract_book, str(pdf_path), cfg)
+                pending.append(self.on_extracted(pdf_path, document_id, checkpoint, cfg, future))
+
+            await asyncio.gather(*pending)
+
+        await self.queue.join()
+        for consumer in consumers:
+            consumer.cancel()
+
+        self.stats["wall_seconds"] = time.time() - started
+        self.stats["prompt_cache"] = self.lm_client.throughput.to_dict()
+        self.stats["models"] = self.lm_client.model_stats.to_dict()
+        if self.compression is not None:
+            self.stats["fast_mode"] = self.compression.to_dict(
+                self.config.get("chars_per_token", DEFAULT_CHARS_PER_TOKEN), self.lm_client.throughput
+            )
+        return self.stats
+
+    async def on_extracted(self, pdf_path: Path, document_id: str, checkpoint: JobCheckpoint, cfg: dict, future):
+        try:
+            result = await future
+        except Exception as e:
+            print(f"[ERROR] {pdf_path.name}: {e}")
+            self.stats["books_failed"] += 1
+            return
+        self.stats["extract_seconds"] += result["seconds"]
+        rss = f", пик памяти {result['peak_rss_mb']:.0f} МБ" if result["peak_rss_mb"] is not None else ""
+        print(f"[EXTRACT] {pdf_path.name}: глав {len(result['chapters'])}, {result['seconds']:.1f} с{rss}")
+        checkpoint.create(result["chapters"], cfg, pdf_path.name, document_id)
+        self.library.start_run(checkpoint.job_id, document_id, config_snapshot(cfg), result["chapters"])
+        self.enqueue_book(pdf_path, checkpoint, result["chapters"])
+
+    def enqueue_book(self, pdf_path: Path, checkpoint: JobCheckpoint, chapters: List[str]):
+        book_dir = self.book_dir(pdf_path)
+        book_dir.mkdir(parents=True, exist_ok=True)
+        checkpoint.set_status("processing")
+        run_id = self.library.run_for_checkpoint(checkpoint)
+        self.library.set_run_status(run_id, "processing")
+        remaining = [idx for idx in range(len(chapters)) if checkpoint.chapter_summary(idx) is None]
+        self.books[checkpoint.job_id] = {
+            "name": pdf_path.name,
+            "dir": book_dir,
+            "checkpoint": checkpoint,
+            "run_id": run_id,
+            "summaries": {idx: checkpoint.chapter_summary(idx) for idx in range(len(chapters))
+                          if checkpoint.chapter_summary(idx) is not None},
+            "total": len(chapters),
+            "remaining": len(remaining)
+        }
+        if not remaining:
+            self.finish_book(checkpoint.job_id)
+            return
+        # Элемент очереди - пачка подряд идущих глав (см. packing.py); без упаковки - по одной
+        if self.pack_chapters:
+            packs = plan_packs(
+                [len(chapters[idx]) for idx in remaining],
+                self.max_chunk_size,
+                self.config.get("pack_chapter_chars", DEFAULT_PACK_CHAPTER_CHARS),
+                self.config.get("pack_max_chapters", DEFAULT_PACK_MAX_CHAPTERS)
+            )
+        else:
+            packs = [[pos] for pos in range(len(remaining))]
+        for pack in packs:
+            self.stats["input_chars"] += sum(len(chapters[remaining[pos]]) for pos in pack)
+            self.queue.put_nowait((checkpoint.job_id, [(remaining[pos], chapters[remaining[pos]]) for pos in pack]))
+
+    async def consume(self):
+        while True:
+            job_id, pack = await self.queue.get()
+            book = self.books[job_id]
+            started = time.time()
+            summaries: Dict[int, str] = {}
+            try:
+                summaries = await self.summarize_pack(book, pack)
+            except Exception as e:
+                for idx, _ in pack:
+                    if idx not in summaries:
+                        summaries[idx] = f"Ошибка обработки: {e}"
+                        self.stats["chapter_errors"] += 1
+            finally:
+                self.stats["llm_seconds"] += time.time() - started
+            try:
+                for idx, summary in summaries.items():
+                    self.stats["chapters"] += 1
+                    book["summaries"][idx] = summary
+                    book["remaining"] -= 1
+                if book["remaining"] == 0:
+                    self.finish_book(job_id)
+            except Exception as e:
+                print(f"[ERROR] {book['name']}: {e}")
+            finally:
+                self.queue.task_done()
+
+    async def summarize_pack(self, book: dict, pack: List[Tuple[int, str]]) -> Dict[int, str]:
+        """Конспекты пачки глав: одним запросом, а если ответ не разобран - по одной"""
+        checkpoint = book["checkpoint"]
+        summaries: Dict[int, str] = {}
+        pending = []
+        for idx, chapter in pack:
+            # Глава с тем же текстом уже конспектировалась с теми же настройками
+            summary = self.library.cached_summary(chapter, self.settings)
+            if summary is not None:
+                checkpoint.mark_chapter_done(idx, summary)
+                self.library.save_chapter_summary(book["run_id"], idx, chapter, summary, self.settings)
+                summaries[idx] = summary
+            else:
+                pending.append((idx, chapter))
+        
+        if len(pending) > 1 and self.pack_chapters:
+            texts = [chapter for _, chapter in pending]
+            if self.compression is not None:
+                loop = asyncio.get_event_loop()
+                texts = [await loop.run_in_executor(None, self.compression.compress, text) for text in texts]
+            packed = await self.lm_client.process_pack(texts, tags={"chapter": pending[0][0]})
+            if packed is not None:
+                for (idx, chapter), summary in zip(pending, packed):
+                    checkpoint.mark_chapter_done(idx, summary)
+                    self.library.save_chapter_summary(book["run_id"], idx, chapter, summary, self.settings)
+                    summaries[idx] = summary
+                self.stats["packs"] += 1
+                self.stats["packed_chapters"] += len(pending)
+                return summaries
+            # Модель не соблюдает разделы: дальше все главы идут по одной
+            self.pack_chapters = False
+            print(f"[WARNING] {book['name']}: ответ на пачку глав не разобран по разделам, "
+                  f"главы обрабатываются по одной")
+        
+        for idx, chapter in pending:
+            try:
+                summaries[idx] = await self.summarize(book, idx, chapter)
+            except Exception as e:
+                summaries[idx] = f"Ошибка обработки: {e}"
+                self.stats["chapter_errors"] += 1
+        return summaries
+
+    async def summarize(self, book: dict, idx: int, chapter: str) -> str:
+        checkpoint = book["checkpoint"]
+        source = chapter
+        if self.compression is not None:
+            loop = asyncio.get_event_loop()
+            chapter = await loop.run_in_executor(None, self.compression.compress, chapter)
+        summary = await self.lm_client.process_chapter(
+            chapter,
+            self.max_chunk_size,
+            self.chunk_overlap,
+            done_chunks=checkpoint.chunk_summaries(idx),
+            on_chunk_done=lambda chunk_idx, total, text: (
+                checkpoint.mark_chunk_done(idx, chunk_idx, total, text),
+                self.library.save_chunk_summary(book["run_id"], idx, chunk_idx, text)
+            )
+        )
+        if checkpoint.is_chapter_complete(idx):
+            checkpoint.mark_chapter_done(idx, summary)
+            self.library.save_chapter_summary(book["run_id"], idx, source, summary, self.settings)
+        else:
+            self.stats["chapter_errors"] += 1
+        return summary
+
+    def finish_book(self, job_id: str):
+        book = self.books[job_id]
+        checkpoint = book["checkpoint"]
+        final_text = "\n".join(format_chapter(idx, book["summaries"][idx]) for idx in range(book["total"]))
+        (book["dir"] / "summary.md").write_text(final_text, encoding="utf-8")
+        if checkpoint.first_unfinished() is None:
+            checkpoint.set_status("completed")
+            self.library.set_run_status(book["run_id"], "completed")
+            self.stats["books_done"] += 1
+            print(f"[DONE] {book['name']} -> {book['dir'] / 'summary.md'}")
+        else:
+            checkpoint.set_status("error", "Не все главы обработаны успешно")
+            self.library.set_run_status(book["run_id"], "error", "Не все главы обработаны успешно")
+            self.stats["books_failed"] += 1
+            print(f"[PARTIAL] {book['name']}: часть глав с ошибками, перезапустите для повтора")
+
+
+def print_report(stats: dict):
+    wall = stats.get("wall_seconds", 0) or 1e-9
+    print("\n" + "=" * 60)
+    print("Итоги пакетной обработки")
+    print("=" * 60)
+    print(f"Книг: {stats['books_total']} (готово {stats['books_done']}, "
+          f"пропущено {stats['books_skipped']}, с ошибками {stats['books_failed']})")
+    print(f"Глав обработано: {stats['chapters']} (с ошибками {stats['chapter_errors']})")
+    print(f"Время: {stats['wall_seconds']:.1f} с "
+          f"(извлечение {stats['extract_seconds']:.1f} с суммарно по процессам, LLM {stats['llm_seconds']:.1f} с)")
+    print(f"Пропускная способность: {stats['input_chars'] / wall:.0f} симв./с, "
+          f"{stats['chapters'] / wall * 60:.1f} глав/мин, "
+          f"{stats['books_done'] / wall * 3600:.1f} книг/ч")
+    models = stats.get("models") or {}
+    if len(models) > 1:
+        # Маршрутизация по моделям: данные для подбора порогов model_routes
+        for name, model in models.items():
+            print(f"Модель {name}: {model['requests']} запросов ({model['errors']} с ошибками), "
+                  f"{model['prompt_tokens']} + {model['completion_tokens']} токенов, "
+                  f"задержка {model['latency_avg_seconds']} с в среднем, генерация {model['gen_tps']} ток./с")
+    if stats.get("packs"):
+        print(f"Упаковка: {stats['packed_chapters']} небольших глав в {stats['packs']} запросах")
+    cache = stats.get("prompt_cache") or {}
+    if cache.get("prompt_cache_ratio") is not None:
+        print(f"Кеш промпта: {cache['cached_prompt_tokens']} токенов из кеша сервера "
+              f"({cache['prompt_cache_ratio']:.0%} токенов промпта за последние запросы)")
+    if "fast_mode" in stats:
+        fast = stats["fast_mode"]
+        print(f"Быстрый режим (доля {fast['ratio']}): {fast['chars_in']} -> {fast['chars_out']} симв., "
+              f"сэкономлено ~{fast['tokens_saved']} токенов, сжатие {fast['compress_seconds']} с, "
+              f"выигрыш ~{fast['estimated_seconds_saved']} с")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Пакетное конспектирование PDF")
+    parser.add_argument("inputs", nargs="+", help="Каталоги, файлы или glob-шаблоны PDF")
+    parser.add_argument("--config", default="config.json", help="Путь к config.json")
+    parser.add_argument("--output-dir", help="Каталог результатов (по умолчанию output_dir из конфига)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="Число процессов для извлечения текста")
+    parser.add_argument("--llm-workers", type=int, default=1,
+                        help="Число одновременных запросов к LM Studio")
+    parser.add_argument("--force", action="store_true", help="Обработать заново уже готовые книги")
+    args = parser.parse_args()
+
+    config = load_config(Path(args.config))
+    output_dir = Path(args.output_dir or config.get("output_dir", "output"))
+    output_dir.mkdir(parents=True, exist_ok=True)
+    config["output_dir"] = str(output_dir)
+
+    pdfs = find_pdfs(args.inputs)
+    if not pdfs:
+        print("PDF файлы не найдены")
+        return 1
+    print(f"Найдено PDF: {len(pdfs)}")
+
+    runner = BatchRunner(config, output_dir, max(1, args.workers), max(1, args.llm_workers), args.force)
+    stats = asyncio.run(runner.run(pdfs))
+    print_report(stats)
+    return 0 if stats["books_failed"] == 0 else 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,177 @@
+"""
+Генерация синтетических корпусов для бенчмарков.
+
+Тексты детерминированы (фиксированный seed) и похожи на извлеченный из PDF
+текст: короткие строки, заголовки глав, сокращения, переносы, блоки
+оглавления с точками-заполнителями. PDF строятся без внешних зависимостей
+(стандартный шрифт Helvetica, поэтому в PDF используется английский корпус).
+"""
+import random
+import zlib
+from pathlib import Path
+from typing import List
+
+RU_WORDS = (
+    "анализ система процесс метод данные результат модель развитие структура "
+    "функция значение условие задача решение элемент уровень свойство принцип "
+    "теория практика исследование основа управление группа форма вопрос история "
+    "общество государство экономика право культура наука знание опыт время "
+    "является представляет определяет позволяет обеспечивает рассматривает "
+    "важный основной новый общий различный современный социальный научный"
+).split()
+
+EN_WORDS = (
+    "analysis system process method data result model development structure "
+    "function value condition problem solution element level property principle "
+    "theory practice research basis management group form question history "
+    "society state economy law culture science knowledge experience time "
+    "represents determines allows provides considers describes important main "
+    "new general different modern social scientific"
+).split()
+
+RU_ABBREVIATIONS = ["т.е.", "т.д.", "т.п.", "др.", "см.", "рис.", "стр.", "г.", "А.С. Пушкин"]
+EN_ABBREVIATIONS = ["e.g.", "i.e.", "etc.", "Fig.", "p.", "Dr.", "J.R.R. Tolkien"]
+
+RU_HEADINGS = ["Глава", "Раздел", "Тема", "Введение", "Итог"]
+EN_HEADINGS = ["Chapter", "Section", "Part", "Introduction", "Summary"]
+
+SIZES = {
+    "10KB": 10 * 1024,
+    "100KB": 100 * 1024,
+    "1MB": 1024 * 1024,
+    "10MB": 10 * 1024 * 1024,
+    "50MB": 50 * 1024 * 1024,
+}
+
+PDF_PAGES = [10, 100, 500, 2000]
+
+
+def _sentence(rng: random.Random, words: List[str], abbreviations: List[str]) -> str:
+    length = rng.randint(6, 22)
+    tokens = [rng.choice(words) for _ in range(length)]
+    if rng.random() < 0.25:
+        tokens.insert(rng.randint(1, length - 1), rng.choice(abbreviations))
+    if rng.random() < 0.1:
+        tokens.insert(rng.randint(1, length - 1), str(rng.randint(1, 2024)))
+    tokens[0] = tokens[0].capitalize()
+    return " ".join(tokens) + rng.choice([".", ".", ".", "!", "?", ";"])
+
+
+def _toc_block(rng: random.Random, headings: List[str]) -> List[str]:
+    lines = []
+    for i in range(rng.randint(8, 20)):
+        title = f"{rng.choice(headings)} {i + 1}"
+        lines.append(f"{title} {'.' * rng.randint(10, 40)} {rng.randint(1, 500)}")
+    return lines
+
+
+def _wrap(text: str, width: int, rng: random.Random) -> List[str]:
+    """Перенос строк как в PDF, иногда с дефисом посередине слова"""
+    lines, line = [], ""
+    for word in text.split(" "):
+        if len(line) + len(word) + 1 > width:
+            if rng.random() < 0.08 and len(word) > 6:
+                cut = len(word) // 2
+                lines.append(f"{line} {word[:cut]}-".strip())
+                line = word[cut:]
+                continue
+            lines.append(line)
+            line = word
+        else:
+            line = f"{line} {word}" if line else word
+    if line:
+        lines.append(line)
+    return lines
+
+
+def generate_text(size: int, lang: str = "ru", seed: int = 42) -> str:
+    """
+    Синтетический текст книги заданного размера (в символах)
+
+    Args:
+        size: Приблизительный размер в символах
+        lang: "ru" или "en"
+        seed: Seed генератора для воспроизводимости
+    """
+    rng = random.Random(f"{seed}:{lang}:{size}")
+    words, abbreviations, headings = (
+        (RU_WORDS, RU_ABBREVIATIONS, RU_HEADINGS) if lang == "ru"
+        else (EN_WORDS, EN_ABBREVIATIONS, EN_HEADINGS)
+    )
+    lines: List[str] = _toc_block(rng, headings)
+    total = sum(len(line) + 1 for line in lines)
+    chapter = 0
+    while total < size:
+        chapter += 1
+        heading_style = rng.random()
+        if heading_style < 0.6:
+            block = [f"{rng.choice(headings)} {chapter}. {rng.choice(words).capitalize()}"]
+        elif heading_style < 0.8:
+            block = [f"{chapter}. {rng.choice(headings)} {rng.choice(words)}"]
+        else:
+            block = [f"## {rng.choice(words).capitalize()} {rng.choice(words)}"]
+        for _ in range(rng.randint(3, 40)):
+            paragraph = " ".join(_sentence(rng, words, abbreviations) for _ in range(rng.randint(2, 8)))
+            block.extend(_wrap(paragraph, rng.randint(60, 90), rng))
+        lines.extend(block)
+        total += sum(len(line) + 1 for line in block)
+    return "\n".join(lines)[:size]
+
+
+def _pdf_escape(line: str) -> str:
+    return line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def generate_pdf(path: Path, pages: int, seed: int = 42) -> Path:
+    """
+    Генерация текстового PDF с заданным числом страниц
+
+    Каждая страница содержит ~45 строк английского текста.
+    """
+    rng = random.Random(f"{seed}:pdf:{pages}")
+    lines_per_page = 45
+    text_lines = generate_text(pages * lines_per_page * 80, "en", seed).split("\n")
+
+    objects: List[bytes] = []
+
+    def add(obj: bytes) -> int:
+        objects.append(obj)
+        return len(objects)
+
+    font_id = add(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>")
+    pages_id = add(b"")  # заполняется после создания страниц
+    page_ids = []
+    for page in range(pages):
+        chunk = text_lines[page * lines_per_page:(page + 1) * lines_per_page]
+        if not chunk:
+            chunk = [" ".join(rng.choice(EN_WORDS) for _ in range(10))]
+        stream_lines = ["BT", "/F1 10 Tf", "12 TL", "50 800 Td"]
+        for line in chunk:
+            encoded = _pdf_escape(line.encode("latin-1", "replace").decode("latin-1"))
+            stream_lines.append(f"({encoded}) Tj T*")
+        stream_lines.append("ET")
+        content = zlib.compress("\n".join(stream_lines).encode("latin-1"))
+        content_id = add(b"<< /Length %d /Filter /FlateDecode >>\nstream\n" % len(content) + content + b"\nendstream")
+        page_ids.append(add(
+            b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 595 842] "
+            b"/Resources << /Font << /F1 %d 0 R >> >> /Contents %d 0 R >>" % (pages_id, font_id, content_id)
+        ))
+    kids = b" ".join(b"%d 0 R" % pid for pid in page_ids)
+    objects[pages_id - 1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, len(page_ids))
+    catalog_id = add(b"<< /Type /Catalog /Pages %d 0 R >>" % pages_id)
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, obj in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % number + obj + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        out += b"%010d 00000 n \n" % offset
+    out += b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, catalog_id, xref)
+
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(bytes(out))
+    return path
@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+"""
+Микробенчмарки горячих путей обработки текста.
+
+Измеряет время и пиковую память (tracemalloc) для нарезки на главы
+(детектором заголовков и, для сравнения, прежним регулярным выражением),
+фильтра мусорных фрагментов и служебных страниц, индекса границ предложений,
+разбиения на чанки, экстрактивного сжатия и извлечения текста из PDF на
+синтетических корпусах. Результаты можно сохранить как baseline и сравнивать
+с ними последующие запуски.
+
+Примеры:
+    python benchmarks/run.py run --max-size 10MB --save before
+    python benchmarks/run.py run --compare before
+    python benchmarks/run.py compare before after --threshold 0.15
+"""
+import argparse
+import gc
+import json
+import platform
+import re
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Callable, Dict, List
+
+BENCH_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BENCH_DIR.parent))
+sys.path.insert(0, str(BENCH_DIR))
+
+from corpus import SIZES, PDF_PAGES, EN_HEADINGS, generate_text, generate_pdf  # noqa: E402
+
+# Ключевые слова по умолчанию и английские заголовки корпуса: нарезка находит главы в обоих языках
+HEADING_KEYWORDS = ["Вариант", "Глава", "Раздел", "Итог", "Тема", "Введение", "Эпилог", *EN_HEADINGS]
+
+BASELINES_DIR = BENCH_DIR / "baselines"
+CACHE_DIR = BENCH_DIR / ".cache"
+
+# Бенчмарки регистрируются декоратором @benchmark и получают (размер, язык, рабочий каталог)
+BENCHMARKS: Dict[str, Callable] = {}
+
+
+def benchmark(name: str):
+    def register(func):
+        BENCHMARKS[name] = func
+        return func
+    return register
+
+
+def make_processor(work_dir: Path):
+    from processor import PDFProcessor
+    return PDFProcessor({"output_dir": str(work_dir), "max_chunk_size": 15000})
+
+
+def make_client():
+    from lm_studio_client import LMStudioClient
+    return LMStudioClient()
+
+
+@benchmark("split_into_chapters")
+def bench_split_into_chapters(text: str, work_dir: Path):
+    processor = make_processor(work_dir)
+    return lambda: processor.split_into_chapters(text)
+
+
+@benchmark("is_junk_fragment")
+def bench_is_junk_fragment(text: str, work_dir: Path):
+    processor = make_processor(work_dir)
+    fragments = [f for f in processor.headings.split(text) if len(f.strip()) >= 100]
+    return lambda: [processor.is_junk_fragment(f) for f in fragments]
+
+
+@benchmark("split_headings_regex")
+def bench_split_headings_regex(text: str, work_dir: Path):
+    """Прежняя нарезка: альтернатива ключевых слов в lookahead после каждого перевода строки"""
+    keywords_pattern = "|".join(HEADING_KEYWORDS)
+    pattern = re.compile(
+        rf'\n\s*(?=(?:\d+[\.\s-]*)?(?:{keywords_pattern}|#{{1,3}}\s))',
+        re.IGNORECASE | re.MULTILINE
+    )
+    return lambda: pattern.split(text)
+
+
+@benchmark("split_headings")
+def bench_split_headings(text: str, work_dir: Path):
+    from headings import heading_detector
+    detector = heading_detector(HEADING_KEYWORDS)
+    return lambda: detector.split(text)
+
+
+@benchmark("classify_pages")
+def bench_classify_pages(text: str, work_dir: Path):
+    """Поиск служебных страниц по всему тексту, нарезанному на страницы по 45 строк"""
+    from page_classifier import classify_pages
+    lines = text.split("\n")
+    pages = ["\n".join(lines[i:i + 45]) for i in range(0, len(lines), 45)]
+    return lambda: classify_pages(pages)
+
+
+@benchmark("sentence_index")
+def bench_sentence_index(text: str, work_dir: Path):
+    from sentences import sentence_index
+    return lambda: sentence_index(text)
+
+
+@benchmark("split_into_chunks")
+def bench_split_into_chunks(text: str, work_dir: Path):
+    client = make_client()
+    return lambda: client.split_into_chunks(text, 15000)
+
+
+@benchmark("compress_text")
+def bench_compress_text(text: str, work_dir: Path):
+    from extractive import compress_text
+    return lambda: compress_text(text, 0.4)
+
+
+def measure(setup: Callable[[], Callable], min_time: float, max_repeats: int) -> dict:
+    """Время (медиана и минимум по повторам) и пиковая память одного вызова"""
+    func = setup()
+    timings: List[float] = []
+    started = time.perf_counter()
+    while len(timings) < max_repeats and (not timings or time.perf_counter() - started < min_time):
+        gc.collect()
+        t0 = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - t0)
+
+    # Пиковая память измеряется отдельным прогоном: tracemalloc искажает время
+    gc.collect()
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "median_s": statistics.median(timings),
+        "min_s": min(timings),
+        "repeats": len(timings),
+        "peak_mb": peak / (1024 * 1024)
+    }
+
+
+def parse_size(value: str) -> int:
+    value = value.upper()
+    if value in SIZES:
+        return SIZES[value]
+    multipliers = {"KB": 1024, "MB": 1024 * 1024}
+    for suffix, mult in multipliers.items():
+        if value.endswith(suffix):
+            return int(float(value[:-len(suffix)]) * mult)
+    return int(value)
+
+
+def run_suite(args) -> dict:
+    results = {}
+    max_size = parse_size(args.max_size)
+    selected = set(args.only) if args.only else None
+
+    with tempfile.TemporaryDirectory() as tmp:
+        work_dir = Path(tmp)
+        for size_name, size in SIZES.items():
+            if size > max_size:
+                continue
+            for lang in ("ru", "en"):
+                text = generate_text(size, lang)
+                for name, setup in BENCHMARKS.items():
+                    if selected and name not in selected:
+                        continue
+                    key = f"{name}[{lang},{size_name}]"
+                    result = measure(lambda: setup(text, work_dir), args.min_time, args.repeats)
+                    results[key] = result
+                    print(f"{key:45s} {result['median_s'] * 1000:10.2f} ms  {result['peak_mb']:8.1f} MB")
+
+        if not args.skip_pdf and (not selected or "extract_text_from_pdf" in selected):
+            CACHE_DIR.mkdir(exist_ok=True)
+            for pages in PDF_PAGES:
+                if pages > args.max_pages:
+                    continue
+                pdf_path = CACHE_DIR / f"synthetic_{pages}.pdf"
+                if not pdf_path.exists():
+                    generate_pdf(pdf_path, pages)
+                processor = make_processor(work_dir)
+                key = f"extract_text_from_pdf[{pages}p]"
+                result = measure(lambda: (lambda: processor.extract_text_from_pdf(str(pdf_path))),
+                                 args.min_time, max(1, min(args.repeats, 3)))
+                results[key] = result
+                print(f"{key:45s} {result['median_s'] * 1000:10.2f} ms  {result['peak_mb']:8.1f} MB")
+
+    return results
+
+
+def save_results(name: str, results: dict) -> Path:
+    BASELINES_DIR.mkdir(exist_ok=True)
+    path = BASELINES_DIR / f"{name}.json"
+    payload = {
+        "created_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "python": platform.python_version(),
+        "machine": platform.platform(),
+        "results": results
+    }
+    path.write_text(json.dumps(payload, indent=2, ensure_ascii=False), encoding="utf-8")
+    print(f"\nBaseline сохранен: {path}")
+    return path
+
+
+def load_results(name: str) -> dict:
+    path = Path(name)
+    if not path.exists():
+        path = BASELINES_DIR / f"{name}.json"
+    if not path.exists():
+        raise SystemExit(f"Baseline не найден: {name}")
+    return json.loads(path.read_text(encoding="utf-8"))["results"]
+
+
+def compare(baseline: dict, current: dict, threshold: float) -> int:
+    """Сравнение результатов; возвращает число регрессий"""
+    regressions = 0
+    print(f"\n{'бенчмарк':45s} {'было, ms':>10s} {'стало, ms':>10s} {'Δ время':>9s} {'Δ память':>9s}")
+    for key in sorted(set(baseline) & set(current)):
+        old, new = baseline[key], current[key]
+        time_delta = new["median_s"] / old["median_s"] - 1 if old["median_s"] else 0.0
+        mem_delta = new["peak_mb"] / old["peak_mb"] - 1 if old["peak_mb"] else 0.0
+        flag = ""
+        if time_delta > threshold or mem_delta > threshold:
+            regressions += 1
+            flag = "  <-- регрессия"
+        print(f"{key:45s} {old['median_s'] * 1000:10.2f} {new['median_s'] * 1000:10.2f} "
+              f"{time_delta:+9.1%} {mem_delta:+9.1%}{flag}")
+    missing = sorted(set(baseline) - set(current))
+    if missing:
+        print(f"\nНет в текущем запуске: {', '.join(missing)}")
+    print(f"\nРегрессий (порог {threshold:.0%}): {regressions}")
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Бенчмарки обработки текста")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = sub.add_parser("run", help="Запуск бенчмарков")
+    run_parser.add_argument("--max-size", default="50MB", help="Максимальный размер корпуса (10KB..50MB)")
+    run_parser.add_argument("--max-pages", type=int, default=2000, help="Максимальное число страниц PDF")
+    run_parser.add_argument("--skip-pdf", action="store_true", help="Не измерять извлечение из PDF")
+    run_parser.add_argument("--only", nargs="*", help="Запустить только указанные бенчмарки")
+    run_parser.add_argument("--min-time", type=float, default=1.0, help="Минимальное время повторов, с")
+    run_parser.add_argument("--repeats", type=int, default=20, help="Максимальное число повторов")
+    run_parser.add_argument("--save", help="Сохранить результаты как baseline с этим именем")
+    run_parser.add_argument("--compare", help="Сравнить с сохраненным baseline")
+    run_parser.add_argument("--threshold", type=float, default=0.15, help="Допустимое замедление (доля)")
+
+    cmp_parser = sub.add_parser("compare", help="Сравнение двух сохраненных результатов")
+    cmp_parser.add_argument("baseline")
+    cmp_parser.add_argument("current")
+    cmp_parser.add_argument("--threshold", type=float, default=0.15, help="Допустимое замедление (доля)")
+
+    args = parser.parse_args()
+
+    if args.command == "compare":
+        return 1 if compare(load_results(args.baseline), load_results(args.current), args.threshold) else 0
+
+    results = run_suite(args)
+    if args.save:
+        save_results(args.save, results)
+    if args.compare:
+        return 1 if compare(load_results(args.compare), results, args.threshold) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,225 @@
+"""
+Контрольные точки задач конспектирования.
+
+Состояние задачи (индекс глав, снимок конфигурации, готовые конспекты глав
+и чанков) хранится на диске, чтобы после перезапуска backend или повторной
+загрузки того же PDF обработка продолжалась с первой незавершенной главы.
+"""
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+from spool import JsonLinesSequence, write_jsonl
+
+
+# Ключи конфигурации, от которых зависит результат. Если они изменились,
+# сохраненные конспекты больше не соответствуют настройкам и чекпоинт сбрасывается.
+SNAPSHOT_KEYS = (
+    "lm_studio_model", "max_chunk_size", "chunk_overlap", "split_keywords", "fast_mode", "fast_mode_ratio",
+    "model_routes"
+)
+
+
+def file_sha256(path: str) -> str:
+    """Хеш содержимого файла (используется как идентификатор задачи)"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def config_snapshot(config: dict) -> dict:
+    """Снимок значимых для результата параметров конфигурации"""
+    return {key: config.get(key) for key in SNAPSHOT_KEYS}
+
+
+def write_json_atomic(path: Path, data) -> None:
+    """Атомарная запись JSON: временный файл + fsync + замена"""
+    tmp_path = path.with_suffix(path.suffix + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class JobCheckpoint:
+    """Постоянное состояние одной задачи конспектирования"""
+
+    def __init__(self, jobs_dir: Path, job_id: str):
+        self.job_id = job_id
+        self.job_dir = Path(jobs_dir) / job_id
+        self.state_path = self.job_dir / "state.json"
+        self.chapters_path = self.job_dir / "chapters.jsonl"
+        self.state: dict = {}
+        if self.state_path.exists():
+            self.state = json.loads(self.state_path.read_text(encoding="utf-8"))
+
+    @classmethod
+    def for_pdf(cls, jobs_dir: Path, pdf_path: str) -> "JobCheckpoint":
+        """Чекпоинт, идентифицируемый содержимым PDF"""
+        return cls(jobs_dir, file_sha256(pdf_path)[:16])
+
+    def exists(self) -> bool:
+        return bool(self.state) and self.chapters_path.exists()
+
+    def is_compatible(self, config: dict) -> bool:
+        """Совпадает ли снимок конфигурации с текущими настройками"""
+        # Ключи, отсутствующие в старых чекпоинтах, считаются незаданными
+        saved = self.state.get("config") or {}
+        return {key: saved.get(key) for key in SNAPSHOT_KEYS} == config_snapshot(config)
+
+    def create(self, chapters: Sequence[str], config: dict, source_name: str, document_id: Optional[str] = None) -> None:
+        """Создание нового чекпоинта (предыдущее состояние отбрасывается)"""
+        self.job_dir.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.chapters_path.with_suffix(".jsonl.tmp")
+        write_jsonl(tmp_path, chapters)
+        os.replace(tmp_path, self.chapters_path)
+        self.state = {
+            "job_id": self.job_id,
+            "source_name": source_name,
+            "document_id": document_id or self.job_id,
+            "status": "pending",
+            "error_message": None,
+            "config": config_snapshot(config),
+            "total_chapters": len(chapters),
+            "chapter_chars": [len(chapter) for chapter in chapters],
+            "chapter_pages": None,
+            "selected": None,
+            "created_at": time.time(),
+            "updated_at": time.time(),
+            "chapters": {}
+        }
+        self._save()
+
+    def load_chapters(self) -> Sequence[str]:
+        """Индекс глав без повторного извлечения PDF (тексты читаются с диска по требованию)"""
+        return JsonLinesSequence(self.chapters_path)
+
+    def chapter_sizes(self) -> List[int]:
+        """Длины глав в символах (для оценки объема работы)"""
+        sizes = self.state.get("chapter_chars")
+        if sizes is None:
+            # Чекпоинт создан до появления поля
+            sizes = [len(chapter) for chapter in self.load_chapters()]
+            self.state["chapter_chars"] = sizes
+            self._save()
+        return sizes
+
+    def chapter_pages(self) -> Optional[List[list]]:
+        """Страницы [первая, последняя] каждой главы (None, если не вычислялись)"""
+        return self.state.get("chapter_pages")
+
+    def set_chapter_pages(self, pages: List[list]) -> None:
+        self.state["chapter_pages"] = pages
+        self._save()
+
+    def selected_chapters(self) -> List[int]:
+        """Индексы глав, выбранных для конспектирования (по умолчанию все)"""
+        selected = self.state.get("selected")
+        if selected is None:
+            return list(range(self.state.get("total_chapters", 0)))
+        return selected
+
+    def select(self, indices: Optional[List[int]]) -> None:
+        """Выбор глав для конспектирования (None - все главы)"""
+        self.state["selected"] = sorted(set(indices)) if indices is not None else None
+        self._save()
+
+    def scheduling(self) -> tuple:
+        """Приоритет и вес задачи в планировщике запросов к LLM"""
+        return self.state.get("priority", 0), self.state.get("weight", 1.0)
+
+    def set_scheduling(self, priority: int, weight: float) -> None:
+        self.state["priority"] = priority
+        self.state["weight"] = weight
+        self._save()
+
+    @property
+    def status(self) -> Optional[str]:
+        return self.state.get("status")
+
+    def set_status(self, status: str, error_message: Optional[str] = None) -> None:
+        self.state["status"] = status
+        self.state["error_message"] = error_message
+        self._save()
+
+    def _chapter(self, idx: int) -> dict:
+        return self.state["chapters"].setdefault(str(idx), {"chunks": {}})
+
+    def chapter_summary(self, idx: int) -> Optional[str]:
+        """Готовый конспект главы или None, если глава не завершена"""
+        chapter = self.state.get("chapters", {}).get(str(idx))
+        if chapter and chapter.get("done"):
+            return chapter["summary"]
+        return None
+
+    def chunk_summaries(self, idx: int) -> Dict[int, str]:
+        """Готовые конспекты чанков главы"""
+        chapter = self.state.get("chapters", {}).get(str(idx), {})
+        return {int(k): v for k, v in chapter.get("chunks", {}).items()}
+
+    def mark_chunk_done(self, idx: int, chunk_idx: int, total_chunks: int, summary: str) -> None:
+        """Сохранение конспекта чанка сразу после его генерации"""
+        chapter = self._chapter(idx)
+        chapter["chunks_total"] = total_chunks
+        chapter["chunks"][str(chunk_idx)] = summary
+        self._save()
+
+    def is_chapter_complete(self, idx: int) -> bool:
+        """Все ли чанки главы успешно обработаны"""
+        chapter = self.state.get("chapters", {}).get(str(idx), {})
+        total = chapter.get("chunks_total")
+        return total is not None and len(chapter.get("chunks", {})) >= total
+
+    def mark_chapter_done(self, idx: int, summary: str) -> None:
+        """Фиксация главы; промежуточные конспекты чанков больше не нужны"""
+        self.state["chapters"][str(idx)] = {"done": True, "summary": summary}
+        self._save()
+
+    def first_unfinished(self) -> Optional[int]:
+        """Индекс первой незавершенной выбранной главы (None, если все готовы)"""
+        for idx in self.selected_chapters():
+            if self.chapter_summary(idx) is None:
+                return idx
+        return None
+
+    def to_dict(self) -> dict:
+        """Краткая информация о задаче для API"""
+        total = self.state.get("total_chapters", 0)
+        done = sum(1 for idx in range(total) if self.chapter_summary(idx) is not None)
+        return {
+            "job_id": self.job_id,
+            "source_name": self.state.get("source_name"),
+            "status": self.status,
+            "error_message": self.state.get("error_message"),
+            "total_chapters": total,
+            "selected_chapters": len(self.selected_chapters()),
+            "completed_chapters": done,
+            "priority": self.state.get("priority", 0),
+            "weight": self.state.get("weight", 1.0),
+            "updated_at": self.state.get("updated_at")
+        }
+
+    def _save(self) -> None:
+        self.state["updated_at"] = time.time()
+        write_json_atomic(self.state_path, self.state)
+
+
+def list_checkpoints(jobs_dir: Path) -> List[JobCheckpoint]:
+    """Все сохраненные задачи, от самой свежей к самой старой"""
+    jobs_dir = Path(jobs_dir)
+    if not jobs_dir.exists():
+        return []
+    checkpoints = [
+        JobCheckpoint(jobs_dir, path.name)
+        for path in jobs_dir.iterdir()
+        if (path / "state.json").exists()
+    ]
+    checkpoints = [cp for cp in checkpoints if cp.exists()]
+    checkpoints.sort(key=lambda cp: cp.state.get("updated_at", 0), reverse=True)
+    return checkpoints
@@ -0,0 +1,304 @@
+"""
+Конвертация Markdown-конспектов в DOCX без внешних процессов.
+
+Поддерживается подмножество Markdown, которое используют конспекты:
+заголовки, маркированные и нумерованные списки (с вложенностью),
+жирный/курсивный текст, inline-код и горизонтальные линии.
+Готовые документы кешируются по хешу исходного текста.
+"""
+import hashlib
+import os
+import re
+import subprocess
+import uuid
+import zipfile
+from pathlib import Path
+from typing import List, Tuple
+from xml.sax.saxutils import escape
+
+
+# Меняется при изменении формата вывода, чтобы не отдавать устаревший кеш
+RENDERER_VERSION = "1"
+
+# Сколько последних документов хранить в кеше
+CACHE_MAX_FILES = 20
+
+HEADING_RE = re.compile(r'^(#{1,6})\s+(.*?)\s*#*\s*$')
+BULLET_RE = re.compile(r'^(\s*)[-*+]\s+(.*)$')
+NUMBERED_RE = re.compile(r'^(\s*)\d+[.)]\s+(.*)$')
+RULE_RE = re.compile(r'^\s*([-*_])(\s*\1){2,}\s*$')
+INLINE_RE = re.compile(r'(\*\*\*.+?\*\*\*|\*\*.+?\*\*|(?<!\w)__.+?__(?!\w)|\*[^*\s][^*]*?\*|(?<!\w)_[^_\s][^_]*?_(?!\w)|`[^`]+`)')
+
+BULLET_NUM_ID = 1
+MAX_LIST_LEVEL = 8
+
+CONTENT_TYPES_XML = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/word/document.xml" ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>'
+    '<Override PartName="/word/styles.xml" ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.styles+xml"/>'
+    '<Override PartName="/word/numbering.xml" ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.numbering+xml"/>'
+    '</Types>'
+)
+
+ROOT_RELS_XML = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="word/document.xml"/>'
+    '</Relationships>'
+)
+
+DOCUMENT_RELS_XML = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" Target="styles.xml"/>'
+    '<Relationship Id="rId2" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/numbering" Target="numbering.xml"/>'
+    '</Relationships>'
+)
+
+W_NS = 'xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main"'
+
+
+def _styles_xml() -> str:
+    heading_sizes = [32, 28, 26, 24, 22, 22]
+    headings = "".join(
+        f'<w:style w:type="paragraph" w:styleId="Heading{level}">'
+        f'<w:name w:val="heading {level}"/><w:basedOn w:val="Normal"/><w:next w:val="Normal"/><w:qFormat/>'
+        f'<w:pPr><w:keepNext/><w:spacing w:before="240" w:after="120"/><w:outlineLvl w:val="{level - 1}"/></w:pPr>'
+        f'<w:rPr><w:b/><w:sz w:val="{size}"/></w:rPr></w:style>'
+        for level, size in enumerate(heading_sizes, start=1)
+    )
+    return (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        f'<w:styles {W_NS}>'
+        '<w:docDefaults><w:rPrDefault><w:rPr>'
+        '<w:rFonts w:ascii="Calibri" w:hAnsi="Calibri" w:cs="Calibri" w:eastAsia="Calibri"/>'
+        '<w:sz w:val="22"/><w:lang w:val="ru-RU"/></w:rPr></w:rPrDefault>'
+        '<w:pPrDefault><w:pPr><w:spacing w:after="120" w:line="264" w:lineRule="auto"/></w:pPr></w:pPrDefault>'
+        '</w:docDefaults>'
+        '<w:style w:type="paragraph" w:default="1" w:styleId="Normal"><w:name w:val="Normal"/><w:qFormat/></w:style>'
+        f'{headings}'
+        '<w:style w:type="paragraph" w:styleId="ListParagraph"><w:name w:val="List Paragraph"/>'
+        '<w:basedOn w:val="Normal"/><w:pPr><w:spacing w:after="40"/><w:contextualSpacing/></w:pPr></w:style>'
+        '<w:style w:type="character" w:styleId="VerbatimChar"><w:name w:val="Verbatim Char"/>'
+        '<w:rPr><w:rFonts w:ascii="Consolas" w:hAnsi="Consolas"/></w:rPr></w:style>'
+        '</w:styles>'
+    )
+
+
+def _numbering_xml(numbered_lists: int) -> str:
+    bullet_chars = ["•", "◦", "▪"]
+    bullet_levels = "".join(
+        f'<w:lvl w:ilvl="{lvl}"><w:start w:val="1"/><w:numFmt w:val="bullet"/>'
+        f'<w:lvlText w:val="{bullet_chars[lvl % len(bullet_chars)]}"/><w:lvlJc w:val="left"/>'
+        f'<w:pPr><w:ind w:left="{720 * (lvl + 1)}" w:hanging="360"/></w:pPr></w:lvl>'
+        for lvl in range(MAX_LIST_LEVEL + 1)
+    )
+    decimal_levels = "".join(
+        f'<w:lvl w:ilvl="{lvl}"><w:start w:val="1"/><w:numFmt w:val="decimal"/>'
+        f'<w:lvlText w:val="%{lvl + 1}."/><w:lvlJc w:val="left"/>'
+        f'<w:pPr><w:ind w:left="{720 * (lvl + 1)}" w:hanging="360"/></w:pPr></w:lvl>'
+        for lvl in range(MAX_LIST_LEVEL + 1)
+    )
+    # Каждый нумерованный список получает свой экземпляр нумерации, чтобы счет начинался с 1
+    numbered = "".join(
+        f'<w:num w:numId="{BULLET_NUM_ID + 1 + i}"><w:abstractNumId w:val="1"/>'
+        f'<w:lvlOverride w:ilvl="0"><w:startOverride w:val="1"/></w:lvlOverride></w:num>'
+        for i in range(numbered_lists)
+    )
+    return (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        f'<w:numbering {W_NS}>'
+        f'<w:abstractNum w:abstractNumId="0"><w:multiLevelType w:val="hybridMultilevel"/>{bullet_levels}</w:abstractNum>'
+        f'<w:abstractNum w:abstractNumId="1"><w:multiLevelType w:val="hybridMultilevel"/>{decimal_levels}</w:abstractNum>'
+        f'<w:num w:numId="{BULLET_NUM_ID}"><w:abstractNumId w:val="0"/></w:num>'
+        f'{numbered}'
+        '</w:numbering>'
+    )
+
+
+def _run(text: str, bold: bool = False, italic: bool = False, code: bool = False) -> str:
+    props = ""
+    if code:
+        props += '<w:rStyle w:val="VerbatimChar"/>'
+    if bold:
+        props += "<w:b/>"
+    if italic:
+        props += "<w:i/>"
+    rpr = f"<w:rPr>{props}</w:rPr>" if props else ""
+    return f'<w:r>{rpr}<w:t xml:space="preserve">{escape(text)}</w:t></w:r>'
+
+
+def render_inline(text: str) -> str:
+    """Разметка строки с выделением жирным, курсивом и кодом"""
+    runs = []
+    for part in INLINE_RE.split(text):
+        if not part:
+            continue
+        if part.startswith("***") and part.endswith("***") and len(part) > 6:
+            runs.append(_run(part[3:-3], bold=True, italic=True))
+        elif (part.startswith("**") and part.endswith("**") or
+              part.startswith("__") and part.endswith("__")) and len(part) > 4:
+            runs.append(_run(part[2:-2], bold=True))
+        elif part.startswith("`") and part.endswith("`") and len(part) > 2:
+            runs.append(_run(part[1:-1], code=True))
+        elif part[0] in "*_" and part[-1] == part[0] and len(part) > 2:
+            runs.append(_run(part[1:-1], italic=True))
+        else:
+            runs.append(_run(part))
+    return "".join(runs)
+
+
+def _paragraph(content: str, style: str = "", num: Tuple[int, int] = None) -> str:
+    ppr = ""
+    if style:
+        ppr += f'<w:pStyle w:val="{style}"/>'
+    if num:
+        num_id, level = num
+        ppr += f'<w:numPr><w:ilvl w:val="{level}"/><w:numId w:val="{num_id}"/></w:numPr>'
+    ppr = f"<w:pPr>{ppr}</w:pPr>" if ppr else ""
+    return f"<w:p>{ppr}{content}</w:p>"
+
+
+def _list_level(indent: str) -> int:
+    width = len(indent.replace("\t", "    "))
+    return min(width // 2, MAX_LIST_LEVEL)
+
+
+def markdown_to_document_xml(markdown: str) -> Tuple[str, int]:
+    """
+    Преобразование Markdown в word/document.xml
+
+    Returns:
+        XML документа и количество нумерованных списков
+    """
+    body: List[str] = []
+    paragraph: List[str] = []
+    numbered_lists = 0
+    current_numbered = None  # numId текущего нумерованного списка
+
+    def flush_paragraph():
+        if paragraph:
+            body.append(_paragraph(render_inline(" ".join(paragraph))))
+            paragraph.clear()
+
+    for line in markdown.splitlines():
+        if not line.strip():
+            flush_paragraph()
+            continue
+
+        heading = HEADING_RE.match(line)
+        bullet = BULLET_RE.match(line)
+        numbered = NUMBERED_RE.match(line)
+
+        if heading:
+            flush_paragraph()
+            current_numbered = None
+            level = len(heading.group(1))
+            body.append(_paragraph(render_inline(heading.group(2)), style=f"Heading{level}"))
+        elif RULE_RE.match(line):
+            flush_paragraph()
+            current_numbered = None
+            body.append('<w:p><w:pPr><w:pBdr><w:bottom w:val="single" w:sz="6" w:space="1" w:color="auto"/></w:pBdr></w:pPr></w:p>')
+        elif bullet:
+            flush_paragraph()
+            level = _list_level(bullet.group(1))
+            if level == 0:
+                current_numbered = None
+            body.append(_paragraph(render_inline(bullet.group(2)), "ListParagraph", (BULLET_NUM_ID, level)))
+        elif numbered:
+            flush_paragraph()
+            level = _list_level(numbered.group(1))
+            if current_numbered is None:
+                numbered_lists += 1
+                current_numbered = BULLET_NUM_ID + numbered_lists
+            body.append(_paragraph(render_inline(numbered.group(2)), "ListParagraph", (current_numbered, level)))
+        else:
+            paragraph.append(line.strip())
+
+    flush_paragraph()
+
+    document = (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        f'<w:document {W_NS}><w:body>'
+        + "".join(body) +
+        '<w:sectPr><w:pgSz w:w="11906" w:h="16838"/>'
+        '<w:pgMar w:top="1134" w:right="850" w:bottom="1134" w:left="1701" w:header="708" w:footer="708" w:gutter="0"/>'
+        '</w:sectPr></w:body></w:document>'
+    )
+    return document, numbered_lists
+
+
+def render_docx(markdown: str, docx_path: str) -> None:
+    """Запись Markdown-текста в файл DOCX"""
+    document_xml, numbered_lists = markdown_to_document_xml(markdown)
+    with zipfile.ZipFile(docx_path, "w", zipfile.ZIP_DEFLATED) as docx:
+        docx.writestr("[Content_Types].xml", CONTENT_TYPES_XML)
+        docx.writestr("_rels/.rels", ROOT_RELS_XML)
+        docx.writestr("word/_rels/document.xml.rels", DOCUMENT_RELS_XML)
+        docx.writestr("word/document.xml", document_xml)
+        docx.writestr("word/styles.xml", _styles_xml())
+        docx.writestr("word/numbering.xml", _numbering_xml(numbered_lists))
+
+
+class PandocNotFoundError(Exception):
+    """Pandoc не установлен (нет исполняемого файла в PATH)"""
+
+
+def render_docx_pandoc(md_path: str, docx_path: str) -> None:
+    """Конвертация через Pandoc (исключения subprocess пробрасываются вызывающему)"""
+    try:
+        subprocess.run(
+            ["pandoc", str(md_path), "-o", str(docx_path)],
+            check=True,
+            capture_output=True,
+            text=True
+        )
+    except FileNotFoundError as e:
+        # FileNotFoundError здесь - только отсутствие самого pandoc, а не входного файла
+        raise PandocNotFoundError("Pandoc не установлен") from e
+
+
+def render_docx_cached(md_path: Path, cache_dir: Path, backend: str = "native") -> Path:
+    """
+    Конвертация с кешированием результата по хешу Markdown
+
+    Args:
+        md_path: Путь к Markdown-файлу
+        cache_dir: Каталог кеша готовых документов
+        backend: "native" (встроенный рендерер) или "pandoc"
+
+    Returns:
+        Путь к готовому DOCX в кеше
+    """
+    data = Path(md_path).read_bytes()
+    key = hashlib.sha256(data + f"\0{backend}\0{RENDERER_VERSION}".encode()).hexdigest()
+    cache_dir = Path(cache_dir)
+    cached = cache_dir / f"{key}.docx"
+    if cached.exists():
+        return cached
+
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    # Уникальное имя: один документ могут одновременно конвертировать несколько потоков
+    tmp_path = cache_dir / f"{key}.{uuid.uuid4().hex}.tmp.docx"
+    try:
+        if backend == "pandoc":
+            render_docx_pandoc(str(md_path), str(tmp_path))
+        else:
+            render_docx(data.decode("utf-8"), str(tmp_path))
+        os.replace(tmp_path, cached)
+    finally:
+        if tmp_path.exists():
+            tmp_path.unlink()
+    prune_cache(cache_dir)
+    return cached
+
+
+def prune_cache(cache_dir: Path, keep: int = CACHE_MAX_FILES) -> None:
+    """Удаление самых старых документов из кеша"""
+    files = sorted(Path(cache_dir).glob("*.docx"), key=lambda p: p.stat().st_mtime, reverse=True)
+    for path in files[keep:]:
+        if not path.name.endswith(".tmp.docx"):
+            path.unlink(missing_ok=True)
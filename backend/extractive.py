@@ -0,0 +1,148 @@
+"""
+Экстрактивное сжатие текста перед отправкой в LLM (быстрый режим).
+
+Предложения главы ранжируются TextRank по косинусной близости TF-IDF векторов
+(вычисления векторизованы NumPy), в текст остаются лучшие предложения в
+исходном порядке, пока не набрана заданная доля исходного объема.
+"""
+import re
+import time
+from typing import List, Optional
+
+from sentences import sentence_index
+from throughput import ThroughputTracker, estimate_tokens
+
+try:
+    import numpy as np
+except ImportError:  # быстрый режим необязателен
+    np = None
+
+
+WORD = re.compile(r'[a-zа-яё]{3,}')
+
+# Длина основы слова: грубая замена стемминга, склеивает падежные формы
+STEM_LENGTH = 6
+
+# Предложений в одном блоке ранжирования: ограничивает матрицу близости
+BLOCK_SENTENCES = 400
+
+DAMPING = 0.85
+MAX_ITERATIONS = 50
+TOLERANCE = 1e-6
+
+
+def compression_available() -> bool:
+    return np is not None
+
+
+def split_sentences(text: str) -> List[str]:
+    """Предложения текста по тем же границам, что и нарезка на чанки (сокращения, переносы)"""
+    index = sentence_index(text)
+    return [index.text[start:end] for start, end in index.spans()]
+
+
+def _term_matrix(sentences: List[str]):
+    """Нормированная TF-IDF матрица предложений (строки единичной длины)"""
+    vocabulary = {}
+    rows, cols = [], []
+    for row, sentence in enumerate(sentences):
+        for word in WORD.findall(sentence.lower()):
+            rows.append(row)
+            cols.append(vocabulary.setdefault(word[:STEM_LENGTH], len(vocabulary)))
+    matrix = np.zeros((len(sentences), max(1, len(vocabulary))), dtype=np.float32)
+    if rows:
+        np.add.at(matrix, (np.array(rows), np.array(cols)), 1.0)
+    df = np.count_nonzero(matrix, axis=0)
+    idf = np.log((1 + len(sentences)) / (1 + df)) + 1
+    matrix = np.log1p(matrix) * idf
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return matrix / norms
+
+
+def textrank_scores(sentences: List[str]):
+    """Важность предложений: PageRank на графе косинусной близости"""
+    n = len(sentences)
+    if n <= 2:
+        return np.ones(n, dtype=np.float32)
+    matrix = _term_matrix(sentences)
+    similarity = matrix @ matrix.T
+    np.fill_diagonal(similarity, 0)
+    out_weight = similarity.sum(axis=1, keepdims=True)
+    # Изолированные предложения равномерно "раздают" вес всем остальным
+    transition = np.where(out_weight > 0, similarity / np.where(out_weight > 0, out_weight, 1), 1.0 / n)
+    scores = np.full(n, 1.0 / n, dtype=np.float32)
+    for _ in range(MAX_ITERATIONS):
+        updated = (1 - DAMPING) / n + DAMPING * (transition.T @ scores)
+        if np.abs(updated - scores).sum() < TOLERANCE:
+            scores = updated
+            break
+        scores = updated
+    return scores
+
+
+def _select(sentences: List[str], ratio: float) -> List[str]:
+    scores = textrank_scores(sentences)
+    budget = ratio * sum(len(s) for s in sentences)
+    keep, used = [], 0
+    for idx in np.argsort(-scores, kind="stable"):
+        if used >= budget:
+            break
+        keep.append(int(idx))
+        used += len(sentences[idx])
+    return [sentences[idx] for idx in sorted(keep)]
+
+
+def compress_text(text: str, ratio: float, min_chars: int = 2000) -> str:
+    """
+    Экстрактивное сжатие текста до доли ratio от исходного объема
+
+    Args:
+        text: Исходный текст главы
+        ratio: Целевая доля объема (0..1)
+        min_chars: Более короткие тексты не сжимаются
+
+    Returns:
+        Текст из лучших предложений в исходном порядке
+    """
+    if np is None or ratio >= 1 or len(text) < min_chars:
+        return text
+    sentences = split_sentences(text)
+    if len(sentences) < 3:
+        return text
+    # Блоки ранжируются отдельно: память ограничена, сжатие равномерно по главе
+    selected = []
+    for start in range(0, len(sentences), BLOCK_SENTENCES):
+        selected.extend(_select(sentences[start:start + BLOCK_SENTENCES], ratio))
+    return "\n".join(selected)
+
+
+class CompressionStats:
+    """Сводка сжатия за задачу"""
+
+    def __init__(self, ratio: float):
+        self.ratio = ratio
+        self.chars_in = 0
+        self.chars_out = 0
+        self.seconds = 0.0
+
+    def compress(self, text: str) -> str:
+        started = time.perf_counter()
+        result = compress_text(text, self.ratio)
+        self.seconds += time.perf_counter() - started
+        self.chars_in += len(text)
+        self.chars_out += len(result)
+        return result
+
+    def to_dict(self, chars_per_token: float, throughput: Optional[ThroughputTracker] = None) -> dict:
+        tokens_saved = estimate_tokens(self.chars_in - self.chars_out, chars_per_token)
+        # Сэкономленное время - то, сколько заняли бы выброшенные токены при измеренной скорости
+        seconds_saved = throughput.eta_seconds(tokens_saved) if throughput is not None else None
+        return {
+            "ratio": self.ratio,
+            "chars_in": self.chars_in,
+            "chars_out": self.chars_out,
+            "tokens_saved": tokens_saved,
+            "compress_seconds": round(self.seconds, 2),
+            "estimated_seconds_saved": round(seconds_saved) if seconds_saved is not None else None
+        }
@@ -0,0 +1,127 @@
+"""
+Поиск заголовков глав за один проход по тексту.
+
+Заголовок - строка, которая после отступа начинается с необязательного номера
+("1.", "2 -") и ключевого слова из split_keywords (без учета регистра) или
+с Markdown-заголовка ("# ", "## ", "### ").
+
+Ключевые слова собираются в префиксное дерево, и все они проверяются
+одновременно (Aho-Corasick без переходов по неудаче: заголовок всегда
+начинается в начале строки). Дерево компилируется в одно регулярное выражение
+без lookahead и без флага IGNORECASE (регистр раскрыт в классы символов), которое
+начинается с литерала перевода строки: движок перескакивает от строки к строке,
+а строки, первый символ которых не может начать заголовок, отбрасывает сразу.
+Детектор компилируется один раз на набор ключевых слов и кешируется.
+"""
+import re
+import statistics
+from functools import lru_cache
+from typing import Iterable, List, Set, Tuple
+
+# Ключ окончания слова в узле префиксного дерева
+END = ""
+
+# Номер перед ключевым словом и Markdown-заголовок - как в прежнем регулярном выражении
+NUMBER = r"(?:\d+[.\s-]*)?"
+MARKDOWN = r"#{1,3}\s"
+
+# Строки-заголовки по оформлению: крупнее основного текста во столько раз
+FONT_SIZE_RATIO = 1.2
+FONT_HEADING_MAX_CHARS = 120
+
+
+def _char_class(ch: str) -> str:
+    lower, upper = ch.lower(), ch.upper()
+    if lower == upper or len(upper) != 1:
+        return re.escape(ch)
+    return f"[{re.escape(lower)}{re.escape(upper)}]"
+
+
+def _trie_pattern(node: dict) -> str:
+    """Регулярное выражение из префиксного дерева: общие префиксы проверяются один раз"""
+    if END in node:
+        # Совпадение по префиксу: более длинные слова с тем же началом не нужны
+        return ""
+    branches = [_char_class(ch) + _trie_pattern(child) for ch, child in sorted(node.items())]
+    return branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+
+
+class HeadingDetector:
+    """Поиск строк-заголовков по ключевым словам, нумерации и Markdown"""
+
+    def __init__(self, keywords: Tuple[str, ...]):
+        self.keywords = keywords
+        trie: dict = {}
+        for keyword in keywords:
+            if not keyword:
+                continue
+            node = trie
+            for ch in keyword.lower():
+                node = node.setdefault(ch, {})
+            node[END] = True
+        heading = f"{NUMBER}(?:{_trie_pattern(trie)}|{MARKDOWN})" if trie else f"{NUMBER}{MARKDOWN}"
+        # Первые символы, с которых может начаться заголовок: цифра номера, '#' или начало ключевого слова
+        first_chars = {"#"} | {ch for keyword in keywords if keyword for ch in (keyword[0].lower(), keyword[0].upper())}
+        guard = r"(?=[\d" + "".join(re.escape(ch) for ch in sorted(first_chars)) + "])"
+        self._split_pattern = re.compile(r"\n[^\S\n]*" + guard + heading)
+        self._line_pattern = re.compile(r"\s*" + heading)
+
+    def is_heading_line(self, line: str) -> bool:
+        """Является ли строка (с отступом) заголовком"""
+        return self._line_pattern.match(line) is not None
+
+    def split_points(self, text: str) -> List[int]:
+        """Смещения начала строк-заголовков (кроме первой строки текста)"""
+        return [match.start() + 1 for match in self._split_pattern.finditer(text)]
+
+    def split(self, text: str) -> List[str]:
+        """Нарезка текста перед каждой строкой-заголовком"""
+        bounds = [0, *self.split_points(text), len(text)]
+        return [text[start:end] for start, end in zip(bounds, bounds[1:])]
+
+
+@lru_cache(maxsize=32)
+def _compiled(keywords: Tuple[str, ...]) -> HeadingDetector:
+    return HeadingDetector(keywords)
+
+
+def heading_detector(keywords: Iterable[str]) -> HeadingDetector:
+    """Детектор для набора ключевых слов (компилируется один раз на набор)"""
+    return _compiled(tuple(keywords))
+
+
+def font_heading_lines(page) -> Set[str]:
+    """
+    Строки страницы pdfplumber, выделенные оформлением: шрифт крупнее
+    основного текста или полужирный (если основной текст не полужирный)
+    """
+    lines = page.extract_text_lines(return_chars=True)
+    chars = [ch for line in lines for ch in line["chars"] if not ch["text"].isspace()]
+    if not chars:
+        return set()
+    body_size = statistics.median(ch["size"] for ch in chars)
+    body_bold = sum("bold" in ch["fontname"].lower() for ch in chars) > len(chars) / 2
+    headings = set()
+    for line in lines:
+        text = line["text"].strip()
+        line_chars = [ch for ch in line["chars"] if not ch["text"].isspace()]
+        # Номера страниц и колонтитулы из одних цифр заголовками не считаются
+        if not line_chars or len(text) > FONT_HEADING_MAX_CHARS or not any(ch.isalpha() for ch in text):
+            continue
+        size = statistics.median(ch["size"] for ch in line_chars)
+        bold = all("bold" in ch["fontname"].lower() for ch in line_chars)
+        if size >= body_size * FONT_SIZE_RATIO or (bold and not body_bold):
+            headings.add(text)
+    return headings
+
+
+def mark_font_headings(page_text: str, headings: Set[str], detector: HeadingDetector) -> str:
+    """Пометка строк-заголовков Markdown-префиксом "## ", чтобы по ним резались главы"""
+    if not headings:
+        return page_text
+    lines = page_text.split("\n")
+    for idx, line in enumerate(lines):
+        stripped = line.strip()
+        if stripped in headings and not detector.is_heading_line(stripped):
+            lines[idx] = "## " + stripped
+    return "\n".join(lines)
@@ -0,0 +1,137 @@
+"""
+Фоновый мониторинг LLM-сервера.
+
+Монитор периодически опрашивает /v1/models и кеширует доступность сервера,
+список моделей и длину контекста. Обработчики API читают кеш и не выполняют
+сетевых запросов в event loop.
+"""
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+import requests
+
+
+class LLMHealthMonitor:
+    """Кешированное состояние LLM-сервера с периодическим обновлением"""
+
+    def __init__(self, config: dict, interval: Optional[float] = None, timeout: float = 2.0):
+        # Ссылка на общий словарь конфигурации: изменения через /config подхватываются сразу
+        self.config = config
+        self.interval = interval
+        self.timeout = timeout
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="llm-health")
+        self.snapshot = {
+            "available": False,
+            "model_loaded": False,
+            "models": [],
+            "context_length": None,
+            "latency_ms": None,
+            "error": "Проверка еще не выполнялась",
+            "checked_at": None
+        }
+        self._task: Optional[asyncio.Task] = None
+        self._lock: Optional[asyncio.Lock] = None  # создается внутри работающего event loop
+
+    @property
+    def base_url(self) -> str:
+        return self.config.get("lm_studio_url", "http://localhost:1234").rstrip("/")
+
+    def _get_json(self, path: str) -> Optional[dict]:
+        try:
+            response = requests.get(f"{self.base_url}{path}", timeout=self.timeout)
+        except requests.exceptions.RequestException:
+            return None
+        if response.status_code != 200:
+            return None
+        try:
+            return response.json()
+        except ValueError:
+            return None
+
+    def _context_length(self, model_name: str) -> Optional[int]:
+        """Длина контекста из расширенного API LM Studio или /props llama.cpp"""
+        data = self._get_json("/api/v0/models")
+        if data:
+            loaded = [m for m in data.get("data", []) if m.get("state") == "loaded"]
+            for model in loaded:
+                if model.get("id") == model_name or len(loaded) == 1:
+                    return model.get("loaded_context_length") or model.get("max_context_length")
+        props = self._get_json("/props")
+        if props:
+            settings = props.get("default_generation_settings", {})
+            return settings.get("n_ctx") or props.get("n_ctx")
+        return None
+
+    def probe(self) -> dict:
+        """Синхронная проверка сервера (выполняется в пуле потоков)"""
+        started = time.time()
+        model_name = self.config.get("lm_studio_model", "local-model")
+        snapshot = {
+            "available": False,
+            "model_loaded": False,
+            "models": [],
+            "context_length": None,
+            "latency_ms": None,
+            "error": None,
+            "checked_at": started
+        }
+        try:
+            response = requests.get(f"{self.base_url}/v1/models", timeout=self.timeout)
+        except requests.exceptions.RequestException:
+            snapshot["error"] = f"LLM-сервер не отвечает по адресу {self.base_url}"
+            return snapshot
+
+        snapshot["latency_ms"] = round((time.time() - started) * 1000, 1)
+        if response.status_code != 200:
+            snapshot["error"] = f"/v1/models вернул {response.status_code}"
+            return snapshot
+
+        snapshot["available"] = True
+        try:
+            models = [m.get("id") for m in response.json().get("data", [])]
+        except ValueError:
+            models = []
+        snapshot["models"] = models
+        # "local-model" - значение по умолчанию: подходит любая загруженная модель
+        snapshot["model_loaded"] = bool(models) and (model_name == "local-model" or model_name in models)
+        if not snapshot["model_loaded"]:
+            snapshot["error"] = "Модель не загружена" if not models else f"Модель {model_name} не загружена"
+        else:
+            snapshot["context_length"] = self._context_length(model_name)
+        return snapshot
+
+    async def refresh(self) -> dict:
+        """Немедленное обновление кеша без блокировки event loop"""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            loop = asyncio.get_event_loop()
+            self.snapshot = await loop.run_in_executor(self.executor, self.probe)
+        return self.snapshot
+
+    @property
+    def ready(self) -> bool:
+        return self.snapshot["available"] and self.snapshot["model_loaded"]
+
+    async def _run(self):
+        while True:
+            try:
+                await self.refresh()
+            except Exception as e:
+                self.snapshot = {**self.snapshot, "available": False, "error": str(e), "checked_at": time.time()}
+            await asyncio.sleep(self.interval or self.config.get("health_check_interval", 5))
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
@@ -0,0 +1,527 @@
+"""
+Библиотека документов в SQLite.
+
+Хранит документы (по хешу содержимого), извлеченный текст страниц, индекс
+глав каждого запуска, конспекты глав и чанков и метаданные задач. Повторная
+обработка того же PDF берет текст страниц из базы без извлечения, а главы с
+тем же текстом и настройками генерации получают готовый конспект из кеша.
+"""
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Iterable, Iterator, List, Optional, Set
+
+from search import match_query, split_passages
+
+
+# Параметры, от которых зависит конспект главы (ключ кеша конспектов)
+SUMMARY_KEYS = ("lm_studio_model", "max_chunk_size", "fast_mode", "fast_mode_ratio")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    id TEXT PRIMARY KEY,
+    source_name TEXT NOT NULL,
+    size_bytes INTEGER,
+    page_count INTEGER,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS documents_updated ON documents(updated_at);
+
+CREATE TABLE IF NOT EXISTS pages (
+    document_id TEXT NOT NULL REFERENCES documents(id) ON DELETE CASCADE,
+    page_no INTEGER NOT NULL,
+    text TEXT NOT NULL,
+    PRIMARY KEY (document_id, page_no)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    job_id TEXT NOT NULL,
+    document_id TEXT NOT NULL REFERENCES documents(id) ON DELETE CASCADE,
+    config TEXT NOT NULL,
+    status TEXT NOT NULL,
+    error_message TEXT,
+    total_chapters INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS runs_job ON runs(job_id, id);
+CREATE INDEX IF NOT EXISTS runs_document ON runs(document_id, id);
+CREATE INDEX IF NOT EXISTS runs_status ON runs(status);
+
+CREATE TABLE IF NOT EXISTS chapters (
+    id INTEGER PRIMARY KEY,
+    run_id INTEGER NOT NULL REFERENCES runs(id) ON DELETE CASCADE,
+    idx INTEGER NOT NULL,
+    title TEXT NOT NULL,
+    chars INTEGER NOT NULL,
+    text_hash TEXT NOT NULL,
+    summary TEXT,
+    UNIQUE (run_id, idx)
+);
+CREATE INDEX IF NOT EXISTS chapters_hash ON chapters(text_hash);
+
+CREATE TABLE IF NOT EXISTS chunk_summaries (
+    run_id INTEGER NOT NULL REFERENCES runs(id) ON DELETE CASCADE,
+    chapter_idx INTEGER NOT NULL,
+    chunk_idx INTEGER NOT NULL,
+    summary TEXT NOT NULL,
+    PRIMARY KEY (run_id, chapter_idx, chunk_idx)
+) WITHOUT ROWID;
+
+-- Исходный текст глав последнего запуска документа фрагментами по PASSAGE_CHARS (поиск по тексту);
+-- id фрагментов одной главы идут подряд
+CREATE TABLE IF NOT EXISTS source_passages (
+    id INTEGER PRIMARY KEY,
+    chapter_id INTEGER NOT NULL REFERENCES chapters(id) ON DELETE CASCADE,
+    text TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS source_passages_chapter ON source_passages(chapter_id, id);
+
+-- Содержимое индекса глав: заголовок, конспект и исходный текст глав последнего запуска документа
+CREATE VIEW IF NOT EXISTS chapter_texts AS
+    SELECT c.id AS id, c.title AS title, COALESCE(c.summary, '') AS body,
+           COALESCE((SELECT group_concat(text, char(10)) FROM (
+               SELECT text FROM source_passages p WHERE p.chapter_id = c.id ORDER BY p.id)), '') AS source
+    FROM chapters c JOIN runs r ON r.id = c.run_id
+    WHERE r.id = (SELECT MAX(id) FROM runs WHERE document_id = r.document_id);
+
+CREATE TABLE IF NOT EXISTS summary_cache (
+    text_hash TEXT NOT NULL,
+    settings_hash TEXT NOT NULL,
+    summary TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (text_hash, settings_hash)
+) WITHOUT ROWID;
+"""
+
+# Полнотекстовые индексы (external content: текст хранится один раз, в chapters и source_passages).
+# chapter_search - главы последних запусков документов (представление chapter_texts): по нему
+# ищутся и ранжируются главы, rowid совпадает с chapters.id. passage_search - фрагменты исходного
+# текста: из лучшего фрагмента главы snippet() строит цитату, не разбирая всю главу.
+# Записи индексов меняются командами 'delete' (прежние значения из содержимого) и вставкой новых.
+SEARCH_SCHEMA = """
+CREATE VIRTUAL TABLE chapter_search USING fts5(
+    title, body, source,
+    content = 'chapter_texts', content_rowid = 'id',
+    tokenize = 'unicode61 remove_diacritics 2'
+);
+CREATE VIRTUAL TABLE passage_search USING fts5(
+    text,
+    content = 'source_passages', content_rowid = 'id',
+    tokenize = 'unicode61 remove_diacritics 2'
+);
+"""
+
+# Веса совпадений (bm25): заголовок главы, текст конспекта, исходный текст главы.
+# Исходный текст длинный и совпадает чаще, поэтому его совпадения весят меньше конспекта
+TITLE_WEIGHT = 5.0
+SUMMARY_WEIGHT = 1.0
+SOURCE_WEIGHT = 0.5
+
+# Где искать: столбцы индекса для каждой области поиска
+SEARCH_SCOPES = {
+    "all": ("title", "body", "source"),
+    "summary": ("title", "body"),
+    "source": ("title", "source"),
+}
+
+# Фрагмент snippet(): слов во фрагменте и временные метки совпадений (в ответе - **жирный**)
+SNIPPET_TOKENS = 30
+
+# Страниц за один запрос при чтении текста документа
+PAGE_BATCH = 200
+MATCH_OPEN, MATCH_CLOSE = "\x02", "\x03"
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def settings_hash(config: dict) -> str:
+    """Хеш параметров генерации, влияющих на конспект"""
+    settings = {key: config.get(key) for key in SUMMARY_KEYS}
+    # Перекрытие чанков и маршруты моделей меняют конспекты; без них хеш остается прежним
+    if config.get("chunk_overlap"):
+        settings["chunk_overlap"] = config["chunk_overlap"]
+    if config.get("model_routes"):
+        settings["model_routes"] = config["model_routes"]
+    return hashlib.sha256(json.dumps(settings, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+
+def chapter_title(text: str, limit: int = 120) -> str:
+    """Первая непустая строка главы"""
+    for line in text.splitlines():
+        line = line.strip()
+        if line:
+            return line[:limit]
+    return ""
+
+
+class Library:
+    """Хранилище документов, глав и конспектов"""
+
+    def __init__(self, db_path: Path):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        # Соединение общее для event loop и пула потоков извлечения; доступ под блокировкой
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.RLock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute("PRAGMA foreign_keys=ON")
+            self._conn.executescript(SCHEMA)
+            has_search = self._conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE name = 'passage_search'"
+            ).fetchone()
+            if not has_search:
+                # Индекс прежней версии (основы слов в самом индексе) пересоздается
+                self._conn.execute("DROP TABLE IF EXISTS chapter_search")
+                self._migrate_chapter_sources()
+                self._conn.executescript(SEARCH_SCHEMA)
+                self.rebuild_search_index()
+
+    def _migrate_chapter_sources(self) -> None:
+        """Исходный текст глав из таблицы прежней версии (глава целиком) переносится фрагментами"""
+        if not self._conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'chapter_sources'").fetchone():
+            return
+        with self._conn:
+            for row in self._conn.execute("SELECT chapter_id, text FROM chapter_sources"):
+                self._add_passages(row["chapter_id"], row["text"])
+            self._conn.execute("DROP TABLE chapter_sources")
+
+    def _add_passages(self, chapter_id: int, text: str) -> None:
+        self._conn.executemany(
+            "INSERT INTO source_passages (chapter_id, text) VALUES (?, ?)",
+            [(chapter_id, passage) for passage in split_passages(text)]
+        )
+
+    def _execute(self, sql: str, params=()) -> sqlite3.Cursor:
+        with self._lock, self._conn:
+            return self._conn.execute(sql, params)
+
+    def _query(self, sql: str, params=()) -> List[dict]:
+        with self._lock:
+            return [dict(row) for row in self._conn.execute(sql, params).fetchall()]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    # Документы и страницы
+
+    def add_document(self, document_id: str, source_name: str, size_bytes: Optional[int] = None) -> None:
+        now = time.time()
+        self._execute(
+            """INSERT INTO documents (id, source_name, size_bytes, created_at, updated_at)
+               VALUES (?, ?, ?, ?, ?)
+               ON CONFLICT(id) DO UPDATE SET source_name = excluded.source_name, updated_at = excluded.updated_at""",
+            (document_id, source_name, size_bytes, now, now)
+        )
+
+    def save_page(self, document_id: str, page_no: int, text: str) -> None:
+        """Запись страницы без фиксации транзакции (фиксируется в finish_pages)"""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO pages (document_id, page_no, text) VALUES (?, ?, ?)",
+                (document_id, page_no, text)
+            )
+
+    def finish_pages(self, document_id: str) -> None:
+        """Фиксация извлеченных страниц; с этого момента текст документа переиспользуется"""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE documents SET page_count = (SELECT COUNT(*) FROM pages WHERE document_id = ?) WHERE id = ?",
+                (document_id, document_id)
+            )
+
+    def discard_pages(self, document_id: str) -> None:
+        with self._lock:
+            self._conn.rollback()
+        self._execute("DELETE FROM pages WHERE document_id = ?", (document_id,))
+
+    def has_pages(self, document_id: str) -> bool:
+        rows = self._query("SELECT page_count FROM documents WHERE id = ?", (document_id,))
+        return bool(rows) and rows[0]["page_count"] is not None
+
+    def iter_pages(self, document_id: str) -> Iterator[str]:
+        """
+        Текст страниц документа по порядку
+
+        Страницы читаются порциями по PAGE_BATCH: в памяти не вся книга, а
+        блокировка не удерживается, пока вызывающий код обрабатывает страницы.
+        """
+        last_page = -1
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT page_no, text FROM pages WHERE document_id = ? AND page_no > ? ORDER BY page_no LIMIT ?",
+                    (document_id, last_page, PAGE_BATCH)
+                ).fetchall()
+            for row in rows:
+                yield row["text"]
+            if len(rows) < PAGE_BATCH:
+                return
+            last_page = rows[-1]["page_no"]
+
+    # Запуски (задачи) и главы
+
+    def start_run(self, job_id: str, document_id: str, config: dict, chapters: Iterable[str]) -> int:
+        """
+        Новый запуск обработки документа с индексом глав
+
+        Главы записываются по мере чтения из chapters (в режиме экономии памяти
+        это файл на диске), исходный текст сразу попадает в поиск; индексация
+        всей книги - вызывающий код выполняет метод вне event loop.
+        """
+        now = time.time()
+        with self._lock, self._conn:
+            # В поиске остается только новый запуск документа: прежний последний запуск
+            # удаляется из индексов, пока его главы еще видны в chapter_texts
+            previous = self._conn.execute(
+                "SELECT MAX(id) AS id FROM runs WHERE document_id = ?", (document_id,)
+            ).fetchone()["id"]
+            if previous is not None:
+                self._unindex_run(previous)
+            cursor = self._conn.execute(
+                """INSERT INTO runs (job_id, document_id, config, status, total_chapters, created_at, updated_at)
+                   VALUES (?, ?, ?, 'pending', 0, ?, ?)""",
+                (job_id, document_id, json.dumps(config, ensure_ascii=False), now, now)
+            )
+            run_id = cursor.lastrowid
+            total = 0
+            for idx, text in enumerate(chapters):
+                chapter_id = self._conn.execute(
+                    "INSERT INTO chapters (run_id, idx, title, chars, text_hash) VALUES (?, ?, ?, ?, ?)",
+                    (run_id, idx, chapter_title(text), len(text), text_hash(text))
+                ).lastrowid
+                self._add_passages(chapter_id, text)
+                self._index_chapter_source(chapter_id)
+                total = idx + 1
+            self._conn.execute("UPDATE runs SET total_chapters = ? WHERE id = ?", (total, run_id))
+        return run_id
+
+    def _index_chapter_source(self, chapter_id: int) -> None:
+        """Новая глава последнего запуска и ее фрагменты текста в индексах (внутри транзакции)"""
+        self._conn.execute(
+            "INSERT INTO chapter_search (rowid, title, body, source) SELECT id, title, body, source FROM chapter_texts WHERE id = ?",
+            (chapter_id,)
+        )
+        self._conn.execute(
+            "INSERT INTO passage_search (rowid, text) SELECT id, text FROM source_passages WHERE chapter_id = ?",
+            (chapter_id,)
+        )
+
+    def _unindex_run(self, run_id: int) -> None:
+        """Удаление запуска из индексов и его фрагментов текста (внутри транзакции)"""
+        self._conn.execute(
+            """INSERT INTO chapter_search (chapter_search, rowid, title, body, source)
+               SELECT 'delete', id, title, body, source FROM chapter_texts
+               WHERE id IN (SELECT id FROM chapters WHERE run_id = ?)""",
+            (run_id,)
+        )
+        passages = "SELECT p.id FROM source_passages p JOIN chapters c ON c.id = p.chapter_id WHERE c.run_id = ?"
+        self._conn.execute(
+            f"""INSERT INTO passage_search (passage_search, rowid, text)
+                SELECT 'delete', id, text FROM source_passages WHERE id IN ({passages})""",
+            (run_id,)
+        )
+        self._conn.execute(f"DELETE FROM source_passages WHERE id IN ({passages})", (run_id,))
+
+    def latest_run(self, job_id: str) -> Optional[dict]:
+        rows = self._query("SELECT * FROM runs WHERE job_id = ? ORDER BY id DESC LIMIT 1", (job_id,))
+        return rows[0] if rows else None
+
+    def set_run_status(self, run_id: int, status: str, error_message: Optional[str] = None) -> None:
+        self._execute(
+            "UPDATE runs SET status = ?, error_message = ?, updated_at = ? WHERE id = ?",
+            (status, error_message, time.time(), run_id)
+        )
+
+    def save_chunk_summary(self, run_id: int, chapter_idx: int, chunk_idx: int, summary: str) -> None:
+        self._execute(
+            "INSERT OR REPLACE INTO chunk_summaries (run_id, chapter_idx, chunk_idx, summary) VALUES (?, ?, ?, ?)",
+            (run_id, chapter_idx, chunk_idx, summary)
+        )
+
+    def save_chapter_summary(self, run_id: int, idx: int, chapter_text: str, summary: str, settings: str) -> None:
+        """Конспект главы запуска; он же попадает в кеш для глав с тем же текстом"""
+        with self._lock, self._conn:
+            self._index_chapter(run_id, idx, summary)
+            self._conn.execute(
+                "DELETE FROM chunk_summaries WHERE run_id = ? AND chapter_idx = ?", (run_id, idx)
+            )
+            self._conn.execute(
+                """INSERT OR REPLACE INTO summary_cache (text_hash, settings_hash, summary, created_at)
+                   VALUES (?, ?, ?, ?)""",
+                (text_hash(chapter_text), settings, summary, time.time())
+            )
+
+    def cached_summary(self, chapter_text: str, settings: str) -> Optional[str]:
+        """Готовый конспект главы с тем же текстом и настройками генерации"""
+        rows = self._query(
+            "SELECT summary FROM summary_cache WHERE text_hash = ? AND settings_hash = ?",
+            (text_hash(chapter_text), settings)
+        )
+        return rows[0]["summary"] if rows else None
+
+    # Полнотекстовый поиск
+
+    def _index_chapter(self, run_id: int, idx: int, summary: str) -> None:
+        """
+        Запись конспекта главы с обновлением индекса (вызывается внутри транзакции)
+
+        Индексирован только последний запуск документа (главы в chapter_texts):
+        прежние значения строки удаляются из индекса командой 'delete', затем
+        вставляются новые.
+        """
+        row = self._conn.execute(
+            """SELECT c.id, EXISTS (SELECT 1 FROM chapter_texts t WHERE t.id = c.id) AS indexed
+               FROM chapters c WHERE c.run_id = ? AND c.idx = ?""",
+            (run_id, idx)
+        ).fetchone()
+        if row is None:
+            return
+        if row["indexed"]:
+            self._conn.execute(
+                """INSERT INTO chapter_search (chapter_search, rowid, title, body, source)
+                   SELECT 'delete', id, title, body, source FROM chapter_texts WHERE id = ?""",
+                (row["id"],)
+            )
+        self._conn.execute("UPDATE chapters SET summary = ? WHERE id = ?", (summary, row["id"]))
+        if row["indexed"]:
+            self._conn.execute(
+                """INSERT INTO chapter_search (rowid, title, body, source)
+                   SELECT id, title, body, source FROM chapter_texts WHERE id = ?""",
+                (row["id"],)
+            )
+
+    def rebuild_search_index(self) -> int:
+        """Полная перестройка индексов по содержимому (главы последних запусков документов)"""
+        with self._lock, self._conn:
+            self._conn.execute("INSERT INTO chapter_search (chapter_search) VALUES ('rebuild')")
+            self._conn.execute("INSERT INTO passage_search (passage_search) VALUES ('rebuild')")
+            return self._conn.execute("SELECT COUNT(*) AS n FROM chapter_search").fetchone()["n"]
+
+    def search(self, query: str, limit: int = 20, scope: str = "all") -> List[dict]:
+        """
+        Поиск глав по конспектам и исходному тексту
+
+        Args:
+            scope: "all", "summary" (заголовок и конспект) или "source" (заголовок и текст главы)
+
+        Returns:
+            Главы в порядке релевантности (bm25) с фрагментом конспекта или
+            исходного текста и списком областей, где найдены слова запроса
+        """
+        if scope not in SEARCH_SCOPES:
+            raise ValueError(f"Неизвестная область поиска: {scope}")
+        fts_query = match_query(query)
+        if fts_query is None:
+            return []
+        columns = " ".join(SEARCH_SCOPES[scope])
+        # Фрагменты и совпадения считает FTS5 (snippet) без разбора текста глав в Python:
+        # конспект короткий, для исходного текста берется лучший фрагмент главы
+        fragment = f"'{MATCH_OPEN}', '{MATCH_CLOSE}', '...', {SNIPPET_TOKENS}"
+        rows = self._query(
+            f"""SELECT c.id, c.idx, s.score, s.body, r.job_id, r.document_id, d.source_name, c.title,
+                       (SELECT MIN(id) FROM source_passages WHERE chapter_id = c.id) AS first_passage,
+                       (SELECT MAX(id) FROM source_passages WHERE chapter_id = c.id) AS last_passage
+                FROM (SELECT rowid,
+                             bm25(chapter_search, {TITLE_WEIGHT}, {SUMMARY_WEIGHT}, {SOURCE_WEIGHT}) AS score,
+                             snippet(chapter_search, 1, {fragment}) AS body
+                      FROM chapter_search WHERE chapter_search MATCH ?
+                      ORDER BY score LIMIT ?) s
+                JOIN chapters c ON c.id = s.rowid
+                JOIN runs r ON r.id = c.run_id
+                JOIN documents d ON d.id = r.document_id
+                ORDER BY s.score""",
+            (f"{{{columns}}} : ({fts_query})", limit)
+        )
+        # Во фрагменте исходного текста достаточно любого слова запроса
+        any_term = match_query(query, any_term=True)
+        hits = []
+        for row in rows:
+            passage = None
+            if "source" in SEARCH_SCOPES[scope] and row["first_passage"] is not None:
+                # Фрагменты главы идут подряд: диапазон rowid FTS5 проверяет по индексу
+                found = self._query(
+                    f"""SELECT snippet(passage_search, 0, {fragment}) AS text FROM passage_search
+                        WHERE passage_search MATCH ? AND rowid BETWEEN ? AND ?
+                        ORDER BY rank LIMIT 1""",
+                    (any_term, row["first_passage"], row["last_passage"])
+                )
+                passage = found[0]["text"] if found else None
+            # Метки совпадений есть только во фрагменте конспекта, где найдены слова запроса
+            matched = [
+                area for area, text in (("summary", row["body"]), ("source", passage))
+                if text and MATCH_OPEN in text
+            ]
+            # Фрагмент конспекта, если слова запроса есть в нем, иначе - исходного текста
+            text = row["body"] if "summary" in matched or not passage else passage
+            hits.append({
+                "document_id": row["document_id"],
+                "source_name": row["source_name"],
+                "job_id": row["job_id"],
+                "chapter": row["idx"] + 1,
+                "title": row["title"],
+                # bm25 в SQLite отрицательный: меньше - релевантнее
+                "score": round(-row["score"], 3),
+                "matched_in": matched,
+                "snippet": " ".join(text.replace(MATCH_OPEN, "**").replace(MATCH_CLOSE, "**").split())
+            })
+        return hits
+
+    # Запросы для API
+
+    def list_documents(self, limit: int = 100, offset: int = 0) -> List[dict]:
+        return self._query(
+            """SELECT d.*, r.id AS last_run_id, r.job_id, r.status, r.total_chapters,
+                      (SELECT COUNT(*) FROM chapters c WHERE c.run_id = r.id AND c.summary IS NOT NULL) AS completed_chapters
+               FROM documents d
+               LEFT JOIN runs r ON r.id = (SELECT MAX(id) FROM runs WHERE document_id = d.id)
+               ORDER BY d.updated_at DESC LIMIT ? OFFSET ?""",
+            (limit, offset)
+        )
+
+    def get_document(self, document_id: str) -> Optional[dict]:
+        rows = self._query("SELECT * FROM documents WHERE id = ?", (document_id,))
+        if not rows:
+            return None
+        document = rows[0]
+        document["runs"] = self._query(
+            "SELECT id, job_id, status, error_message, total_chapters, created_at, updated_at "
+            "FROM runs WHERE document_id = ? ORDER BY id DESC",
+            (document_id,)
+        )
+        return document
+
+    def run_for_checkpoint(self, checkpoint) -> int:
+        """Запуск, соответствующий чекпоинту задачи (создается для чекпоинтов, сохраненных до библиотеки)"""
+        run = self.latest_run(checkpoint.job_id)
+        if run is not None and run["total_chapters"] == checkpoint.state["total_chapters"]:
+            return run["id"]
+        document_id = checkpoint.state.get("document_id", checkpoint.job_id)
+        self.add_document(document_id, checkpoint.state.get("source_name") or "")
+        return self.start_run(checkpoint.job_id, document_id, checkpoint.state["config"], checkpoint.load_chapters())
+
+    def cached_chapters(self, run_id: int, settings: str) -> Set[int]:
+        """Главы запуска, для которых в кеше уже есть конспект с теми же настройками"""
+        rows = self._query(
+            """SELECT c.idx FROM chapters c
+               JOIN summary_cache s ON s.text_hash = c.text_hash AND s.settings_hash = ?
+               WHERE c.run_id = ?""",
+            (settings, run_id)
+        )
+        return {row["idx"] for row in rows}
+
+    def run_chapters(self, run_id: int) -> List[dict]:
+        return self._query(
+            "SELECT idx, title, chars, summary FROM chapters WHERE run_id = ? ORDER BY idx", (run_id,)
+        )
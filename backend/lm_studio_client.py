@@ -2,87 +2,411 @@
 Клиент для работы с LM Studio API
 """
 import requests
-from typing import List, Optional
+from typing import Callable, Dict, List, Optional
 import asyncio
+import json
+import threading
+import time
 from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from tracing import Tracer, NULL_TRACER
+from throughput import ThroughputTracker, estimate_tokens
+from sentences import split_chunks
+from packing import pack_prompt, pack_max_tokens, split_pack_response
+from routing import ModelRoute, ModelRouter, ModelStats
+
+
+DEFAULT_SYSTEM_PROMPT = (
+    "Ты помощник для создания конспектов. "
+    "Создай краткий, структурированный конспект предоставленного текста, "
+    "выделяя основные идеи и ключевые моменты. "
+    "Используй маркированные списки и четкую структуру."
+)
+
+
+# Минимальный запрос прогрева и keep-alive
+WARM_UP_TEXT = "Ответь одним словом: готов."
+
+
+class JobCancelledError(Exception):
+    """Задача отменена пользователем"""
 
 
 class LMStudioClient:
     """Клиент для взаимодействия с LM Studio API"""
     
-    def __init__(self, base_url: str = "http://localhost:1234", model_name: str = "local-model"):
+    def __init__(
+        self,
+        base_url: str = "http://localhost:1234",
+        model_name: str = "local-model",
+        max_workers: int = 1,
+        tracer: Optional[Tracer] = None,
+        prompt_cache: bool = True,
+        slot_count: int = 0,
+        routes: Optional[List[dict]] = None
+    ):
+        """
+        Args:
+            prompt_cache: Просить сервер переиспользовать KV-кеш общего префикса промпта
+                (cache_prompt у серверов на llama.cpp; остальные поле игнорируют)
+            slot_count: Число слотов сервера; если задано, чанки одной главы
+                закрепляются за одним слотом (id_slot)
+            routes: Правила выбора модели по длине и сложности текста
+                (model_routes, см. routing.py); без них все запросы идут в model_name
+        """
         self.base_url = base_url
         self.model_name = model_name
         self.api_url = f"{base_url}/v1/chat/completions"
-        self.executor = ThreadPoolExecutor(max_workers=1)  # Один поток для экономии VRAM
+        # По умолчанию один поток для экономии VRAM; больше - если сервер обслуживает параллельные слоты
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.tracer = tracer or NULL_TRACER
+        self.last_request_at = 0.0
+        self._in_flight = 0
+        self._keep_alive_task: Optional[asyncio.Task] = None
+        self.throughput = ThroughputTracker()
+        self._cancel_event = threading.Event()
+        self._response: Optional[requests.Response] = None
+        self.prompt_cache = prompt_cache
+        self.slot_count = slot_count
+        # Очередь к серверу, общая для нескольких задач (FairScheduler.turn): tokens -> async context manager
+        self.request_gate: Optional[Callable] = None
+        self.router = ModelRouter(routes, model_name, base_url)
+        # Задержка и токены по моделям (в API общие для всех задач, как throughput)
+        self.model_stats = ModelStats()
+    
+    @property
+    def cancelled(self) -> bool:
+        return self._cancel_event.is_set()
     
-    def generate_summary(self, text: str, system_prompt: Optional[str] = None) -> str:
+    def cancel(self):
+        """
+        Отмена всех текущих и будущих запросов клиента
+        
+        Активный потоковый ответ закрывается, поэтому сервер обнаруживает
+        разрыв соединения и прекращает генерацию.
+        """
+        self._cancel_event.set()
+        response = self._response
+        if response is not None:
+            try:
+                response.close()
+            except Exception:
+                pass
+    
+    def reset_cancel(self):
+        """Снятие отмены: клиент снова принимает запросы (воркер очереди после потери аренды)"""
+        self._cancel_event.clear()
+    
+    def _check_cancelled(self):
+        if self.cancelled:
+            raise JobCancelledError("Задача отменена")
+    
+    def slot_for(self, chapter: Optional[int]) -> Optional[int]:
+        """Слот сервера для всех чанков главы (None - слот выбирает сервер)"""
+        if not self.slot_count or chapter is None:
+            return None
+        return chapter % self.slot_count
+    
+    @staticmethod
+    def build_messages(text: str, system_prompt: Optional[str] = None) -> List[dict]:
+        """
+        Сообщения запроса: неизменный системный промпт всегда первым
+        
+        Префикс запросов (системный промпт) совпадает побайтно во всех запросах,
+        включая прогрев, поэтому сервер переиспользует его KV-кеш и
+        обрабатывает заново только текст чанка.
+        """
+        return [
+            {
+                "role": "system",
+                "content": system_prompt if system_prompt is not None else DEFAULT_SYSTEM_PROMPT
+            },
+            {
+                "role": "user",
+                "content": text
+            }
+        ]
+    
+    def generate_summary(
+        self,
+        text: str,
+        system_prompt: Optional[str] = None,
+        tags: Optional[dict] = None,
+        slot: Optional[int] = None,
+        max_tokens: int = 2000
+    ) -> str:
         """
         Генерация конспекта для текста
         
         Args:
             text: Текст для обработки
             system_prompt: Системный промпт (опционально)
+            tags: Теги для трассировки (глава, чанк)
+            slot: Слот сервера (id_slot), за которым закреплена глава
+            max_tokens: Лимит длины ответа
         
         Returns:
             Сгенерированный конспект
         """
-        if system_prompt is None:
-            system_prompt = (
-                "Ты помощник для создания конспектов. "
-                "Создай краткий, структурированный конспект предоставленного текста, "
-                "выделяя основные идеи и ключевые моменты. "
-                "Используй маркированные списки и четкую структуру."
+        with self.tracer.span("generate_summary", chars=len(text), slot=slot, **(tags or {})):
+            return self._generate_summary(text, system_prompt, slot, max_tokens)
+    
+    def _generate_summary(
+        self,
+        text: str,
+        system_prompt: Optional[str] = None,
+        slot: Optional[int] = None,
+        max_tokens: int = 2000
+    ) -> str:
+        messages = self.build_messages(text, system_prompt)
+        route = self.router.route(text)
+        started = time.perf_counter()
+        try:
+            result = self._post_chat(messages, max_tokens=max_tokens, timeout=300, slot=slot, route=route)
+        except JobCancelledError:
+            raise
+        except Exception:
+            self.model_stats.record_error(route)
+            raise
+        content = result["choices"][0]["message"]["content"]
+        self._record_throughput(
+            result, sum(len(message["content"]) for message in messages), route, time.perf_counter() - started
+        )
+        return content
+    
+    def _record_throughput(
+        self,
+        result: dict,
+        prompt_chars: int,
+        route: Optional[ModelRoute] = None,
+        latency: float = 0.0
+    ):
+        """Учет скорости по usage ответа (или по оценке, если сервер не вернул usage)"""
+        timings = result.get("timings") or {}
+        usage = result.get("usage") or {}
+        prompt_tokens = usage.get("prompt_tokens") or estimate_tokens(prompt_chars)
+        completion_tokens = usage.get("completion_tokens") or timings.get("completion_events", 0)
+        if route is not None:
+            self.model_stats.record(
+                route, prompt_chars, prompt_tokens, completion_tokens, latency,
+                timings.get("prompt_seconds", 0.0), timings.get("gen_seconds", 0.0)
             )
+        if not timings:
+            return
+        # Токены промпта из кеша: поле OpenAI usage.prompt_tokens_details или cache_n у llama.cpp
+        cached = (usage.get("prompt_tokens_details") or {}).get("cached_tokens")
+        if cached is None:
+            cached = (result.get("server_timings") or {}).get("cache_n")
+        self.throughput.record(
+            prompt_tokens,
+            completion_tokens,
+            timings["prompt_seconds"],
+            timings["gen_seconds"],
+            cached or 0
+        )
+    
+    def _post_chat(
+        self,
+        messages: List[dict],
+        max_tokens: int,
+        timeout: float,
+        temperature: float = 0.7,
+        slot: Optional[int] = None,
+        route: Optional[ModelRoute] = None
+    ) -> dict:
+        """
+        Запрос к /v1/chat/completions; возвращает разобранный JSON-ответ
         
+        Ответ читается потоково: между фрагментами проверяется отмена,
+        и соединение можно закрыть до окончания генерации.
+        Без route запрос идет в основную модель (model_name).
+        """
+        self._check_cancelled()
+        route = route or self.router.default
         payload = {
-            "model": self.model_name,
-            "messages": [
-                {
-                    "role": "system",
-                    "content": system_prompt
-                },
-                {
-                    "role": "user",
-                    "content": text
-                }
-            ],
-            "temperature": 0.7,
-            "max_tokens": 2000,
-            "stream": False
+            "model": route.model,
+            "messages": messages,
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+            "stream": True,
+            "stream_options": {"include_usage": True}
         }
+        if self.prompt_cache:
+            payload["cache_prompt"] = True
+        if slot is not None:
+            payload["id_slot"] = slot
         
+        self._in_flight += 1
+        self.last_request_at = time.time()
+        started = time.perf_counter()
         try:
             response = requests.post(
-                self.api_url,
+                route.api_url,
                 json=payload,
-                timeout=300,
-                headers={"Content-Type": "application/json"}
+                timeout=timeout,
+                headers={"Content-Type": "application/json"},
+                stream=True
             )
-            
-            if response.status_code == 200:
-                result = response.json()
+            self._response = response
+            try:
+                if response.status_code != 200:
+                    raise Exception(f"Ошибка LM Studio API: {response.status_code} - {response.text[:200]}")
+                if response.headers.get("Content-Type", "").startswith("application/json"):
+                    # Сервер проигнорировал stream и вернул ответ целиком
+                    result = response.json()
+                else:
+                    result = self._read_stream(response, started)
                 if "choices" in result and len(result["choices"]) > 0:
-                    return result["choices"][0]["message"]["content"]
+                    return result
                 else:
                     raise Exception("Неожиданный формат ответа от LM Studio")
-            else:
-                raise Exception(f"Ошибка LM Studio API: {response.status_code} - {response.text[:200]}")
+            finally:
+                self._response = None
+                response.close()
                 
+        except JobCancelledError:
+            raise
         except requests.exceptions.Timeout:
             raise Exception("Превышено время ожидания ответа от LM Studio")
         except requests.exceptions.ConnectionError:
+            self._check_cancelled()
             raise Exception("Не удалось подключиться к LM Studio. Убедитесь, что сервер запущен.")
         except Exception as e:
+            # Закрытие соединения из cancel() прерывает чтение произвольной ошибкой
+            self._check_cancelled()
             raise Exception(f"Ошибка при запросе к LM Studio: {str(e)}")
+        finally:
+            self._in_flight -= 1
+            self.last_request_at = time.time()
     
-    async def generate_summary_async(self, text: str, system_prompt: Optional[str] = None) -> str:
+    def _read_stream(self, response: requests.Response, started: float) -> dict:
+        """
+        Сборка ответа из событий SSE в формате обычного (непотокового) ответа
+        
+        Время до первого токена считается временем обработки промпта,
+        остальное - временем генерации (поле timings ответа).
+        """
+        content = []
+        usage = None
+        server_timings = None
+        received = False
+        first_token_at = None
+        for line in response.iter_lines(chunk_size=None):
+            self._check_cancelled()
+            if not line.startswith(b"data:"):
+                continue
+            data = line[5:].strip()
+            if data == b"[DONE]":
+                break
+            event = json.loads(data)
+            if event.get("usage"):
+                usage = event["usage"]
+            if event.get("timings"):
+                server_timings = event["timings"]
+            for choice in event.get("choices", []):
+                received = True
+                delta = choice.get("delta", {}).get("content") or ""
+                if delta and first_token_at is None:
+                    first_token_at = time.perf_counter()
+                content.append(delta)
+        self._check_cancelled()
+        if not received:
+            return {"choices": [], "usage": usage}
+        finished_at = time.perf_counter()
+        first_token_at = first_token_at or finished_at
+        return {
+            "choices": [{"message": {"role": "assistant", "content": "".join(content)}}],
+            "usage": usage,
+            "server_timings": server_timings,
+            "timings": {
+                "prompt_seconds": first_token_at - started,
+                "gen_seconds": finished_at - first_token_at,
+                # Без usage число токенов ответа оценивается числом событий (обычно одно на токен)
+                "completion_events": sum(1 for delta in content if delta)
+            }
+        }
+    
+    def warm_up(self) -> float:
+        """
+        Прогрев модели минимальным запросом
+        
+        Заставляет сервер загрузить модель и подготовить KV-кеш до первой главы.
+        Используется тот же системный промпт, что и для конспектов.
+        
+        Returns:
+            Длительность прогрева в секундах
+        """
+        started = time.time()
+        # Прогреваются все модели маршрутов: первый короткий раздел не ждет загрузки малой модели
+        for route in self.router.targets():
+            with self.tracer.span("warm_up", model=route.model):
+                # Тот же системный промпт, что у конспектов: его KV-кеш остается на сервере
+                self._post_chat(
+                    self.build_messages(WARM_UP_TEXT),
+                    max_tokens=1,
+                    timeout=600,
+                    temperature=0,
+                    slot=self.slot_for(0),
+                    route=route
+                )
+        return time.time() - started
+    
+    async def warm_up_async(self) -> float:
+        """
+        Асинхронный прогрев модели
+
+        Запрос ждет очереди планировщика, как и запросы глав: прогрев и
+        keep-alive не занимают слот сервера сверх llm_slots.
+        """
+        loop = asyncio.get_event_loop()
+        async with self._request_turn(WARM_UP_TEXT):
+            return await loop.run_in_executor(self.executor, self.warm_up)
+    
+    def start_keep_alive(self, interval: float):
+        """
+        Периодические минимальные запросы, пока клиент простаивает
+        
+        Не дает серверу выгрузить модель по таймауту простоя, пока задача
+        ждет своей очереди или извлечения текста.
+        """
+        if interval and interval > 0 and self._keep_alive_task is None:
+            self._keep_alive_task = asyncio.create_task(self._keep_alive_loop(interval))
+    
+    async def stop_keep_alive(self):
+        if self._keep_alive_task is not None:
+            self._keep_alive_task.cancel()
+            try:
+                await self._keep_alive_task
+            except asyncio.CancelledError:
+                pass
+            self._keep_alive_task = None
+    
+    async def _keep_alive_loop(self, interval: float):
+        while True:
+            await asyncio.sleep(max(1.0, interval - (time.time() - self.last_request_at)))
+            if self._in_flight == 0 and time.time() - self.last_request_at >= interval:
+                try:
+                    await self.warm_up_async()
+                except Exception as e:
+                    print(f"[WARNING] Keep-alive запрос к LM Studio не удался: {e}")
+    
+    async def generate_summary_async(
+        self,
+        text: str,
+        system_prompt: Optional[str] = None,
+        tags: Optional[dict] = None,
+        slot: Optional[int] = None,
+        max_tokens: int = 2000
+    ) -> str:
         """
         Асинхронная генерация конспекта
         
         Args:
             text: Текст для обработки
             system_prompt: Системный промпт (опционально)
+            tags: Теги для трассировки (глава, чанк)
+            slot: Слот сервера (id_slot)
+            max_tokens: Лимит длины ответа
         
         Returns:
             Сгенерированный конспект
@@ -92,75 +416,88 @@ class LMStudioClient:
             self.executor,
             self.generate_summary,
             text,
-            system_prompt
+            system_prompt,
+            tags,
+            slot,
+            max_tokens
         )
     
-    def split_into_chunks(self, text: str, max_chunk_size: int = 15000) -> List[str]:
+    @asynccontextmanager
+    async def _request_turn(self, text: str):
+        """Ожидание очереди к серверу перед запросом (если задана request_gate)"""
+        if self.request_gate is None:
+            yield
+            return
+        async with self.request_gate(estimate_tokens(len(text))):
+            yield
+    
+    def split_into_chunks(self, text: str, max_chunk_size: int = 15000, overlap: int = 0) -> List[str]:
         """
         Разбиение текста на чанки для обработки
         
         Args:
             text: Исходный текст
             max_chunk_size: Максимальный размер чанка в символах
+            overlap: Сколько символов конца чанка (целыми предложениями) повторяется
+                в начале следующего
         
         Returns:
-            Список чанков
+            Список чанков, разрезанных по границам предложений (см. sentences.py)
         """
-        if len(text) <= max_chunk_size:
-            return [text]
-        
-        chunks = []
-        i = 0
-        
-        while i < len(text):
-            chunk_end = min(i + max_chunk_size, len(text))
-            chunk = text[i:chunk_end]
-            
-            # Пытаемся разбить по предложениям, чтобы не обрезать текст посередине
-            if chunk_end < len(text):
-                # Ищем последнюю точку, восклицательный или вопросительный знак
-                last_sentence_end = max(
-                    chunk.rfind('.'),
-                    chunk.rfind('!'),
-                    chunk.rfind('?'),
-                    chunk.rfind('\n')  # Также учитываем переносы строк
-                )
-                # Если нашли в последних 30% чанка, используем это место для разбиения
-                if last_sentence_end > max_chunk_size * 0.7:
-                    chunk = chunk[:last_sentence_end + 1]
-                    i += last_sentence_end + 1
-                else:
-                    i = chunk_end
-            else:
-                i = chunk_end
-            
-            if chunk.strip():
-                chunks.append(chunk.strip())
-        
-        return chunks
+        with self.tracer.span("split_into_chunks", chars=len(text)):
+            return split_chunks(text, max_chunk_size, overlap)
     
-    async def process_chapter(self, chapter_text: str, max_chunk_size: int = 15000) -> str:
+    async def process_chapter(
+        self,
+        chapter_text: str,
+        max_chunk_size: int = 15000,
+        chunk_overlap: int = 0,
+        done_chunks: Optional[Dict[int, str]] = None,
+        on_chunk_done: Optional[Callable[[int, int, str], None]] = None,
+        tags: Optional[dict] = None
+    ) -> str:
         """
         Обработка главы: разбиение на чанки и генерация конспекта
         
         Args:
             chapter_text: Текст главы
             max_chunk_size: Максимальный размер чанка
+            chunk_overlap: Перекрытие соседних чанков в символах
+            done_chunks: Уже готовые конспекты чанков (при возобновлении задачи)
+            on_chunk_done: Вызывается после успешной генерации чанка
+                с аргументами (индекс чанка, всего чанков, конспект)
+            tags: Теги для трассировки (например, номер главы)
         
         Returns:
             Объединенный конспект главы
         """
+        done_chunks = done_chunks or {}
+        tags = tags or {}
+        # Все чанки главы идут в один слот сервера
+        slot = self.slot_for(tags.get("chapter"))
+        
         # Разбиваем на чанки если текст слишком большой
         if len(chapter_text) > max_chunk_size:
-            chunks = self.split_into_chunks(chapter_text, max_chunk_size)
+            chunks = self.split_into_chunks(chapter_text, max_chunk_size, chunk_overlap)
             summaries = []
             
             for idx, chunk in enumerate(chunks):
+                # Чанк уже обработан до перезапуска
+                if idx in done_chunks:
+                    summaries.append(done_chunks[idx])
+                    continue
+                # После отмены новые чанки не отправляются
+                self._check_cancelled()
                 try:
-                    summary = await self.generate_summary_async(chunk)
+                    async with self._request_turn(chunk):
+                        summary = await self.generate_summary_async(chunk, tags={**tags, "chunk": idx}, slot=slot)
                     summaries.append(summary)
+                    if on_chunk_done:
+                        on_chunk_done(idx, len(chunks), summary)
                     # Небольшая задержка между чанками для экономии VRAM
                     await asyncio.sleep(0.5)
+                except JobCancelledError:
+                    raise
                 except Exception as e:
                     summaries.append(f"[Ошибка обработки чанка {idx + 1}: {str(e)}]")
             
@@ -168,4 +505,34 @@ class LMStudioClient:
             return "\n\n".join(summaries)
         else:
             # Если текст помещается в один чанк, обрабатываем сразу
-            return await self.generate_summary_async(chapter_text)
+            self._check_cancelled()
+            async with self._request_turn(chapter_text):
+                summary = await self.generate_summary_async(chapter_text, tags={**tags, "chunk": 0}, slot=slot)
+            if on_chunk_done:
+                on_chunk_done(0, 1, summary)
+            return summary
+    
+    async def process_pack(self, chapter_texts: List[str], tags: Optional[dict] = None) -> Optional[List[str]]:
+        """
+        Конспект нескольких небольших глав одним запросом (см. packing.py)
+        
+        Args:
+            chapter_texts: Тексты глав, каждая помещается в один чанк
+            tags: Теги для трассировки (номер первой главы пачки)
+        
+        Returns:
+            Конспекты глав по порядку или None, если ответ не удалось разобрать
+            по разделам (тогда главы конспектируются по одной)
+        """
+        tags = tags or {}
+        slot = self.slot_for(tags.get("chapter"))
+        prompt = pack_prompt(chapter_texts)
+        self._check_cancelled()
+        async with self._request_turn(prompt):
+            response = await self.generate_summary_async(
+                prompt,
+                tags={**tags, "chunk": 0, "pack": len(chapter_texts)},
+                slot=slot,
+                max_tokens=pack_max_tokens(len(chapter_texts))
+            )
+        return split_pack_response(response, len(chapter_texts))
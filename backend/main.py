@@ -3,13 +3,28 @@ from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse, FileResponse
 import subprocess
 import os
+import shutil
+import uuid
 import json
 import asyncio
 from pathlib import Path
-from typing import Optional
+from typing import Dict, Optional
 import uvicorn
 from processor import PDFProcessor
-from lm_studio_client import LMStudioClient
+from lm_studio_client import LMStudioClient, JobCancelledError
+from checkpoint import JobCheckpoint, list_checkpoints, file_sha256, config_snapshot
+from library import Library, SEARCH_SCOPES, settings_hash
+from docx_renderer import render_docx_cached, PandocNotFoundError
+from tracing import Tracer
+from resource_usage import PeakRSSMonitor
+from health_monitor import LLMHealthMonitor
+from throughput import ThroughputTracker, estimate_tokens, DEFAULT_CHARS_PER_TOKEN
+from task_queue import TaskBroker, create_broker
+from scheduler import FairScheduler
+from sandbox import ExtractionSandbox
+from extractive import CompressionStats, compression_available
+from packing import plan_packs, DEFAULT_PACK_CHAPTER_CHARS, DEFAULT_PACK_MAX_CHAPTERS
+from routing import ModelRouter, ModelStats
 import time
 
 app = FastAPI(title="AI Summarizer Pro API")
@@ -42,210 +57,1216 @@ else:
     with open(CONFIG_PATH, "w", encoding="utf-8") as f:
         json.dump(config, f, indent=2, ensure_ascii=False)
 
-# Глобальное состояние
+# Состояние последней запущенной задачи (его опрашивает /status); состояния всех задач - в jobs
 processing_state = {
     "status": "idle",  # idle, processing, completed, error
+    "job_id": None,
     "progress": 0,
     "current_chapter": 0,
     "total_chapters": 0,
     "preview_text": "",
-    "error_message": None
+    "error_message": None,
+    "peak_rss_mb": None,
+    "tokens_total": 0,
+    "tokens_done": 0,
+    "eta_seconds": None,
+    "metrics": {}
 }
 
-def check_port(port: int) -> bool:
-    """Проверка доступности порта"""
-    import socket
-    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    sock.settimeout(1)
-    result = sock.connect_ex(('localhost', port))
-    sock.close()
-    return result == 0
+# Состояние задач по job_id с момента запуска backend
+jobs: Dict[str, dict] = {}
+
+# Выполняющиеся задачи: фоновая корутина и клиент LM Studio (нужны для отмены)
+active_jobs: Dict[str, dict] = {}
+
+# Очередь запросов к LLM между одновременно выполняющимися задачами
+scheduler = FairScheduler()
+
+# Извлечение текста нагружает CPU и память, поэтому документы извлекаются по одному
+# (файлы каждого документа пишутся в каталог его задачи)
+extraction_lock: Optional[asyncio.Lock] = None
+
+# Изолированные процессы извлечения текста PDF (запускаются при первом документе)
+extraction_sandbox: Optional[ExtractionSandbox] = None
+
+# Библиотека документов в SQLite (открывается при первом обращении)
+library: Optional[Library] = None
+
+# Очередь задач для воркеров (distributed_mode)
+broker: Optional[TaskBroker] = None
+
+# Скорость LLM по последним запросам; сохраняется между задачами для оценки времени в /analyze
+llm_throughput = ThroughputTracker()
+
+# Задержка и токены по моделям маршрутов (model_routes) для подбора порогов
+model_stats = ModelStats()
+
+# Пиковый RSS процесса за время текущей задачи
+rss_monitor = PeakRSSMonitor()
+
+# Кешированное состояние LM Studio, обновляется в фоне
+llm_health = LLMHealthMonitor(config)
+
+def services_status() -> dict:
+    """Состояние сервисов из кеша монитора"""
+    snapshot = llm_health.snapshot
+    return {
+        "lm_studio": snapshot["available"],
+        "ready": llm_health.ready,
+        "model_loaded": snapshot["model_loaded"],
+        "models": snapshot["models"],
+        "context_length": snapshot["context_length"],
+        "latency_ms": snapshot["latency_ms"],
+        "error": snapshot["error"],
+        "checked_at": snapshot["checked_at"]
+    }
 
 @app.on_event("startup")
 async def startup_event():
     """Проверка доступности сервисов при старте"""
+    rss_monitor.start()
     print("Проверка доступности сервисов...")
     
-    lm_available = check_port(config.get("lm_studio_port", 1234))
+    await llm_health.refresh()
+    llm_health.start()
     
-    if not lm_available:
-        print(f"[WARNING] LM Studio не доступен на порту {config.get('lm_studio_port', 1234)}")
+    if not llm_health.snapshot["available"]:
+        print(f"[WARNING] LM Studio не доступен по адресу {llm_health.base_url}")
         print("   Убедитесь, что LM Studio запущен и локальный сервер активен")
+    elif not llm_health.ready:
+        print(f"[WARNING] LM Studio доступен, но {llm_health.snapshot['error']}")
     else:
-        print(f"[OK] LM Studio доступен на порту {config.get('lm_studio_port', 1234)}")
+        print(f"[OK] LM Studio доступен по адресу {llm_health.base_url}")
+    
+    # Продолжение задач, прерванных перезапуском backend (не больше max_active_jobs)
+    if config.get("auto_resume", True):
+        for checkpoint in list_checkpoints(get_jobs_dir()):
+            if len(active_jobs) >= config.get("max_active_jobs", 4):
+                break
+            if checkpoint.status == "processing" and checkpoint.is_compatible(config):
+                print(f"Возобновление прерванной задачи {checkpoint.job_id} ({checkpoint.state.get('source_name')})")
+                reset_rss_monitor()
+                start_job(checkpoint)
 
 @app.get("/")
 async def root():
     return {"message": "AI Summarizer Pro API", "status": "running"}
 
+@app.get("/health")
+async def health():
+    """Проверка готовности backend (используется start.py)"""
+    return {"status": "ok"}
+
 @app.get("/status")
 async def get_status():
     """Получение текущего статуса обработки"""
+    if processing_state["status"] == "processing":
+        processing_state["peak_rss_mb"] = rss_monitor.peak_mb
     return processing_state
 
+@app.get("/jobs/{job_id}/status")
+async def get_job_status(job_id: str):
+    """Статус задачи, запущенной с момента старта backend"""
+    state = jobs.get(job_id)
+    if state is None:
+        raise HTTPException(status_code=404, detail="Задача не запускалась")
+    if state["status"] == "processing":
+        state["peak_rss_mb"] = rss_monitor.peak_mb
+    return state
+
+@app.get("/scheduler")
+async def scheduler_status():
+    """Очередь запросов к LLM: политика, ожидание в очереди и обслуженные токены по задачам"""
+    report = get_scheduler().to_dict()
+    if config.get("distributed_mode", False):
+        loop = asyncio.get_event_loop()
+        report["queue"] = await loop.run_in_executor(None, get_broker().queue_stats)
+    return report
+
+@app.get("/models")
+async def models_status():
+    """Маршрутизация по моделям: правила model_routes и задержка, токены и скорость по моделям"""
+    router = ModelRouter(
+        config.get("model_routes"),
+        config.get("lm_studio_model", "local-model"),
+        config.get("lm_studio_url", "http://localhost:1234")
+    )
+    return {**router.to_dict(), "stats": model_stats.to_dict()}
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await llm_health.stop()
+    if extraction_sandbox is not None:
+        extraction_sandbox.close()
+
 @app.post("/check-services")
 async def check_services():
-    """Проверка доступности сервисов"""
-    lm_available = check_port(config.get("lm_studio_port", 1234))
-    
-    return {
-        "lm_studio": lm_available,
-        "ready": lm_available
-    }
+    """Проверка доступности сервисов (из кеша фонового монитора)"""
+    return services_status()
 
 @app.post("/upload")
-async def upload_pdf(file: UploadFile = File(...)):
-    """Загрузка и обработка PDF файла"""
+async def upload_pdf(file: UploadFile = File(...), priority: int = 0, weight: float = 1.0):
+    """
+    Загрузка и обработка PDF файла
+    
+    Задачи выполняются одновременно и делят сервер LLM через планировщик:
+    priority - задачи с большим приоритетом обслуживаются раньше,
+    weight - доля сервера в политике fair.
+    """
     global processing_state
     
     if not file.filename.endswith('.pdf'):
         raise HTTPException(status_code=400, detail="Файл должен быть в формате PDF")
     
+    check_job_capacity()
+    
+    state = new_processing_state()
     try:
         # Сброс состояния
-        processing_state = {
-            "status": "processing",
-            "progress": 0,
-            "current_chapter": 0,
-            "total_chapters": 0,
-            "preview_text": "",
-            "error_message": None
-        }
+        state["status"] = "processing"
+        processing_state = state
+        reset_rss_monitor()
         
-        # Проверка сервисов
-        lm_available = check_port(config.get("lm_studio_port", 1234))
+        llm_error = await check_llm_ready()
+        if llm_error:
+            state["status"] = "error"
+            state["error_message"] = llm_error
+            return JSONResponse(status_code=503, content=state)
         
-        if not lm_available:
-            processing_state["status"] = "error"
-            processing_state["error_message"] = f"LM Studio не доступен на порту {config.get('lm_studio_port', 1234)}. Убедитесь, что LM Studio запущен и локальный сервер активен."
-            return JSONResponse(status_code=503, content=processing_state)
+        pdf_path, document_id = await save_upload(file)
         
-        # Сохранение временного файла
-        output_dir = Path(config["output_dir"])
-        output_dir.mkdir(parents=True, exist_ok=True)
+        # Повторная загрузка того же PDF продолжает сохраненную задачу
+        checkpoint = JobCheckpoint(get_jobs_dir(), document_id[:16])
+        if checkpoint.job_id in active_jobs:
+            raise HTTPException(status_code=409, detail="Документ уже обрабатывается")
+        if checkpoint.exists() and checkpoint.is_compatible(config):
+            chapters_count = checkpoint.state["total_chapters"]
+            resume_from = checkpoint.first_unfinished()
+            checkpoint.set_scheduling(priority, weight)
+            start_job(checkpoint, state=state)
+            return {
+                "success": True,
+                "message": f"Продолжение обработки с главы {(resume_from if resume_from is not None else chapters_count) + 1}. Найдено глав: {chapters_count}",
+                "chapters_count": chapters_count,
+                "job_id": checkpoint.job_id
+            }
         
-        temp_pdf_path = output_dir / file.filename
-        with open(temp_pdf_path, "wb") as f:
-            content = await file.read()
-            f.write(content)
+        # Прогрев модели идет параллельно с извлечением текста
+        tracer = new_tracer(checkpoint.job_id)
+        lm_client = new_lm_client(tracer)
+        warmup = warm_up_client(lm_client)
+        state["job_id"] = checkpoint.job_id
+        jobs[checkpoint.job_id] = state
+        active_jobs[checkpoint.job_id] = {"task": None, "lm_client": lm_client}
         
-        # Обработка PDF
-        processor = PDFProcessor(config)
-        chapters = processor.process_pdf(str(temp_pdf_path))
+        try:
+            async with get_extraction_lock():
+                chapters = await extract_chapters(pdf_path, document_id, tracer)
+                if chapters and not lm_client.cancelled:
+                    await create_checkpoint(checkpoint, chapters, file.filename, document_id)
+        except Exception:
+            await abort_extraction(checkpoint.job_id, lm_client)
+            raise
         
-        if not chapters:
-            processing_state["status"] = "error"
-            processing_state["error_message"] = "Не удалось извлечь текст из PDF"
-            return JSONResponse(status_code=500, content=processing_state)
+        # Задачу отменили во время извлечения текста
+        if lm_client.cancelled:
+            await abort_extraction(checkpoint.job_id, lm_client)
+            state["status"] = "cancelled"
+            return {"success": False, "message": "Задача отменена", "job_id": checkpoint.job_id}
         
-        processing_state["total_chapters"] = len(chapters)
+        if not chapters:
+            await abort_extraction(checkpoint.job_id, lm_client)
+            state["status"] = "error"
+            state["error_message"] = "Не удалось извлечь текст из PDF"
+            return JSONResponse(status_code=500, content=state)
         
         # Запуск асинхронной обработки
-        asyncio.create_task(process_chapters(chapters))
+        checkpoint.set_scheduling(priority, weight)
+        start_job(checkpoint, tracer, lm_client, warmup, state)
         
         return {
             "success": True,
             "message": f"Обработка начата. Найдено глав: {len(chapters)}",
-            "chapters_count": len(chapters)
+            "chapters_count": len(chapters),
+            "job_id": checkpoint.job_id
         }
         
+    except HTTPException as e:
+        state["status"] = "error"
+        state["error_message"] = e.detail
+        raise
     except Exception as e:
-        processing_state["status"] = "error"
-        processing_state["error_message"] = str(e)
+        state["status"] = "error"
+        state["error_message"] = str(e)
         raise HTTPException(status_code=500, detail=str(e))
 
-async def process_chapters(chapters: list):
-    """Асинхронная обработка глав через LM Studio с очередью для оптимизации VRAM"""
-    global processing_state
+def check_job_capacity():
+    """Ограничение числа одновременно выполняющихся задач (max_active_jobs)"""
+    if len(active_jobs) >= config.get("max_active_jobs", 4):
+        raise HTTPException(status_code=409, detail="Выполняется максимальное число задач, повторите позже")
+
+def reset_rss_monitor():
+    """Пиковый RSS считается заново, если других задач нет (иначе пик общий для задач)"""
+    if not active_jobs:
+        rss_monitor.reset()
+
+def get_extraction_lock() -> asyncio.Lock:
+    global extraction_lock
+    if extraction_lock is None:
+        extraction_lock = asyncio.Lock()
+    return extraction_lock
+
+def release_job(job_id: str):
+    """Задача больше не выполняется: освобождаем место; каталог задачи удаляется, если отмена просила discard"""
+    job = active_jobs.pop(job_id, None)
+    if job is not None and job.get("discard"):
+        shutil.rmtree(JobCheckpoint(get_jobs_dir(), job_id).job_dir, ignore_errors=True)
+
+async def abort_extraction(job_id: str, lm_client: LMStudioClient):
+    """Задача не дошла до генерации: освобождаем место и останавливаем keep-alive"""
+    release_job(job_id)
+    await lm_client.stop_keep_alive()
+
+async def check_llm_ready() -> Optional[str]:
+    """
+    Готовность LM Studio к задаче: None или текст ошибки
     
-    output_dir = Path(config["output_dir"])
-    log_file = output_dir / "generation_log.md"
+    Проверка по кешу монитора; если кеш говорит "недоступен", перепроверяем один раз
+    (сервер мог запуститься после последнего опроса). В распределенном режиме
+    к LLM обращаются только воркеры.
+    """
+    if config.get("distributed_mode", False):
+        return None
+    if not llm_health.ready:
+        await llm_health.refresh()
+    if not llm_health.ready:
+        return f"LM Studio не готов ({llm_health.snapshot['error']}). Убедитесь, что LM Studio запущен, локальный сервер активен и модель загружена."
+    return None
+
+async def save_upload(file: UploadFile):
+    """
+    Сохранение загруженного PDF в каталог задачи (.jobs/<job_id>/source.pdf)
+    и регистрация документа в библиотеке
+    
+    Файл сначала пишется под уникальным временным именем: одновременные
+    загрузки файлов с одинаковым именем не перезаписывают друг друга.
+    """
+    uploads_dir = get_jobs_dir() / ".uploads"
+    uploads_dir.mkdir(parents=True, exist_ok=True)
+    
+    temp_pdf_path = uploads_dir / f"{uuid.uuid4().hex}.pdf"
+    with open(temp_pdf_path, "wb") as f:
+        content = await file.read()
+        f.write(content)
+    
+    # Документ идентифицируется хешем содержимого
+    document_id = file_sha256(str(temp_pdf_path))
+    job_dir = get_jobs_dir() / document_id[:16]
+    job_dir.mkdir(parents=True, exist_ok=True)
+    pdf_path = job_dir / "source.pdf"
+    os.replace(temp_pdf_path, pdf_path)
+    get_library().add_document(document_id, file.filename, len(content))
+    return pdf_path, document_id
+
+async def extract_chapters(pdf_path: Path, document_id: str, tracer: Tracer):
+    """
+    Нарезка документа на главы
     
-    # Очистка лог-файла
-    if log_file.exists():
-        log_file.write_text("", encoding="utf-8")
+    Обработка PDF идет в пуле потоков, чтобы не блокировать event loop, а
+    страницы извлекаются в изолированном процессе (sandbox.py); текст уже
+    обработанного документа берется из библиотеки.
+    """
+    library = get_library()
+    # Исходный текст и индекс глав документа - в каталоге его задачи, рядом с PDF
+    processor = PDFProcessor(config, tracer=tracer, sandbox=get_extraction_sandbox(), work_dir=pdf_path.parent / "extract")
+    loop = asyncio.get_event_loop()
+    if library.has_pages(document_id):
+        print("Текст документа найден в библиотеке, извлечение пропущено")
+        return await loop.run_in_executor(None, processor.process_pages, library.iter_pages(document_id))
+    page_sink = lambda page_no, text: library.save_page(document_id, page_no, text)
+    try:
+        chapters = await loop.run_in_executor(None, processor.process_pdf, str(pdf_path), page_sink)
+    except Exception:
+        library.discard_pages(document_id)
+        raise
+    library.finish_pages(document_id)
+    return chapters
+
+async def create_checkpoint(checkpoint: JobCheckpoint, chapters, source_name: str, document_id: str) -> int:
+    """Чекпоинт и запуск в библиотеке для нового индекса глав; страницы глав определяются по тексту страниц"""
+    library = get_library()
+    checkpoint.create(chapters, config, source_name, document_id)
+    loop = asyncio.get_event_loop()
+    # Запуск индексирует исходный текст глав для поиска - вне event loop
+    run_id = await loop.run_in_executor(
+        None, library.start_run, checkpoint.job_id, document_id, config_snapshot(config), chapters
+    )
     
-    # Инициализация клиента LM Studio
+    starts = await loop.run_in_executor(None, PDFProcessor.locate_chapters, chapters, library.iter_pages(document_id))
+    page_count = library.get_document(document_id)["page_count"]
+    pages = []
+    for idx, start in enumerate(starts):
+        # Глава заканчивается на странице, где начинается следующая найденная глава
+        end = next((s for s in starts[idx + 1:] if s is not None), page_count) or start
+        pages.append([start, max(start, end)] if start is not None else None)
+    checkpoint.set_chapter_pages(pages)
+    return run_id
+
+def new_processing_state() -> dict:
+    """Начальное состояние обработки"""
+    return {
+        "status": "idle",
+        "job_id": None,
+        "priority": 0,
+        "weight": 1.0,
+        "progress": 0,
+        "current_chapter": 0,
+        "total_chapters": 0,
+        "preview_text": "",
+        "error_message": None,
+        "peak_rss_mb": None,
+        "tokens_total": 0,
+        "tokens_done": 0,
+        "eta_seconds": None,
+        "metrics": {}
+    }
+
+def get_library() -> Library:
+    """Библиотека документов (по умолчанию output_dir/library.sqlite3)"""
+    global library
+    path = Path(config.get("library_path") or Path(config["output_dir"]) / "library.sqlite3")
+    if library is None or library.db_path != path:
+        if library is not None:
+            library.close()
+        library = Library(path)
+    return library
+
+def get_scheduler() -> FairScheduler:
+    """Планировщик запросов к LLM; число слотов и политика берутся из текущего конфига"""
+    scheduler.configure(
+        config.get("llm_slots", 0) or 1,
+        config.get("scheduler_policy", "fair"),
+        config.get("scheduler_anticipation", 2.0)
+    )
+    return scheduler
+
+def get_extraction_sandbox() -> Optional[ExtractionSandbox]:
+    """Песочница извлечения с ограничениями из текущего конфига (None, если выключена)"""
+    global extraction_sandbox
+    if not config.get("extraction_sandbox", True):
+        return None
+    if extraction_sandbox is None:
+        extraction_sandbox = ExtractionSandbox()
+    extraction_sandbox.configure_from(config)
+    return extraction_sandbox
+
+def get_broker() -> TaskBroker:
+    """Очередь задач воркеров (по умолчанию output_dir/queue.sqlite3)"""
+    global broker
+    if broker is None:
+        # Воркеры могут ходить в очередь через HTTP, но сам API работает с ней напрямую
+        broker_config = config
+        if config.get("task_broker", "sqlite") == "http":
+            broker_config = {**config, "task_broker": "sqlite"}
+        created = create_broker(broker_config)
+        if not isinstance(created, TaskBroker):
+            raise Exception(f"Брокер {type(created).__name__} не поддерживает методы API (нужен наследник TaskBroker)")
+        broker = created
+    return broker
+
+def set_job_status(checkpoint: JobCheckpoint, run_id: int, status: str, error_message: Optional[str] = None):
+    """Статус задачи в чекпоинте и в библиотеке"""
+    checkpoint.set_status(status, error_message)
+    get_library().set_run_status(run_id, status, error_message)
+
+def get_jobs_dir() -> Path:
+    """Каталог с чекпоинтами задач"""
+    return Path(config["output_dir"]) / ".jobs"
+
+def job_summary_path(checkpoint: JobCheckpoint) -> Path:
+    """Итоговый конспект задачи (.jobs/<job_id>/summary.md)"""
+    return checkpoint.job_dir / "summary.md"
+
+def job_log_path(checkpoint: JobCheckpoint) -> Path:
+    """Лог генерации задачи (у каждой свой: задачи выполняются одновременно)"""
+    return checkpoint.job_dir / "generation_log.md"
+
+def new_tracer(job_id: str) -> Tracer:
+    """Трассировщик задачи (включается параметром tracing_enabled)"""
+    return Tracer(enabled=config.get("tracing_enabled", False), job_id=job_id)
+
+def export_trace(tracer: Tracer):
+    """Сохранение трассы задачи в output_dir/traces/<job_id>.json"""
+    path = tracer.export(Path(config["output_dir"]) / "traces" / f"{tracer.job_id}.json")
+    if path:
+        print(f"Трасса сохранена в {path}")
+
+def new_lm_client(tracer: Tracer) -> LMStudioClient:
+    """Клиент LM Studio для одной задачи"""
     lm_client = LMStudioClient(
         base_url=config.get("lm_studio_url", "http://localhost:1234"),
-        model_name=config.get("lm_studio_model", "local-model")
+        model_name=config.get("lm_studio_model", "local-model"),
+        tracer=tracer,
+        prompt_cache=config.get("prompt_cache", True),
+        slot_count=config.get("llm_slots", 0),
+        routes=config.get("model_routes")
     )
+    lm_client.throughput = llm_throughput
+    lm_client.model_stats = model_stats
+    return lm_client
+
+def warm_up_client(lm_client: LMStudioClient) -> Optional[asyncio.Task]:
+    """Фоновый прогрев модели и keep-alive на время ожидания задачи"""
+    if config.get("distributed_mode", False):
+        return None
+    lm_client.start_keep_alive(config.get("keep_alive_interval", 0))
+    if not config.get("warm_up", True):
+        return None
+    return asyncio.create_task(lm_client.warm_up_async())
+
+def start_job(
+    checkpoint: JobCheckpoint,
+    tracer: Optional[Tracer] = None,
+    lm_client: Optional[LMStudioClient] = None,
+    warmup: Optional[asyncio.Task] = None,
+    state: Optional[dict] = None
+):
+    """Запуск (или продолжение) обработки задачи в фоне"""
+    global processing_state
+    
+    tracer = tracer or new_tracer(checkpoint.job_id)
+    if lm_client is None:
+        lm_client = new_lm_client(tracer)
+        warmup = warm_up_client(lm_client)
+    
+    state = state if state is not None else new_processing_state()
+    state["status"] = "processing"
+    state["job_id"] = checkpoint.job_id
+    state["priority"], state["weight"] = checkpoint.scheduling()
+    state["total_chapters"] = len(checkpoint.selected_chapters())
+    jobs[checkpoint.job_id] = state
+    processing_state = state
+    run_id = get_library().run_for_checkpoint(checkpoint)
+    set_job_status(checkpoint, run_id, "processing")
+    
+    # Каждый запрос к LLM ждет своей очереди среди запросов всех задач
+    job_id = checkpoint.job_id
+    lm_client.request_gate = lambda tokens: get_scheduler().turn(job_id, tokens)
+    
+    chapters = checkpoint.load_chapters()
+    task = asyncio.create_task(process_chapters(chapters, checkpoint, run_id, tracer, lm_client, state, warmup))
+    active_jobs[checkpoint.job_id] = {"task": task, "lm_client": lm_client}
+
+def update_progress(state: dict, tokens_done: float, throughput: ThroughputTracker, parallelism: int = 1):
+    """Прогресс по обработанным входным токенам и ETA по измеренной скорости"""
+    total = state["tokens_total"]
+    remaining = max(0, total - tokens_done)
+    state["tokens_done"] = int(tokens_done)
+    state["progress"] = min(99, int(tokens_done / total * 100)) if total else 0
+    # Одновременные задачи делят сервер: до конца задачи он обработает и часть их токенов
+    work = remaining
+    share = scheduler.jobs.get(state["job_id"])
+    if share is not None:
+        share.remaining_tokens = remaining
+        work = scheduler.work_before_done(state["job_id"])
+    eta = throughput.eta_seconds(work)
+    state["eta_seconds"] = round(eta / max(1, parallelism)) if eta is not None else None
+    state["metrics"].update(throughput.to_dict())
+
+def format_chapter(idx: int, summary: str) -> str:
+    return f"## Глава {idx + 1}\n\n{summary}\n\n"
+
+async def process_chapters(
+    chapters: list,
+    checkpoint: JobCheckpoint,
+    run_id: int,
+    tracer: Tracer,
+    lm_client: LMStudioClient,
+    state: dict,
+    warmup: Optional[asyncio.Task] = None
+):
+    """Асинхронная обработка глав через LM Studio с очередью для оптимизации VRAM"""
+    try:
+        # Время прогрева учитывается отдельно от обработки глав
+        if warmup is not None:
+            try:
+                state["metrics"]["warmup_seconds"] = round(await warmup, 2)
+            except JobCancelledError:
+                raise
+            except Exception as e:
+                print(f"[WARNING] Прогрев модели не удался: {e}")
+        
+        if config.get("distributed_mode", False):
+            await run_chapters_distributed(chapters, checkpoint, run_id, tracer, state)
+        else:
+            await run_chapters(chapters, checkpoint, run_id, tracer, lm_client, state)
+    except (JobCancelledError, asyncio.CancelledError):
+        # Готовые главы и чанки остаются в чекпоинте, незавершенный запрос отбрасывается
+        if config.get("distributed_mode", False):
+            get_broker().cancel_job(checkpoint.job_id)
+        state["status"] = "cancelled"
+        state["peak_rss_mb"] = rss_monitor.peak_mb
+        set_job_status(checkpoint, run_id, "cancelled")
+        print(f"Задача {checkpoint.job_id} отменена")
+        export_trace(tracer)
+    finally:
+        if warmup is not None and not warmup.done():
+            warmup.cancel()
+        await lm_client.stop_keep_alive()
+        share = scheduler.unregister(checkpoint.job_id)
+        if share is not None and share.turns:
+            state["metrics"]["queue_wait"] = share.to_dict()
+        release_job(checkpoint.job_id)
+
+def next_pack(pos: int, selected: list, chapters: list, checkpoint: JobCheckpoint, library: Library, settings: str) -> list:
+    """
+    Главы, которые конспектируются одним запросом вместе с selected[pos]
+    
+    В пачку идут следующие по порядку небольшие главы, еще не готовые ни в
+    чекпоинте, ни в кеше библиотеки; готовая глава прерывает пачку.
+    """
+    max_chapters = config.get("pack_max_chapters", DEFAULT_PACK_MAX_CHAPTERS)
+    candidates = [selected[pos]]
+    for idx in selected[pos + 1:pos + max_chapters]:
+        if (
+            checkpoint.chapter_summary(idx) is not None or checkpoint.chunk_summaries(idx)
+            or library.cached_summary(chapters[idx], settings) is not None
+        ):
+            break
+        candidates.append(idx)
+    packs = plan_packs(
+        [len(chapters[idx]) for idx in candidates],
+        config.get("max_chunk_size", 15000),
+        config.get("pack_chapter_chars", DEFAULT_PACK_CHAPTER_CHARS),
+        max_chapters
+    )
+    return [candidates[p] for p in packs[0]]
+
+async def run_chapters(
+    chapters: list,
+    checkpoint: JobCheckpoint,
+    run_id: int,
+    tracer: Tracer,
+    lm_client: LMStudioClient,
+    state: dict
+):
+    """Последовательная генерация конспектов глав с сохранением прогресса"""
+    log_file = job_log_path(checkpoint)
     
     summaries = []
     max_chunk_size = config.get("max_chunk_size", 15000)
+    chunk_overlap = config.get("chunk_overlap", 0)
+    library = get_library()
+    settings = settings_hash(config)
     
-    # Очередь запросов - обрабатываем по одному для экономии VRAM
-    for idx, chapter in enumerate(chapters):
-        try:
-            processing_state["current_chapter"] = idx + 1
-            processing_state["progress"] = int((idx / len(chapters)) * 100)
-            
-            # Обработка главы через LM Studio
-            summary = await lm_client.process_chapter(chapter, max_chunk_size)
-            
-            summaries.append(f"## Глава {idx + 1}\n\n{summary}\n\n")
-            
-            # Обновление preview
-            processing_state["preview_text"] = "\n".join(summaries)
-            
-            # Запись в лог
-            with open(log_file, "a", encoding="utf-8") as f:
-                f.write(f"## Глава {idx + 1}\n\n{summary}\n\n")
+    # Быстрый режим: главы сжимаются экстрактивно перед отправкой в LLM
+    compression = None
+    if config.get("fast_mode", False):
+        if compression_available():
+            compression = CompressionStats(config.get("fast_mode_ratio", 0.4))
+        else:
+            print("[WARNING] Быстрый режим требует NumPy, главы отправляются целиком")
+    
+    # Сжатые главы пачки, которые после неразобранного ответа обрабатываются по одной
+    compressed = {}
+    
+    async def compress_chapter(member: int) -> str:
+        """Текст главы для LLM; каждая глава сжимается один раз"""
+        if compression is None:
+            return chapters[member]
+        if member not in compressed:
+            with tracer.span("compress", chapter=member, chars=len(chapters[member])):
+                loop = asyncio.get_event_loop()
+                compressed[member] = await loop.run_in_executor(None, compression.compress, chapters[member])
+            state["metrics"]["fast_mode"] = compression.to_dict(chars_per_token, lm_client.throughput)
+        return compressed[member]
+    
+    # Небольшие главы подряд конспектируются одним запросом (до первого неразобранного ответа)
+    pack_chapters = config.get("pack_chapters", True)
+    packing = {"packs": 0, "packed_chapters": 0, "fallbacks": 0}
+    
+    # Объем работы в оценочных входных токенах по главам
+    chars_per_token = config.get("chars_per_token", DEFAULT_CHARS_PER_TOKEN)
+    size_ratio = compression.ratio if compression else 1.0
+    chapter_tokens = [estimate_tokens(size * size_ratio, chars_per_token) for size in checkpoint.chapter_sizes()]
+    # Обрабатываются только выбранные главы (после /analyze - выбранные пользователем)
+    selected = checkpoint.selected_chapters()
+    state["tokens_total"] = sum(chapter_tokens[idx] for idx in selected)
+    
+    # Лог начинается заново; при возобновлении в него сразу попадают готовые главы
+    resume_pos = next((pos for pos, idx in enumerate(selected) if checkpoint.chapter_summary(idx) is None), len(selected))
+    for idx in selected[:resume_pos]:
+        summaries.append(format_chapter(idx, checkpoint.chapter_summary(idx)))
+    log_file.write_text("".join(summaries), encoding="utf-8")
+    state["preview_text"] = "\n".join(summaries)
+    tokens_done = sum(chapter_tokens[idx] for idx in selected[:resume_pos])
+    
+    # Оставшаяся работа задачи нужна планировщику (политика sjf и ETA при общем сервере)
+    priority, weight = checkpoint.scheduling()
+    get_scheduler().register(checkpoint.job_id, weight, priority, state["tokens_total"] - tokens_done)
+    
+    try:
+        # Очередь запросов - обрабатываем по одному для экономии VRAM
+        for pos in range(resume_pos, len(selected)):
+            idx = selected[pos]
+            chapter = chapters[idx]
+            state["current_chapter"] = pos + 1
+            update_progress(state, tokens_done, lm_client.throughput)
             
-            # Задержка между запросами для снижения нагрузки на GPU
-            await asyncio.sleep(0.5)
+            def on_chunk_done(chunk_idx, total, text, idx=idx, base=tokens_done):
+                checkpoint.mark_chunk_done(idx, chunk_idx, total, text)
+                library.save_chunk_summary(run_id, idx, chunk_idx, text)
+                update_progress(state, base + chapter_tokens[idx] * (chunk_idx + 1) / total, lm_client.throughput)
             
-        except Exception as e:
-            error_msg = str(e)
-            print(f"Ошибка обработки главы {idx + 1}: {error_msg}")
-            summaries.append(f"## Глава {idx + 1}\n\nОшибка обработки: {error_msg}\n\n")
+            # Глава могла быть завершена в предыдущем запуске (после ошибки в более ранней главе)
+            summary = checkpoint.chapter_summary(idx)
+            tokens_done += chapter_tokens[idx]
+            if summary is None:
+                # Глава с тем же текстом уже конспектировалась с теми же настройками
+                summary = library.cached_summary(chapter, settings)
+                if summary is not None:
+                    checkpoint.mark_chapter_done(idx, summary)
+                    library.save_chapter_summary(run_id, idx, chapter, summary, settings)
+            if summary is not None:
+                entry = format_chapter(idx, summary)
+                summaries.append(entry)
+                state["preview_text"] = "\n".join(summaries)
+                with tracer.span("write.log", chapter=idx), open(log_file, "a", encoding="utf-8") as f:
+                    f.write(entry)
+                continue
             
-            # Запись ошибки в лог
-            with open(log_file, "a", encoding="utf-8") as f:
-                f.write(f"## Глава {idx + 1}\n\nОшибка обработки: {error_msg}\n\n")
+            try:
+                # Пачка планируется по исходным размерам глав: сжатые тексты в нее тем более помещаются
+                packed = None
+                pack = next_pack(pos, selected, chapters, checkpoint, library, settings) if pack_chapters else [idx]
+                chapter = await compress_chapter(idx)
+                compressed.pop(idx, None)
+                if len(pack) > 1:
+                    texts = [chapter] + [await compress_chapter(other) for other in pack[1:]]
+                    with tracer.span("process_pack", chapter=idx, chapters=len(pack), chars=sum(map(len, texts))):
+                        packed = await lm_client.process_pack(texts, tags={"chapter": idx})
+                    if packed is None:
+                        # Модель не соблюдает разделы: дальше главы задачи идут по одной
+                        pack_chapters = False
+                        packing["fallbacks"] += 1
+                        print(f"[WARNING] Ответ на пачку глав {idx + 1}-{pack[-1] + 1} не разобран по разделам, "
+                              f"главы обрабатываются по одной")
+                    state["metrics"]["packing"] = packing
+                
+                if packed is not None:
+                    # Следующие главы пачки готовы: их записи добавят следующие итерации из чекпоинта
+                    packing["packs"] += 1
+                    packing["packed_chapters"] += len(pack)
+                    summary = packed[0]
+                    for other in pack[1:]:
+                        compressed.pop(other, None)
+                    with tracer.span("write.checkpoint", chapter=idx):
+                        for other, text in zip(pack, packed):
+                            checkpoint.mark_chapter_done(other, text)
+                            library.save_chapter_summary(run_id, other, chapters[other], text, settings)
+                else:
+                    # Обработка главы через LM Studio; каждый готовый чанк сразу сохраняется
+                    with tracer.span("process_chapter", chapter=idx, chars=len(chapter)):
+                        summary = await lm_client.process_chapter(
+                            chapter,
+                            max_chunk_size,
+                            chunk_overlap,
+                            done_chunks=checkpoint.chunk_summaries(idx),
+                            on_chunk_done=on_chunk_done,
+                            tags={"chapter": idx}
+                        )
+                    
+                    # Глава с ошибками в чанках остается незавершенной и будет повторена при возобновлении
+                    if checkpoint.is_chapter_complete(idx):
+                        with tracer.span("write.checkpoint", chapter=idx):
+                            checkpoint.mark_chapter_done(idx, summary)
+                            library.save_chapter_summary(run_id, idx, chapters[idx], summary, settings)
+                
+                entry = format_chapter(idx, summary)
+                summaries.append(entry)
+                
+                # Обновление preview
+                state["preview_text"] = "\n".join(summaries)
+                
+                # Запись в лог
+                with tracer.span("write.log", chapter=idx), open(log_file, "a", encoding="utf-8") as f:
+                    f.write(entry)
+                
+                # Задержка между запросами для снижения нагрузки на GPU
+                await asyncio.sleep(0.5)
+                
+            except JobCancelledError:
+                raise
+            except Exception as e:
+                error_msg = str(e)
+                print(f"Ошибка обработки главы {idx + 1}: {error_msg}")
+                summaries.append(f"## Глава {idx + 1}\n\nОшибка обработки: {error_msg}\n\n")
+                
+                # Запись ошибки в лог
+                with open(log_file, "a", encoding="utf-8") as f:
+                    f.write(f"## Глава {idx + 1}\n\nОшибка обработки: {error_msg}\n\n")
+    except JobCancelledError:
+        raise
+    except Exception as e:
+        state["status"] = "error"
+        state["error_message"] = str(e)
+        state["peak_rss_mb"] = rss_monitor.peak_mb
+        set_job_status(checkpoint, run_id, "error", str(e))
+        export_trace(tracer)
+        return
     
-    # Сохранение финального результата
+    if compression is not None:
+        report = compression.to_dict(chars_per_token, lm_client.throughput)
+        state["metrics"]["fast_mode"] = report
+        print(f"Быстрый режим: сэкономлено ~{report['tokens_saved']} токенов "
+              f"({report['chars_in']} -> {report['chars_out']} симв.), "
+              f"сжатие {report['compress_seconds']} с, выигрыш ~{report['estimated_seconds_saved']} с")
+    finish_job(summaries, checkpoint, run_id, tracer, state)
+
+def finish_job(summaries: list, checkpoint: JobCheckpoint, run_id: int, tracer: Tracer, state: dict):
+    """Сохранение финального конспекта и статуса задачи"""
     final_text = "\n".join(summaries)
-    output_file = output_dir / "summary.md"
-    output_file.write_text(final_text, encoding="utf-8")
+    output_file = job_summary_path(checkpoint)
+    with tracer.span("write.summary", chars=len(final_text)):
+        output_file.write_text(final_text, encoding="utf-8")
+    
+    # Главы с ошибками можно догенерировать через /jobs/{job_id}/resume
+    if checkpoint.first_unfinished() is None:
+        set_job_status(checkpoint, run_id, "completed")
+    else:
+        set_job_status(checkpoint, run_id, "error", "Не все главы обработаны успешно")
+    
+    state["status"] = "completed"
+    state["progress"] = 100
+    state["tokens_done"] = state["tokens_total"]
+    state["eta_seconds"] = 0
+    state["current_chapter"] = state["total_chapters"]
+    state["preview_text"] = final_text
+    state["peak_rss_mb"] = rss_monitor.peak_mb
+    if rss_monitor.peak_mb is not None:
+        print(f"Пиковое потребление памяти за задачу: {rss_monitor.peak_mb:.0f} МБ")
+    export_trace(tracer)
+
+async def run_chapters_distributed(chapters: list, checkpoint: JobCheckpoint, run_id: int, tracer: Tracer, state: dict):
+    """
+    Генерация конспектов воркерами через очередь задач
+    
+    Незавершенные главы (с уже готовыми чанками) ставятся в очередь, API
+    опрашивает очередь и сохраняет результаты в чекпоинт и библиотеку
+    по мере готовности в любом порядке.
+    """
+    log_file = job_log_path(checkpoint)
+    library = get_library()
+    settings = settings_hash(config)
+    queue = get_broker()
+    loop = asyncio.get_event_loop()
+    job_id = checkpoint.job_id
+    
+    chars_per_token = config.get("chars_per_token", DEFAULT_CHARS_PER_TOKEN)
+    size_ratio = config.get("fast_mode_ratio", 0.4) if config.get("fast_mode", False) else 1.0
+    chapter_tokens = [estimate_tokens(size * size_ratio, chars_per_token) for size in checkpoint.chapter_sizes()]
+    selected = checkpoint.selected_chapters()
+    state["tokens_total"] = sum(chapter_tokens[idx] for idx in selected)
+    
+    entries = {}
+    pending = []
+    for idx in selected:
+        chapter = chapters[idx]
+        summary = checkpoint.chapter_summary(idx)
+        if summary is None:
+            summary = library.cached_summary(chapter, settings)
+            if summary is not None:
+                checkpoint.mark_chapter_done(idx, summary)
+                library.save_chapter_summary(run_id, idx, chapter, summary, settings)
+        if summary is None:
+            pending.append(idx)
+        else:
+            entries[idx] = format_chapter(idx, summary)
+    log_file.write_text("".join(entries[idx] for idx in sorted(entries)), encoding="utf-8")
+    state["preview_text"] = "\n".join(entries[idx] for idx in sorted(entries))
+    
+    tasks = [
+        {"chapter_idx": idx, "text": chapters[idx], "chunks": checkpoint.chunk_summaries(idx)}
+        for idx in pending
+    ]
+    task_settings = {
+        "max_chunk_size": config.get("max_chunk_size", 15000),
+        "chunk_overlap": config.get("chunk_overlap", 0),
+        "fast_mode": config.get("fast_mode", False),
+        "fast_mode_ratio": config.get("fast_mode_ratio", 0.4)
+    }
+    try:
+        with tracer.span("queue.submit", chapters=len(tasks)):
+            priority, weight = checkpoint.scheduling()
+            await loop.run_in_executor(None, queue.submit, job_id, tasks, task_settings, priority, weight)
+        print(f"В очередь поставлено глав: {len(tasks)}")
+        
+        pending = set(pending)
+        while pending:
+            await asyncio.sleep(config.get("queue_poll_interval", 1.0))
+            for result in await loop.run_in_executor(None, queue.finished, job_id):
+                idx = result["chapter_idx"]
+                if idx not in pending:
+                    continue
+                pending.discard(idx)
+                # Готовые чанки сохраняются и для неудавшихся глав: возобновление их не повторит
+                for chunk_idx, text in result["chunks"].items():
+                    checkpoint.mark_chunk_done(idx, chunk_idx, result["chunks_total"], text)
+                    library.save_chunk_summary(run_id, idx, chunk_idx, text)
+                if result["status"] == "done":
+                    checkpoint.mark_chapter_done(idx, result["result"])
+                    library.save_chapter_summary(run_id, idx, chapters[idx], result["result"], settings)
+                    entry = format_chapter(idx, result["result"])
+                    if result["stats"]:
+                        llm_throughput.record(**result["stats"])
+                else:
+                    print(f"Ошибка обработки главы {idx + 1}: {result['error']}")
+                    entry = f"## Глава {idx + 1}\n\nОшибка обработки: {result['error']}\n\n"
+                entries[idx] = entry
+                with tracer.span("write.log", chapter=idx), open(log_file, "a", encoding="utf-8") as f:
+                    f.write(entry)
+                state["preview_text"] = "\n".join(entries[i] for i in sorted(entries))
+            
+            partial = await loop.run_in_executor(None, queue.progress, job_id)
+            workers = await loop.run_in_executor(None, queue.active_workers, config.get("lease_seconds", 60))
+            tokens_done = sum(chapter_tokens[idx] for idx in selected if idx not in pending)
+            tokens_done += sum(chapter_tokens[idx] * done / total for idx, (done, total) in partial.items() if total)
+            state["current_chapter"] = len(selected) - len(pending)
+            state["metrics"]["workers"] = workers
+            update_progress(state, tokens_done, llm_throughput, workers)
+        
+        await loop.run_in_executor(None, queue.clear_job, job_id)
+    except Exception as e:
+        state["status"] = "error"
+        state["error_message"] = str(e)
+        state["peak_rss_mb"] = rss_monitor.peak_mb
+        set_job_status(checkpoint, run_id, "error", str(e))
+        export_trace(tracer)
+        return
+    
+    finish_job([entries[idx] for idx in sorted(entries)], checkpoint, run_id, tracer, state)
+
+@app.post("/analyze")
+async def analyze_pdf(file: UploadFile = File(...)):
+    """
+    Анализ PDF без генерации: индекс глав с оценкой объема и времени
+    
+    Главы для конспектирования выбираются затем через /jobs/{job_id}/summarize.
+    """
+    if not file.filename.endswith('.pdf'):
+        raise HTTPException(status_code=400, detail="Файл должен быть в формате PDF")
+    
+    try:
+        pdf_path, document_id = await save_upload(file)
+        checkpoint = JobCheckpoint(get_jobs_dir(), document_id[:16])
+        # Индекс уже проанализированного (или обработанного) документа переиспользуется
+        if not (checkpoint.exists() and checkpoint.is_compatible(config)):
+            if checkpoint.job_id in active_jobs:
+                raise HTTPException(status_code=409, detail="Документ уже обрабатывается")
+            async with get_extraction_lock():
+                chapters = await extract_chapters(pdf_path, document_id, new_tracer(checkpoint.job_id))
+                if not chapters:
+                    raise HTTPException(status_code=500, detail="Не удалось извлечь текст из PDF")
+                run_id = await create_checkpoint(checkpoint, chapters, file.filename, document_id)
+            set_job_status(checkpoint, run_id, "analyzed")
+        return chapter_index(checkpoint)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+def chapter_index(checkpoint: JobCheckpoint) -> dict:
+    """Главы задачи с размером, оценкой токенов и времени генерации"""
+    library = get_library()
+    run_id = library.run_for_checkpoint(checkpoint)
+    cached = library.cached_chapters(run_id, settings_hash(config))
+    chars_per_token = config.get("chars_per_token", DEFAULT_CHARS_PER_TOKEN)
+    size_ratio = config.get("fast_mode_ratio", 0.4) if config.get("fast_mode", False) else 1.0
+    pages = checkpoint.chapter_pages() or []
+    selected = set(checkpoint.selected_chapters())
+    
+    chapters = []
+    for row in library.run_chapters(run_id):
+        idx = row["idx"]
+        done = checkpoint.chapter_summary(idx) is not None or idx in cached
+        tokens = estimate_tokens(row["chars"] * size_ratio, chars_per_token)
+        # Время - по скорости последних запросов к LLM (None, пока запросов не было)
+        seconds = llm_throughput.eta_seconds(tokens) if not done else 0
+        chapters.append({
+            "idx": idx,
+            "title": row["title"],
+            "chars": row["chars"],
+            "estimated_tokens": tokens,
+            "estimated_seconds": round(seconds) if seconds is not None else None,
+            "pages": pages[idx] if idx < len(pages) else None,
+            "done": done,
+            "selected": idx in selected
+        })
+    
+    pending_tokens = sum(ch["estimated_tokens"] for ch in chapters if not ch["done"])
+    total_seconds = llm_throughput.eta_seconds(pending_tokens)
+    return {
+        "job_id": checkpoint.job_id,
+        "document_id": checkpoint.state.get("document_id"),
+        "source_name": checkpoint.state.get("source_name"),
+        "status": checkpoint.status,
+        "total_chapters": len(chapters),
+        "estimated_tokens": pending_tokens,
+        "estimated_seconds": round(total_seconds) if total_seconds is not None else None,
+        "chapters": chapters
+    }
+
+def parse_page_ranges(spec: str) -> list:
+    """Диапазоны страниц вида "1-20, 35, 40-45" -> [(1, 20), (35, 35), (40, 45)]"""
+    ranges = []
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        start, _, end = part.partition("-")
+        try:
+            start, end = int(start), int(end or start)
+        except ValueError:
+            raise HTTPException(status_code=400, detail=f"Неверный диапазон страниц: {part}")
+        if start < 1 or end < start:
+            raise HTTPException(status_code=400, detail=f"Неверный диапазон страниц: {part}")
+        ranges.append((start, end))
+    return ranges
+
+def select_chapters(checkpoint: JobCheckpoint, request: dict) -> Optional[list]:
+    """Индексы глав по списку chapters и диапазонам страниц pages (None - все главы)"""
+    indices = request.get("chapters")
+    page_spec = request.get("pages")
+    if indices is None and not page_spec:
+        return None
+    total = checkpoint.state["total_chapters"]
+    selected = set()
+    for idx in indices or []:
+        if not isinstance(idx, int) or not 0 <= idx < total:
+            raise HTTPException(status_code=400, detail=f"Нет главы с индексом {idx}")
+        selected.add(idx)
+    if page_spec:
+        ranges = parse_page_ranges(page_spec)
+        # Выбираются главы, пересекающиеся с диапазонами; главы без известных страниц пропускаются
+        for idx, pages in enumerate(checkpoint.chapter_pages() or []):
+            if pages and any(start <= pages[1] and pages[0] <= end for start, end in ranges):
+                selected.add(idx)
+    return sorted(selected)
+
+@app.post("/jobs/{job_id}/summarize")
+async def summarize_job(job_id: str, request: dict):
+    """
+    Конспектирование выбранных глав проанализированного документа
+    
+    Тело: {"chapters": [0, 2, 5], "pages": "10-40, 55"} - индексы глав из /analyze
+    и/или диапазоны страниц; без обоих полей обрабатываются все главы.
+    Необязательные priority и weight задают место задачи в очереди к LLM.
+    """
+    if job_id in active_jobs:
+        raise HTTPException(status_code=409, detail="Задача уже выполняется")
+    check_job_capacity()
+    
+    checkpoint = JobCheckpoint(get_jobs_dir(), job_id)
+    if not checkpoint.exists():
+        raise HTTPException(status_code=404, detail="Задача не найдена")
+    if not checkpoint.is_compatible(config):
+        raise HTTPException(status_code=409, detail="Конфигурация изменилась с момента анализа, загрузите PDF заново")
+    
+    indices = select_chapters(checkpoint, request)
+    if indices is not None and not indices:
+        raise HTTPException(status_code=400, detail="Не выбрано ни одной главы")
     
-    processing_state["status"] = "completed"
-    processing_state["progress"] = 100
-    processing_state["current_chapter"] = processing_state["total_chapters"]
-    processing_state["preview_text"] = final_text
+    llm_error = await check_llm_ready()
+    if llm_error:
+        raise HTTPException(status_code=503, detail=llm_error)
+    
+    checkpoint.select(indices)
+    priority, weight = checkpoint.scheduling()
+    checkpoint.set_scheduling(request.get("priority", priority), request.get("weight", weight))
+    reset_rss_monitor()
+    start_job(checkpoint)
+    return {
+        "success": True,
+        "job_id": job_id,
+        "selected_chapters": len(checkpoint.selected_chapters())
+    }
+
+@app.get("/jobs")
+async def list_jobs():
+    """Список сохраненных задач"""
+    return [checkpoint.to_dict() for checkpoint in list_checkpoints(get_jobs_dir())]
+
+@app.post("/jobs/{job_id}/resume")
+async def resume_job(job_id: str, priority: Optional[int] = None, weight: Optional[float] = None):
+    """Продолжение прерванной или завершившейся с ошибкой задачи без повторного извлечения PDF"""
+    if job_id in active_jobs:
+        raise HTTPException(status_code=409, detail="Задача уже выполняется")
+    check_job_capacity()
+    
+    checkpoint = JobCheckpoint(get_jobs_dir(), job_id)
+    if not checkpoint.exists():
+        raise HTTPException(status_code=404, detail="Задача не найдена")
+    if not checkpoint.is_compatible(config):
+        raise HTTPException(status_code=409, detail="Конфигурация изменилась с момента запуска задачи, загрузите PDF заново")
+    
+    resume_from = checkpoint.first_unfinished()
+    if priority is not None or weight is not None:
+        saved_priority, saved_weight = checkpoint.scheduling()
+        checkpoint.set_scheduling(
+            priority if priority is not None else saved_priority,
+            weight if weight is not None else saved_weight
+        )
+    reset_rss_monitor()
+    start_job(checkpoint)
+    return {
+        "success": True,
+        "job_id": job_id,
+        "resume_from_chapter": (resume_from if resume_from is not None else checkpoint.state["total_chapters"]) + 1
+    }
+
+@app.post("/jobs/{job_id}/cancel")
+async def cancel_job(job_id: str, discard: bool = False):
+    """
+    Отмена выполняющейся задачи
+    
+    Новые чанки больше не отправляются, активный запрос к LM Studio
+    прерывается закрытием соединения. Готовые главы сохраняются в чекпоинте
+    (задачу можно продолжить через /jobs/{job_id}/resume), если не указан discard.
+    
+    Каталог задачи при discard удаляет сама задача, когда остановится: пока она
+    не остановилась (не истек cancel_timeout или еще извлекается текст),
+    ответ содержит discarded: false, и каталог удаляется позже.
+    """
+    job = active_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Задача не выполняется")
+    
+    if discard:
+        job["discard"] = True
+    job["lm_client"].cancel()
+    task = job["task"]
+    if task is not None:
+        task.cancel()
+        done, _ = await asyncio.wait({task}, timeout=config.get("cancel_timeout", 10))
+        stopped = bool(done)
+    else:
+        # Текст еще извлекается: /upload завершит задачу сразу после извлечения
+        jobs[job_id]["status"] = "cancelled"
+        stopped = False
+    
+    return {"success": True, "job_id": job_id, "stopped": stopped, "discarded": discard and stopped}
+
+@app.get("/jobs/{job_id}/summary")
+async def job_summary(job_id: str):
+    """Конспект последнего запуска задачи из библиотеки (готовые главы)"""
+    run = get_library().latest_run(job_id)
+    if run is None:
+        raise HTTPException(status_code=404, detail="Задача не найдена")
+    chapters = get_library().run_chapters(run["id"])
+    return {
+        "job_id": job_id,
+        "run_id": run["id"],
+        "status": run["status"],
+        "chapters": [{"idx": ch["idx"], "title": ch["title"], "chars": ch["chars"]} for ch in chapters],
+        "summary": "\n".join(format_chapter(ch["idx"], ch["summary"]) for ch in chapters if ch["summary"] is not None)
+    }
+
+@app.get("/library/documents")
+async def library_documents(limit: int = 100, offset: int = 0):
+    """Документы библиотеки с состоянием последнего запуска"""
+    return get_library().list_documents(limit, offset)
+
+@app.get("/library/documents/{document_id}")
+async def library_document(document_id: str):
+    """Документ и история его запусков"""
+    document = get_library().get_document(document_id)
+    if document is None:
+        raise HTTPException(status_code=404, detail="Документ не найден")
+    return document
+
+@app.get("/search")
+async def search(q: str, limit: int = 20, scope: str = "all"):
+    """
+    Полнотекстовый поиск по главам всех документов библиотеки
+
+    scope: all - конспекты и исходный текст глав, summary - только конспекты,
+    source - только исходный текст
+    """
+    if scope not in SEARCH_SCOPES:
+        raise HTTPException(status_code=400, detail=f"scope: одно из {', '.join(SEARCH_SCOPES)}")
+    started = time.perf_counter()
+    hits = get_library().search(q, limit, scope)
+    return {
+        "query": q,
+        "scope": scope,
+        "took_ms": round((time.perf_counter() - started) * 1000, 1),
+        "hits": hits
+    }
+
+# Очередь задач для воркеров на других машинах (worker.py --api-url).
+# Обработчики синхронные: FastAPI выполняет их в пуле потоков, SQLite не блокирует event loop
+
+@app.post("/queue/lease")
+def queue_lease(request: dict):
+    """Аренда следующей главы из очереди (null, если очередь пуста)"""
+    return get_broker().lease(request["worker_id"], request.get("lease_seconds", config.get("lease_seconds", 60)))
+
+@app.post("/queue/{task_id}/heartbeat")
+def queue_heartbeat(task_id: int, request: dict):
+    ok = get_broker().heartbeat(task_id, request["worker_id"], request.get("lease_seconds", config.get("lease_seconds", 60)))
+    return {"ok": ok}
+
+@app.post("/queue/{task_id}/chunk")
+def queue_chunk(task_id: int, request: dict):
+    ok = get_broker().save_chunk(task_id, request["worker_id"], request["chunk_idx"], request["total"], request["summary"])
+    return {"ok": ok}
+
+@app.post("/queue/{task_id}/complete")
+def queue_complete(task_id: int, request: dict):
+    return {"ok": get_broker().complete(task_id, request["worker_id"], request["summary"], request.get("stats"))}
+
+@app.post("/queue/{task_id}/fail")
+def queue_fail(task_id: int, request: dict):
+    ok = get_broker().fail(task_id, request["worker_id"], request["error"], request.get("max_attempts", config.get("task_max_attempts", 3)))
+    return {"ok": ok}
 
 @app.get("/download-docx")
-async def download_docx():
-    """Конвертация Markdown в DOCX через Pandoc"""
-    output_dir = Path(config["output_dir"])
-    md_file = output_dir / "summary.md"
-    docx_file = output_dir / "summary.docx"
+async def download_docx(job_id: Optional[str] = None):
+    """Конспект задачи в DOCX (по умолчанию - последней запущенной задачи)"""
+    job_id = job_id or processing_state.get("job_id")
+    if not job_id:
+        raise HTTPException(status_code=404, detail="Задача не указана")
+    return await job_docx(job_id)
+
+@app.get("/jobs/{job_id}/download-docx")
+async def job_docx(job_id: str):
+    """Конвертация конспекта задачи в DOCX (встроенный рендерер или Pandoc) с кешированием"""
+    md_file = job_summary_path(JobCheckpoint(get_jobs_dir(), job_id))
+    cache_dir = Path(config["output_dir"]) / ".docx_cache"
+    backend = config.get("docx_backend", "native")
     
     if not md_file.exists():
-        raise HTTPException(status_code=404, detail="Файл summary.md не найден")
+        raise HTTPException(status_code=404, detail="Конспект задачи не найден")
     
     try:
-        # Конвертация через Pandoc
-        result = subprocess.run(
-            ["pandoc", str(md_file), "-o", str(docx_file)],
-            check=True,
-            capture_output=True,
-            text=True
+        # Конвертация в пуле потоков, чтобы не блокировать event loop
+        loop = asyncio.get_event_loop()
+        docx_file = await loop.run_in_executor(
+            None, render_docx_cached, md_file, cache_dir, backend
         )
         
-        if docx_file.exists():
-            return FileResponse(
-                path=str(docx_file),
-                filename="summary.docx",
-                media_type="application/vnd.openxmlformats-officedocument.wordprocessingml.document"
-            )
-        else:
-            raise HTTPException(status_code=500, detail="Ошибка конвертации")
+        return FileResponse(
+            path=str(docx_file),
+            filename="summary.docx",
+            media_type="application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+        )
             
     except subprocess.CalledProcessError as e:
         raise HTTPException(status_code=500, detail=f"Ошибка Pandoc: {e.stderr}")
-    except FileNotFoundError:
+    except PandocNotFoundError:
         raise HTTPException(status_code=500, detail="Pandoc не установлен")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Ошибка конвертации: {e}")
 
 @app.get("/config")
 async def get_config():
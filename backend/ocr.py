@@ -0,0 +1,115 @@
+"""
+Распознавание текста на сканированных страницах PDF.
+
+OCR выполняется только для страниц без текстового слоя: страницы
+растеризуются и распознаются локальным Tesseract в пуле процессов.
+Результаты кешируются по хешу изображения страницы, поэтому повторная
+обработка того же PDF не запускает распознавание заново.
+"""
+import hashlib
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import pdfplumber
+
+try:
+    import pytesseract
+except ImportError:  # OCR необязателен
+    pytesseract = None
+
+
+# Страниц в одной задаче пула: PDF открывается один раз на пачку
+PAGES_PER_TASK = 4
+
+
+def ocr_available(tesseract_cmd: Optional[str] = None) -> bool:
+    """Установлены ли pytesseract и исполняемый файл Tesseract"""
+    if pytesseract is None:
+        return False
+    if tesseract_cmd:
+        pytesseract.pytesseract.tesseract_cmd = tesseract_cmd
+    try:
+        pytesseract.get_tesseract_version()
+        return True
+    except Exception:
+        return False
+
+
+def _image_hash(image, lang: str) -> str:
+    digest = hashlib.sha256()
+    digest.update(f"{image.mode}:{image.size}:{lang}:".encode())
+    digest.update(image.tobytes())
+    return digest.hexdigest()
+
+
+def _ocr_batch(
+    pdf_path: str,
+    page_indices: List[int],
+    resolution: int,
+    lang: str,
+    cache_dir: str,
+    tesseract_cmd: Optional[str]
+) -> Dict[int, str]:
+    """Растеризация и распознавание пачки страниц (выполняется в процессе пула)"""
+    if tesseract_cmd:
+        pytesseract.pytesseract.tesseract_cmd = tesseract_cmd
+    cache = Path(cache_dir)
+    results = {}
+    with pdfplumber.open(pdf_path) as pdf:
+        for idx in page_indices:
+            page = pdf.pages[idx]
+            image = page.to_image(resolution=resolution).original
+            page.flush_cache()
+            key = _image_hash(image, lang)
+            cached = cache / f"{key}.txt"
+            if cached.exists():
+                results[idx] = cached.read_text(encoding="utf-8")
+                continue
+            text = pytesseract.image_to_string(image, lang=lang)
+            tmp_path = cache / f"{key}.{os.getpid()}.tmp"
+            tmp_path.write_text(text, encoding="utf-8")
+            os.replace(tmp_path, cached)
+            results[idx] = text
+    return results
+
+
+def ocr_pages(pdf_path: str, page_indices: List[int], config: dict, cache_dir: Path) -> Dict[int, str]:
+    """
+    Распознавание указанных страниц PDF
+
+    Args:
+        pdf_path: Путь к PDF
+        page_indices: Номера страниц (с нуля) без текстового слоя
+        config: Конфигурация (ocr_languages, ocr_workers, ocr_resolution, tesseract_cmd)
+        cache_dir: Каталог кеша распознанных страниц
+
+    Returns:
+        Словарь {номер страницы: распознанный текст}
+    """
+    if not page_indices:
+        return {}
+    cache_dir = Path(cache_dir)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+
+    lang = config.get("ocr_languages", "rus+eng")
+    resolution = config.get("ocr_resolution", 300)
+    tesseract_cmd = config.get("tesseract_cmd")
+    workers = config.get("ocr_workers") or os.cpu_count() or 1
+
+    batches = [page_indices[i:i + PAGES_PER_TASK] for i in range(0, len(page_indices), PAGES_PER_TASK)]
+    results: Dict[int, str] = {}
+    if len(batches) == 1 or workers == 1:
+        for batch in batches:
+            results.update(_ocr_batch(pdf_path, batch, resolution, lang, str(cache_dir), tesseract_cmd))
+        return results
+
+    with ProcessPoolExecutor(max_workers=min(workers, len(batches))) as pool:
+        futures = [
+            pool.submit(_ocr_batch, pdf_path, batch, resolution, lang, str(cache_dir), tesseract_cmd)
+            for batch in batches
+        ]
+        for future in futures:
+            results.update(future.result())
+    return results
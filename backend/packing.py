@@ -0,0 +1,105 @@
+"""
+Упаковка небольших глав в один запрос к LLM.
+
+Книга, нарезанная на десятки разделов по 1-3 KB, платит за каждый полный
+запрос: обработку промпта, генерацию и паузу между запросами. Подряд идущие
+небольшие главы собираются в пачку не больше бюджета запроса (max_chunk_size),
+каждая под разделителем "=== РАЗДЕЛ k ===", и модель просят начать конспект
+каждого раздела тем же разделителем. Ответ режется обратно по разделителям;
+если разделы не находятся все и по порядку, вызывающий код конспектирует
+главы по одной.
+"""
+import re
+from typing import List, Optional, Sequence
+
+DEFAULT_PACK_CHAPTER_CHARS = 3000
+DEFAULT_PACK_MAX_CHAPTERS = 8
+
+# Разделитель раздела во входе и в ответе
+SECTION_HEADER = "=== РАЗДЕЛ {} ==="
+# Разделитель в ответе: модель может добавить Markdown-разметку или сменить регистр
+SECTION_LINE = re.compile(r"^[ \t#*>_]*=+[ \t]*раздел[ \t]+(\d+)[ \t]*=+[ \t*_]*$", re.IGNORECASE | re.MULTILINE)
+
+PACK_INSTRUCTION = (
+    "Ниже {count} независимых разделов книги. Сделай конспект каждого раздела отдельно. "
+    "Начни конспект каждого раздела строкой-разделителем точно как во входном тексте "
+    "(\"=== РАЗДЕЛ 1 ===\", \"=== РАЗДЕЛ 2 ===\" и так далее). "
+    "Не объединяй и не пропускай разделы."
+)
+
+# Ответ на пачку длиннее ответа на одну главу: лимит токенов растет с числом разделов
+TOKENS_PER_SECTION = 400
+MIN_PACK_TOKENS = 2000
+MAX_PACK_TOKENS = 4000
+
+
+def pack_overhead(count: int) -> int:
+    """Символы инструкции и разделителей пачки из count глав"""
+    return len(PACK_INSTRUCTION) + count * (len(SECTION_HEADER) + 8)
+
+
+def plan_packs(
+    sizes: Sequence[int],
+    max_chars: int,
+    small_chars: int = DEFAULT_PACK_CHAPTER_CHARS,
+    max_chapters: int = DEFAULT_PACK_MAX_CHAPTERS
+) -> List[List[int]]:
+    """
+    Разбиение глав (в порядке обработки) на пачки
+
+    Подряд идущие главы не длиннее small_chars собираются жадно, пока пачка с
+    разделителями помещается в max_chars и в ней не больше max_chapters глав.
+
+    Returns:
+        Позиции глав в sizes по пачкам; большие главы - пачки из одной главы
+    """
+    packs: List[List[int]] = []
+    current: List[int] = []
+    current_chars = 0
+    for pos, size in enumerate(sizes):
+        small = size <= small_chars
+        fits = (
+            small and current and len(current) < max_chapters
+            and current_chars + size + pack_overhead(len(current) + 1) <= max_chars
+        )
+        if not fits and current:
+            packs.append(current)
+            current, current_chars = [], 0
+        if small:
+            current.append(pos)
+            current_chars += size
+        else:
+            packs.append([pos])
+    if current:
+        packs.append(current)
+    return packs
+
+
+def pack_prompt(texts: Sequence[str]) -> str:
+    """Текст запроса для пачки глав"""
+    sections = "\n\n".join(f"{SECTION_HEADER.format(k)}\n{text.strip()}" for k, text in enumerate(texts, 1))
+    return f"{PACK_INSTRUCTION.format(count=len(texts))}\n\n{sections}"
+
+
+def pack_max_tokens(count: int) -> int:
+    return max(MIN_PACK_TOKENS, min(MAX_PACK_TOKENS, TOKENS_PER_SECTION * count))
+
+
+def split_pack_response(response: str, count: int) -> Optional[List[str]]:
+    """
+    Конспекты разделов из ответа на пачку
+
+    Вступление перед первым разделителем отбрасывается. None - если разделы
+    не идут ровно 1..count по порядку или какой-то из них пуст.
+    """
+    headers = list(SECTION_LINE.finditer(response))
+    if [int(match.group(1)) for match in headers] != list(range(1, count + 1)):
+        return None
+    summaries = []
+    for k, match in enumerate(headers):
+        end = headers[k + 1].start() if k + 1 < len(headers) else len(response)
+        summary = response[match.end():end].strip()
+        if not summary:
+            return None
+        summaries.append(summary)
+    return summaries
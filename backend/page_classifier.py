@@ -0,0 +1,244 @@
+"""
+Поиск служебных страниц: оглавление, предметный указатель, список литературы.
+
+Такие страницы отбрасываются до нарезки на главы, и их текст не уходит в LLM.
+Признаки считаются векторно для пачки страниц сразу: текст пачки переводится
+в массив кодов символов, и NumPy за несколько проходов находит концы строк,
+номер страницы в конце строки (после пробела или отточия), отточия, перечни
+страниц через запятую, годы, длины строк и доли цифр; построчные признаки
+сводятся к страницам через bincount.
+
+Короткие строки с числом в конце есть и в таблицах с числами ("2019 120 15",
+"Температура воды 15"), поэтому без отточий и заголовка страница считается
+оглавлением, только если номера в конце строк растут сверху вниз, а строкой
+указателя - только если номер отделен запятой с пробелом после слова
+("Энтропия, 12"; "15,5" - десятичная дробь). Страница с оглавлением в начале
+и текстом первой главы после него остается: оглавлением считается только
+страница, которую строки оглавления занимают почти целиком. Регулярным выражением (с литеральным
+началом) ищутся только библиографические записи "Фамилия И.".
+"""
+import re
+from typing import List, Optional, Sequence
+
+try:
+    import numpy as np
+except ImportError:  # фильтр страниц необязателен
+    np = None
+
+
+TOC = "toc"
+INDEX = "index"
+BIBLIOGRAPHY = "bibliography"
+
+# Библиографическая запись с начала строки: номер, фамилия и инициалы ("1. Иванов И. И.", "Smith, J.")
+BIB_AUTHOR = re.compile(r"\n[^\S\n]*(?:\[?\d{1,3}[\].)]?[^\S\n]*)?[A-ZА-ЯЁ][a-zа-яё'-]+,?[^\S\n]+[A-ZА-ЯЁ]\.")
+
+TITLES = {
+    TOC: {"оглавление", "содержание", "contents", "table of contents"},
+    INDEX: {"предметный указатель", "алфавитный указатель", "указатель", "именной указатель", "index"},
+    BIBLIOGRAPHY: {
+        "список литературы", "литература", "библиография", "список использованных источников",
+        "bibliography", "references", "literature"
+    },
+}
+# Заголовок служебной страницы ищется в первых строках
+TITLE_LINES = 3
+
+# Страниц в одной пачке: ограничивает размер массивов
+BATCH_PAGES = 256
+
+MIN_LINES = 3
+# Доли строк страницы с признаком, начиная с которых страница служебная
+TOC_LEADER_RATIO = 0.3
+TOC_LINE_RATIO = 0.6
+TOC_TITLED_RATIO = 0.3
+# Оглавление занимает страницу: строки с номерами - не меньше этой доли строк страницы
+# или вне блока от первой до последней такой строки не больше TOC_OUTSIDE_LINES строк (заголовок, колонтитулы)
+TOC_PAGE_RATIO = 0.8
+TOC_OUTSIDE_LINES = 3
+# Доля соседних пар номеров в конце строк, идущих по неубыванию (оглавление без отточий и заголовка)
+TOC_MONOTONIC_RATIO = 0.9
+INDEX_LINE_RATIO = 0.5
+INDEX_TITLED_RATIO = 0.25
+BIB_AUTHOR_RATIO = 0.3
+BIB_YEAR_RATIO = 0.2
+BIB_TITLED_RATIO = 0.3
+# Оглавление и указатель набраны короткими строками с номерами страниц
+SHORT_LINE_CHARS = 70
+MIN_DIGIT_RATIO = 0.02
+# Номер страницы - не длиннее 4 цифр; отточие - не меньше 3 знаков перед ним
+PAGE_NUMBER_DIGITS = 4
+LEADER_MIN = 3
+LEADER_WINDOW = 8
+# Запятая перед номером страницы в строке указателя ("Энтропия, 12" или "Энтропия, 45-47")
+INDEX_COMMA_WINDOW = 8
+YEAR_RANGE = (1800, 2099)
+
+NEWLINE = ord("\n")
+COMMA = ord(",")
+ZERO = ord("0")
+SPACES = [ord(ch) for ch in " \t\r\n\xa0"]
+LEADERS = [ord(ch) for ch in ".…·_"]
+
+
+def page_filter_available() -> bool:
+    return np is not None
+
+
+def _title_kind(page_text: str) -> Optional[str]:
+    """Тип служебной страницы по заголовку в первых строках"""
+    lines = [line for line in (raw.strip(" \t.:#") for raw in page_text.split("\n", 10)) if line]
+    for line in lines[:TITLE_LINES]:
+        lowered = line.lower()
+        for kind, titles in TITLES.items():
+            if lowered in titles:
+                return kind
+    return None
+
+
+def _window_count(cumulative, start, end):
+    """Число отмеченных символов в [start, end) по префиксным суммам"""
+    return cumulative[end] - cumulative[np.maximum(start, 0)]
+
+
+def _classify_batch(page_texts: Sequence[str]) -> List[Optional[str]]:
+    pages = len(page_texts)
+    # Каждая страница заканчивается переводом строки: у любой страницы есть хотя бы одна строка
+    text = "".join(page_text + "\n" for page_text in page_texts)
+    codes = np.frombuffer(text.encode("utf-32-le"), dtype=np.uint32)
+    positions = np.arange(len(codes), dtype=np.int64)
+    page_lengths = np.fromiter((len(page_text) + 1 for page_text in page_texts), dtype=np.int64, count=pages)
+    page_starts = np.concatenate(([0], np.cumsum(page_lengths)[:-1]))
+
+    newlines = np.flatnonzero(codes == NEWLINE)
+    line_starts = np.concatenate(([0], newlines[:-1] + 1))
+    line_page = np.searchsorted(page_starts, line_starts, side="right") - 1
+
+    is_digit = (codes >= ZERO) & (codes <= ZERO + 9)
+    is_visible = ~np.isin(codes, SPACES)
+    is_leader = np.isin(codes, LEADERS)
+    digits = np.add.reduceat(is_digit.astype(np.int64), page_starts)
+    visible = np.add.reduceat(is_visible.astype(np.int64), page_starts)
+    leaders = np.concatenate(([0], np.cumsum(is_leader)))
+    # Запятая с пробелом после нее: разделитель номеров в указателе, а не десятичная запятая
+    is_separator = (codes == COMMA) & np.append(~is_visible[1:], True)
+    separators = np.concatenate(([0], np.cumsum(is_separator)))
+
+    # Последний видимый символ строки и начало серии цифр, которой он заканчивается
+    last_visible = np.maximum.accumulate(np.where(is_visible, positions, -1))
+    last_nondigit = np.maximum.accumulate(np.where(is_digit, -1, positions))
+    line_end = last_visible[newlines]
+    nonempty = line_end >= line_starts
+    end = np.maximum(line_end, 0)
+    number_start = last_nondigit[end] + 1
+    before = number_start - 1
+    safe_before = np.maximum(before, 0)
+
+    # Номер страницы в конце строки после пробела или отточия, перед ним есть текст
+    ends_with_number = (
+        nonempty & is_digit[end]
+        & (end - number_start < PAGE_NUMBER_DIGITS)
+        & (before > line_starts)
+        & (~is_visible[safe_before] | is_leader[safe_before])
+    )
+    leader_window = np.maximum(before - LEADER_WINDOW, line_starts)
+    dot_leader = ends_with_number & (_window_count(leaders, leader_window, before + 1) >= LEADER_MIN)
+    comma_window = np.maximum(number_start - INDEX_COMMA_WINDOW, line_starts)
+    # Строка указателя начинается с термина (не с числа), номер отделен запятой с пробелом
+    next_visible = np.minimum.accumulate(np.where(is_visible, positions, len(codes) - 1)[::-1])[::-1]
+    starts_with_digit = is_digit[next_visible[line_starts]]
+    index_line = (
+        nonempty & ~starts_with_digit & is_digit[end] & (end - number_start < PAGE_NUMBER_DIGITS)
+        & (_window_count(separators, comma_window, number_start) > 0)
+    )
+
+    # Номера страниц в оглавлении растут сверху вниз, числа в таблице - нет
+    numbered_lines = np.flatnonzero(ends_with_number)
+    values = np.zeros(len(numbered_lines), dtype=np.int64)
+    for shift in range(PAGE_NUMBER_DIGITS):
+        pos = end[numbered_lines] - shift
+        present = pos >= number_start[numbered_lines]
+        digit = codes[np.maximum(pos, 0)].astype(np.int64) - ZERO
+        values += np.where(present, digit * 10 ** shift, 0)
+    same_page = line_page[numbered_lines[1:]] == line_page[numbered_lines[:-1]]
+    pair_page = line_page[numbered_lines[1:]][same_page]
+    steps = (values[1:] - values[:-1])[same_page]
+
+    # Годы: серии ровно из 4 цифр в диапазоне YEAR_RANGE
+    run_ends = np.flatnonzero(is_digit & ~np.append(is_digit[1:], False))
+    run_starts = last_nondigit[run_ends] + 1
+    four = run_ends[run_ends - run_starts == 3]
+    values = sum((codes[four - shift].astype(np.int64) - ZERO) * 10 ** shift for shift in range(4))
+    years = four[(values >= YEAR_RANGE[0]) & (values <= YEAR_RANGE[1])]
+    year_lines = np.unique(np.searchsorted(line_starts, years, side="right") - 1)
+
+    # Строки, начинающиеся с записи "Фамилия И." (смещение "\n" во втором тексте - начало строки в первом)
+    authors = np.fromiter((match.start() for match in BIB_AUTHOR.finditer("\n" + text)), dtype=np.int64)
+    author_lines = np.searchsorted(line_starts, authors, side="right") - 1
+
+    def per_page(lines_selector):
+        """Число выбранных строк (маска или индексы) на каждой странице"""
+        return np.bincount(line_page[lines_selector], minlength=pages)
+
+    lines = per_page(nonempty)
+    safe_lines = np.maximum(lines, 1)
+    line_lengths = (line_end - line_starts + 1)[nonempty]
+    mean_length = np.bincount(line_page[nonempty], weights=line_lengths, minlength=pages) / safe_lines
+    digit_ratio = digits / np.maximum(visible, 1)
+    leader_ratio = per_page(dot_leader) / safe_lines
+    toc_ratio = per_page(ends_with_number) / safe_lines
+    index_ratio = per_page(index_line) / safe_lines
+    author_ratio = per_page(author_lines) / safe_lines
+    year_ratio = per_page(year_lines) / safe_lines
+    pairs = np.bincount(pair_page, minlength=pages)
+    rising = np.bincount(pair_page, weights=steps >= 0, minlength=pages)
+    increasing = np.bincount(pair_page, weights=steps > 0, minlength=pages) > 0
+    monotonic = increasing & (rising >= TOC_MONOTONIC_RATIO * np.maximum(pairs, 1))
+
+    # Номер непустой строки на странице; строки вне блока строк с номерами (текст до и после оглавления)
+    rank = np.cumsum(nonempty) - 1 - (np.cumsum(lines) - lines)[line_page]
+    first_numbered = np.full(pages, np.iinfo(np.int64).max // 2, dtype=np.int64)
+    last_numbered = np.full(pages, -1, dtype=np.int64)
+    np.minimum.at(first_numbered, line_page[numbered_lines], rank[numbered_lines])
+    np.maximum.at(last_numbered, line_page[numbered_lines], rank[numbered_lines])
+    outside_lines = first_numbered + (lines - 1 - last_numbered)
+    covered = (toc_ratio >= TOC_PAGE_RATIO) | (outside_lines <= TOC_OUTSIDE_LINES)
+
+    titles = [_title_kind(page_text) for page_text in page_texts]
+    titled = {kind: np.array([title == kind for title in titles]) for kind in TITLES}
+
+    enough = lines >= MIN_LINES
+    short = mean_length < SHORT_LINE_CHARS
+    numbered = digit_ratio >= MIN_DIGIT_RATIO
+    toc = enough & covered & (
+        (leader_ratio >= TOC_LEADER_RATIO)
+        | ((toc_ratio >= TOC_LINE_RATIO) & short & numbered & monotonic)
+        | (titled[TOC] & (toc_ratio >= TOC_TITLED_RATIO))
+    )
+    index = enough & short & numbered & (
+        (index_ratio >= INDEX_LINE_RATIO)
+        | (titled[INDEX] & (index_ratio >= INDEX_TITLED_RATIO))
+    )
+    bibliography = enough & (
+        ((author_ratio >= BIB_AUTHOR_RATIO) & (year_ratio >= BIB_YEAR_RATIO))
+        | (titled[BIBLIOGRAPHY] & (author_ratio + year_ratio >= BIB_TITLED_RATIO))
+    )
+
+    kinds: List[Optional[str]] = [None] * pages
+    for kind, mask in ((BIBLIOGRAPHY, bibliography), (INDEX, index), (TOC, toc)):
+        for idx in np.flatnonzero(mask):
+            kinds[idx] = kind
+    return kinds
+
+
+def classify_pages(page_texts: Sequence[str]) -> List[Optional[str]]:
+    """
+    Тип каждой страницы: TOC, INDEX, BIBLIOGRAPHY или None для обычного текста
+
+    Признаки страницы зависят только от ее текста, поэтому страницы можно
+    классифицировать пачками и по одной. Требует NumPy (см. page_filter_available).
+    """
+    kinds: List[Optional[str]] = []
+    for start in range(0, len(page_texts), BATCH_PAGES):
+        kinds.extend(_classify_batch(page_texts[start:start + BATCH_PAGES]))
+    return kinds
@@ -1,54 +1,291 @@
+import bisect
 import pdfplumber
-import re
 from pathlib import Path
-from typing import List
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence
 import json
+from tracing import Tracer, NULL_TRACER
+from resource_usage import check_memory_limit
+from spool import JsonLinesSequence, write_jsonl
+from ocr import ocr_available, ocr_pages
+from headings import font_heading_lines, heading_detector, mark_font_headings
+from page_classifier import classify_pages, page_filter_available
+
+
+def release_page(page) -> None:
+    """Освобождение кешей страницы pdfplumber (символы, layout, textmap)"""
+    page.flush_cache()
+    page.get_textmap.cache_clear()
+
+
+def read_page_text(page, headings=None) -> str:
+    """Текст страницы pdfplumber; с детектором заголовков строки, выделенные шрифтом, помечаются как Markdown-заголовки"""
+    page_text = page.extract_text()
+    if page_text and headings is not None:
+        page_text = mark_font_headings(page_text, font_heading_lines(page), headings)
+    release_page(page)
+    return page_text or ""
+
+
+# Получатель текста страниц (номер страницы с нуля, текст), например библиотека документов
+PageSink = Callable[[int, str], None]
+
 
 class PDFProcessor:
-    def __init__(self, config: dict):
+    def __init__(
+        self,
+        config: dict,
+        tracer: Optional[Tracer] = None,
+        sandbox=None,
+        work_dir: Optional[Path] = None
+    ):
+        """
+        Args:
+            sandbox: ExtractionSandbox - страницы извлекаются в изолированном
+                процессе с ограничениями времени и памяти (без него - в этом процессе)
+            work_dir: Каталог файлов документа (source_text.txt, chapters.jsonl,
+                chapters_info.json); по умолчанию output_dir. Задачи, которые
+                выполняются одновременно, передают каждая свой каталог
+        """
         self.config = config
+        self.tracer = tracer or NULL_TRACER
+        self.sandbox = sandbox
         self.output_dir = Path(config["output_dir"])
         self.output_dir.mkdir(parents=True, exist_ok=True)
+        self.work_dir = Path(work_dir) if work_dir is not None else self.output_dir
+        self.work_dir.mkdir(parents=True, exist_ok=True)
         
-        # Стоп-слова для определения мусорных фрагментов
-        self.stop_words = [
-            "оглавление", "содержание", "contents", "table of contents",
-            "введение", "предисловие", "preface", "introduction"
-        ]
+        # Заголовки оглавления: фрагмент, первая строка которого - такой заголовок, мусорный.
+        # "Введение" и "Предисловие" - настоящие главы и сюда не входят
+        self.stop_words = {"оглавление", "содержание", "contents", "table of contents"}
         
-        # Регулярное выражение для нарезки на главы
+        # Детектор заголовков для нарезки на главы (компилируется один раз на набор ключевых слов)
         # Используем ключевые слова из конфига, если они есть
-        keywords = config.get("split_keywords", [
+        self.keywords = config.get("split_keywords", [
             "Вариант", "Глава", "Раздел", "Итог", "Тема", "Введение", "Эпилог"
         ])
-        keywords_pattern = "|".join(keywords)
-        self.chapter_pattern = re.compile(
-            rf'\n\s*(?=(?:\d+[\.\s-]*)?(?:{keywords_pattern}|#{1,3}\s))',
-            re.IGNORECASE | re.MULTILINE
-        )
+        self.headings = heading_detector(self.keywords)
+        
+        # Отбрасывание служебных страниц (оглавление, указатель, литература) до нарезки
+        self.page_filter = config.get("page_filter", True) and page_filter_available()
+        if config.get("page_filter", True) and not page_filter_available():
+            print("[WARNING] NumPy не установлен - служебные страницы не отфильтровываются")
+    
+    def iter_page_texts(self, pdf_path: str) -> Iterator[str]:
+        """
+        Постраничное извлечение текста
+        
+        Кеши каждой страницы освобождаются сразу после извлечения, поэтому
+        память не растет с числом страниц. С песочницей страницы извлекаются
+        в процессе-воркере; страница, на которой он завис или упал, пропускается.
+        """
+        memory_limit = self.config.get("memory_limit_mb")
+        font_cues = self.config.get("heading_font_cues", False)
+        if self.sandbox is not None:
+            skipped: List[int] = []
+            for page_text in self.sandbox.iter_page_texts(pdf_path, self.keywords if font_cues else None, skipped):
+                check_memory_limit(memory_limit)
+                yield page_text
+            if skipped:
+                print(f"[WARNING] Пропущено страниц при извлечении: {len(skipped)} "
+                      f"({', '.join(str(idx + 1) for idx in skipped)})")
+            return
+        with pdfplumber.open(pdf_path) as pdf:
+            for page in pdf.pages:
+                page_text = read_page_text(page, self.headings if font_cues else None)
+                check_memory_limit(memory_limit)
+                yield page_text
+    
+    def needs_ocr(self, page_text: str) -> bool:
+        """Страница без текстового слоя (скан)"""
+        return len(page_text.strip()) < self.config.get("ocr_min_chars", 20)
     
-    def extract_text_from_pdf(self, pdf_path: str) -> str:
+    def run_ocr(self, pdf_path: str, page_indices: List[int]) -> Dict[int, str]:
+        """Распознавание страниц без текста; пустой результат, если OCR выключен или недоступен"""
+        if not page_indices or not self.config.get("ocr_enabled", True):
+            return {}
+        if not ocr_available(self.config.get("tesseract_cmd")):
+            print(f"[WARNING] {len(page_indices)} стр. без текста, но Tesseract/pytesseract не установлен - OCR пропущен")
+            return {}
+        print(f"OCR страниц без текста: {len(page_indices)}...")
+        with self.tracer.span("ocr", pages=len(page_indices)):
+            return ocr_pages(pdf_path, page_indices, self.config, self.output_dir / ".ocr_cache")
+    
+    def extract_text_from_pdf(self, pdf_path: str, page_sink: Optional[PageSink] = None) -> str:
         """Извлечение текста из PDF"""
-        text = ""
         try:
-            with pdfplumber.open(pdf_path) as pdf:
-                for page in pdf.pages:
-                    page_text = page.extract_text()
-                    if page_text:
-                        text += page_text + "\n"
+            with self.tracer.span("extract_text_from_pdf", path=str(pdf_path)):
+                page_texts = list(self.iter_page_texts(pdf_path))
+            
+            # Сканированные страницы распознаются и встают на свои места
+            missing = [idx for idx, page_text in enumerate(page_texts) if self.needs_ocr(page_text)]
+            for idx, page_text in self.run_ocr(pdf_path, missing).items():
+                page_texts[idx] = page_text
+            
+            if page_sink:
+                for idx, page_text in enumerate(page_texts):
+                    page_sink(idx, page_text)
+        except Exception as e:
+            raise Exception(f"Ошибка извлечения текста из PDF: {e}")
+        
+        return self.join_pages(self.filter_pages(page_texts))
+    
+    def junk_page_kinds(self, page_texts: List[str]) -> List[Optional[str]]:
+        """Тип служебной страницы (toc, index, bibliography) или None для каждой страницы"""
+        if not self.page_filter:
+            return [None] * len(page_texts)
+        with self.tracer.span("classify_pages", pages=len(page_texts)):
+            return classify_pages(page_texts)
+    
+    def filter_pages(self, page_texts: List[str]) -> List[str]:
+        """Текст страниц, в котором служебные страницы заменены пустыми (номера страниц сохраняются)"""
+        kinds = self.junk_page_kinds(page_texts)
+        junk: Dict[str, List[int]] = {}
+        for idx, kind in enumerate(kinds):
+            if kind:
+                junk.setdefault(kind, []).append(idx)
+        self._report_junk_pages(junk)
+        return [page_text if kind is None else "" for page_text, kind in zip(page_texts, kinds)]
+    
+    @staticmethod
+    def _report_junk_pages(junk: Dict[str, List[int]]):
+        """Сообщение о пропущенных служебных страницах с их номерами (junk: тип -> номера с нуля)"""
+        if junk:
+            details = "; ".join(
+                f"{kind}: стр. {', '.join(str(idx + 1) for idx in sorted(pages))}"
+                for kind, pages in sorted(junk.items())
+            )
+            print(f"Пропущено служебных страниц: {sum(map(len, junk.values()))} ({details})")
+    
+    @staticmethod
+    def join_pages(page_texts: Iterable[str]) -> str:
+        return "".join(page_text + "\n" for page_text in page_texts if page_text)
+    
+    @staticmethod
+    def locate_chapters(chapters: Iterable[str], page_texts: Iterable[str]) -> List[Optional[int]]:
+        """
+        Номер страницы (с 1), на которой начинается каждая глава
+        
+        Главы - фрагменты текста страниц в исходном порядке, поэтому начало
+        каждой ищется после предыдущей; в памяти держатся только текущие страницы.
+        Главы, начало которых не найдено, получают None.
+        """
+        pages = ((page_no, text) for page_no, text in enumerate(page_texts, 1) if text)
+        window: List[tuple] = []  # (номер страницы, смещение в buffer)
+        buffer = ""
+        search_from = 0
+        exhausted = False
+        starts: List[Optional[int]] = []
+        for chapter in chapters:
+            prefix = chapter[:80]
+            page_no = None
+            while True:
+                pos = buffer.find(prefix, search_from)
+                if pos >= 0:
+                    k = bisect.bisect_right([offset for _, offset in window], pos) - 1
+                    page_no = window[k][0]
+                    # Страницы до начала главы больше не нужны
+                    cut = window[k][1]
+                    buffer = buffer[cut:]
+                    window = [(no, offset - cut) for no, offset in window[k:]]
+                    search_from = pos - cut + 1
+                    break
+                if exhausted:
+                    break
+                page = next(pages, None)
+                if page is None:
+                    exhausted = True
+                    continue
+                # Совпадение может начаться только на последней странице окна (переход через границу)
+                if len(window) > 1:
+                    cut = window[-1][1]
+                    buffer = buffer[cut:]
+                    window = [(window[-1][0], 0)]
+                    search_from = max(0, search_from - cut)
+                window.append((page[0], len(buffer)))
+                buffer += page[1] + "\n"
+            starts.append(page_no)
+        return starts
+    
+    def extract_text_to_file(self, pdf_path: str, out_path: Path, page_sink: Optional[PageSink] = None) -> int:
+        """
+        Извлечение текста из PDF сразу в файл (режим экономии памяти)
+        
+        Returns:
+            Количество значимых (непробельных по краям страниц) символов
+        """
+        significant = 0
+        missing: List[int] = []
+        positions: List[int] = []  # смещения в файле, куда вставить OCR-текст
+        junk: Dict[str, List[int]] = {}
+        try:
+            with self.tracer.span("extract_text_from_pdf", path=str(pdf_path), spooled=True), \
+                    open(out_path, "wb") as out:
+                for idx, page_text in enumerate(self.iter_page_texts(pdf_path)):
+                    if page_sink:
+                        page_sink(idx, page_text)
+                    if self.needs_ocr(page_text):
+                        missing.append(idx)
+                        positions.append(out.tell())
+                        continue
+                    # Страницы классифицируются по одной: в памяти только текущая
+                    kind = self.junk_page_kinds([page_text])[0]
+                    if kind:
+                        junk.setdefault(kind, []).append(idx)
+                        continue
+                    out.write((page_text + "\n").encode("utf-8"))
+                    significant += len(page_text.strip())
+            
+            recognized = self.run_ocr(pdf_path, missing)
+            if page_sink:
+                for idx, page_text in recognized.items():
+                    page_sink(idx, page_text)
+            if recognized:
+                kinds = self.junk_page_kinds(list(recognized.values()))
+                for idx, kind in zip(recognized, kinds):
+                    if kind:
+                        junk.setdefault(kind, []).append(idx)
+                recognized = {
+                    idx: page_text if kind is None else ""
+                    for (idx, page_text), kind in zip(recognized.items(), kinds)
+                }
+                significant += self._merge_ocr_into_file(out_path, missing, positions, recognized)
         except Exception as e:
             raise Exception(f"Ошибка извлечения текста из PDF: {e}")
         
-        return text
+        self._report_junk_pages(junk)
+        return significant
+    
+    def _merge_ocr_into_file(self, path: Path, missing: List[int], positions: List[int], recognized: Dict[int, str]) -> int:
+        """Потоковая вставка распознанных страниц в файл с текстом"""
+        merged_path = path.with_suffix(".ocr.tmp")
+        added = 0
+        with open(path, "rb") as src, open(merged_path, "wb") as dst:
+            for idx, position in zip(missing, positions):
+                remaining = position - src.tell()
+                while remaining > 0:
+                    block = src.read(min(remaining, 1024 * 1024))
+                    dst.write(block)
+                    remaining -= len(block)
+                page_text = recognized.get(idx, "")
+                if page_text.strip():
+                    dst.write((page_text + "\n").encode("utf-8"))
+                    added += len(page_text.strip())
+            for block in iter(lambda: src.read(1024 * 1024), b""):
+                dst.write(block)
+        merged_path.replace(path)
+        return added
     
     def is_junk_fragment(self, text: str) -> bool:
-        """Проверка, является ли фрагмент мусорным (оглавление и т.д.)"""
-        text_lower = text.lower()
+        """
+        Проверка, является ли фрагмент мусорным (оглавление и т.д.)
         
-        # Проверка на стоп-слова
-        for stop_word in self.stop_words:
-            if stop_word in text_lower[:200]:  # Проверяем начало текста
-                return True
+        Служебные страницы отбрасываются раньше (filter_pages); здесь ловятся
+        остатки, например оглавление внутри страницы с текстом.
+        """
+        # Фрагмент начинается с заголовка оглавления
+        first_line = text[:100].split("\n", 1)[0].strip(" \t.:#")
+        if first_line.lower() in self.stop_words:
+            return True
         
         # Проверка на высокую плотность точек (эффект оглавления)
         if len(text) > 100:
@@ -65,8 +302,12 @@ class PDFProcessor:
     
     def split_into_chapters(self, text: str) -> List[str]:
         """Умная нарезка текста на главы"""
+        with self.tracer.span("split_into_chapters", chars=len(text)):
+            return self._split_into_chapters(text)
+    
+    def _split_into_chapters(self, text: str) -> List[str]:
         # Разделение по паттерну
-        chapters = self.chapter_pattern.split(text)
+        chapters = self.headings.split(text)
         
         # Фильтрация пустых и мусорных фрагментов
         filtered_chapters = []
@@ -92,18 +333,129 @@ class PDFProcessor:
         
         return filtered_chapters
     
-    def process_pdf(self, pdf_path: str) -> List[str]:
-        """Основной метод обработки PDF"""
+    def _filter_chapter(self, chapter: str) -> Optional[str]:
+        chapter = chapter.strip()
+        if len(chapter) < 100 or self.is_junk_fragment(chapter):
+            return None
+        return chapter
+    
+    def iter_chapters_from_file(self, text_path: Path) -> Iterator[str]:
+        """
+        Построчная нарезка текста из файла на главы (режим экономии памяти)
+        
+        В памяти находится только текущая глава; слишком длинные главы
+        отдаются частями по max_chapter_chars символов.
+        """
+        max_chapter_chars = self.config.get(
+            "max_chapter_chars", self.config.get("max_chunk_size", 15000) * 20
+        )
+        lines: List[str] = []
+        size = 0
+        with open(text_path, "r", encoding="utf-8") as f:
+            for line in f:
+                if lines and (self.headings.is_heading_line(line) or size >= max_chapter_chars):
+                    chapter = self._filter_chapter("".join(lines))
+                    if chapter:
+                        yield chapter
+                    lines, size = [], 0
+                lines.append(line)
+                size += len(line)
+        if lines:
+            chapter = self._filter_chapter("".join(lines))
+            if chapter:
+                yield chapter
+    
+    def iter_parts_from_file(self, text_path: Path) -> Iterator[str]:
+        """Нарезка файла на равные части, если главы не найдены"""
+        chunk_size = self.config.get("max_chunk_size", 15000)
+        with open(text_path, "r", encoding="utf-8") as f:
+            for part in iter(lambda: f.read(chunk_size), ""):
+                if len(part.strip()) > 100:
+                    yield part
+    
+    def process_pdf_low_memory(self, pdf_path: str, page_sink: Optional[PageSink] = None) -> Sequence[str]:
+        """
+        Обработка PDF с ограниченным потреблением памяти
+        
+        Текст пишется на диск постранично, главы нарезаются построчно и
+        сохраняются в JSON Lines; возвращается список глав, читаемых с диска.
+        """
+        print(f"Извлечение текста из {pdf_path} (режим экономии памяти)...")
+        source_text_path = self.work_dir / "source_text.txt"
+        significant = self.extract_text_to_file(pdf_path, source_text_path, page_sink)
+        
+        if significant < 100:
+            raise Exception("Не удалось извлечь текст из PDF или текст слишком короткий")
+        print(f"Исходный текст сохранен в {source_text_path}")
+        
+        return self._chapters_from_file(source_text_path)
+    
+    def _chapters_from_file(self, source_text_path: Path) -> Sequence[str]:
+        """Построчная нарезка файла с текстом на главы в JSON Lines"""
+        print("Нарезка текста на главы...")
+        chapters_path = self.work_dir / "chapters.jsonl"
+        lengths: List[int] = []
+        
+        def measured(chapters: Iterator[str]) -> Iterator[str]:
+            for chapter in chapters:
+                lengths.append(len(chapter))
+                yield chapter
+        
+        with self.tracer.span("split_into_chapters", spooled=True):
+            count = write_jsonl(chapters_path, measured(self.iter_chapters_from_file(source_text_path)))
+            if count == 0:
+                count = write_jsonl(chapters_path, measured(self.iter_parts_from_file(source_text_path)))
+        
+        print(f"Найдено глав: {count}")
+        self._write_chapters_info(count, lengths)
+        return JsonLinesSequence(chapters_path)
+    
+    def process_pdf(self, pdf_path: str, page_sink: Optional[PageSink] = None) -> Sequence[str]:
+        """
+        Основной метод обработки PDF
+        
+        Args:
+            pdf_path: Путь к PDF
+            page_sink: Получает текст каждой страницы (для сохранения в библиотеку)
+        """
+        if self.config.get("low_memory_mode", False):
+            return self.process_pdf_low_memory(pdf_path, page_sink)
+        
         # Извлечение текста
         print(f"Извлечение текста из {pdf_path}...")
-        text = self.extract_text_from_pdf(pdf_path)
-        
+        text = self.extract_text_from_pdf(pdf_path, page_sink)
+        return self._chapters_from_text(text)
+    
+    def process_pages(self, page_texts: Iterable[str]) -> Sequence[str]:
+        """Нарезка на главы ранее извлеченного текста страниц (без повторного чтения PDF)"""
+        if self.config.get("low_memory_mode", False):
+            source_text_path = self.work_dir / "source_text.txt"
+            significant = 0
+            junk: Dict[str, List[int]] = {}
+            with open(source_text_path, "w", encoding="utf-8") as out:
+                for idx, page_text in enumerate(page_texts):
+                    if not page_text:
+                        continue
+                    kind = self.junk_page_kinds([page_text])[0]
+                    if kind:
+                        junk.setdefault(kind, []).append(idx)
+                        continue
+                    out.write(page_text + "\n")
+                    significant += len(page_text.strip())
+            self._report_junk_pages(junk)
+            if significant < 100:
+                raise Exception("Сохраненный текст документа слишком короткий")
+            return self._chapters_from_file(source_text_path)
+        return self._chapters_from_text(self.join_pages(self.filter_pages(list(page_texts))))
+    
+    def _chapters_from_text(self, text: str) -> List[str]:
         if not text or len(text.strip()) < 100:
             raise Exception("Не удалось извлечь текст из PDF или текст слишком короткий")
         
         # Сохранение исходного текста
-        source_text_path = self.output_dir / "source_text.txt"
-        source_text_path.write_text(text, encoding="utf-8")
+        source_text_path = self.work_dir / "source_text.txt"
+        with self.tracer.span("write.source_text", chars=len(text)):
+            source_text_path.write_text(text, encoding="utf-8")
         print(f"Исходный текст сохранен в {source_text_path}")
         
         # Нарезка на главы
@@ -111,13 +463,15 @@ class PDFProcessor:
         chapters = self.split_into_chapters(text)
         
         print(f"Найдено глав: {len(chapters)}")
-        
-        # Сохранение информации о главах
+        self._write_chapters_info(len(chapters), [len(ch) for ch in chapters])
+        return chapters
+    
+    def _write_chapters_info(self, count: int, lengths: List[int]):
+        """Сохранение информации о главах"""
         chapters_info = {
-            "total_chapters": len(chapters),
-            "chapters_lengths": [len(ch) for ch in chapters]
+            "total_chapters": count,
+            "chapters_lengths": lengths
         }
-        info_path = self.output_dir / "chapters_info.json"
-        info_path.write_text(json.dumps(chapters_info, indent=2, ensure_ascii=False), encoding="utf-8")
-        
-        return chapters
+        info_path = self.work_dir / "chapters_info.json"
+        with self.tracer.span("write.chapters_info"):
+            info_path.write_text(json.dumps(chapters_info, indent=2, ensure_ascii=False), encoding="utf-8")
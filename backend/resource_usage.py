@@ -0,0 +1,132 @@
+"""
+Измерение потребления памяти процессом.
+
+RSS берется из psutil, если он установлен, иначе из /proc (Linux)
+или WinAPI (Windows; только для текущего процесса). Если ни один способ
+недоступен, функции возвращают None.
+"""
+import gc
+import os
+import sys
+import threading
+from typing import Optional
+
+try:
+    import psutil
+except ImportError:  # psutil не обязателен
+    psutil = None
+
+
+def _rss_windows() -> Optional[int]:
+    import ctypes
+    from ctypes import wintypes
+
+    class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+        _fields_ = [
+            ("cb", wintypes.DWORD),
+            ("PageFaultCount", wintypes.DWORD),
+            ("PeakWorkingSetSize", ctypes.c_size_t),
+            ("WorkingSetSize", ctypes.c_size_t),
+            ("QuotaPeakPagedPoolUsage", ctypes.c_size_t),
+            ("QuotaPagedPoolUsage", ctypes.c_size_t),
+            ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t),
+            ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+            ("PagefileUsage", ctypes.c_size_t),
+            ("PeakPagefileUsage", ctypes.c_size_t),
+        ]
+
+    counters = PROCESS_MEMORY_COUNTERS()
+    counters.cb = ctypes.sizeof(counters)
+    handle = ctypes.windll.kernel32.GetCurrentProcess()
+    if ctypes.windll.psapi.GetProcessMemoryInfo(handle, ctypes.byref(counters), counters.cb):
+        return counters.WorkingSetSize
+    return None
+
+
+def current_rss_mb() -> Optional[float]:
+    """Текущий RSS процесса в мегабайтах"""
+    try:
+        if psutil is not None:
+            return psutil.Process().memory_info().rss / (1024 * 1024)
+        if sys.platform.startswith("linux"):
+            with open("/proc/self/statm") as f:
+                pages = int(f.read().split()[1])
+            return pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+        if sys.platform == "win32":
+            rss = _rss_windows()
+            return rss / (1024 * 1024) if rss is not None else None
+    except Exception:
+        return None
+    return None
+
+
+def process_rss_mb(pid: int) -> Optional[float]:
+    """RSS другого процесса (например, воркера извлечения) в мегабайтах"""
+    try:
+        if psutil is not None:
+            return psutil.Process(pid).memory_info().rss / (1024 * 1024)
+        if sys.platform.startswith("linux"):
+            with open(f"/proc/{pid}/statm") as f:
+                pages = int(f.read().split()[1])
+            return pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except Exception:
+        return None
+    return None
+
+
+def check_memory_limit(limit_mb: Optional[float]) -> None:
+    """
+    Проверка потолка памяти
+
+    При превышении сначала освобождается мусор; если и после этого RSS выше
+    лимита, обработка прерывается исключением.
+    """
+    if not limit_mb:
+        return
+    rss = current_rss_mb()
+    if rss is None or rss <= limit_mb:
+        return
+    gc.collect()
+    rss = current_rss_mb()
+    if rss is not None and rss > limit_mb:
+        raise Exception(f"Превышен лимит памяти: {rss:.0f} МБ при ограничении {limit_mb:.0f} МБ")
+
+
+class PeakRSSMonitor:
+    """Фоновое измерение пикового RSS за время задачи"""
+
+    def __init__(self, interval: float = 0.25):
+        self.interval = interval
+        self.peak_mb: Optional[float] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> "PeakRSSMonitor":
+        if self._thread is None:
+            self._stop.clear()
+            self.reset()
+            self._thread = threading.Thread(target=self._run, name="rss-monitor", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self) -> Optional[float]:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.sample()
+        return self.peak_mb
+
+    def reset(self) -> None:
+        """Начало нового интервала измерения"""
+        self.peak_mb = None
+        self.sample()
+
+    def sample(self) -> None:
+        rss = current_rss_mb()
+        if rss is not None and (self.peak_mb is None or rss > self.peak_mb):
+            self.peak_mb = rss
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.sample()
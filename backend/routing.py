@@ -0,0 +1,193 @@
+"""
+Маршрутизация запросов к LLM между моделями.
+
+Короткие разделы и простые списки не требуют самой большой модели. Правила
+model_routes проверяются по порядку, запрос уходит в модель первого
+подходящего правила (возможно, на другом сервере), иначе - в lm_studio_model
+по адресу lm_studio_url. Условия правила:
+
+- min_chars / max_chars - длина текста запроса;
+- min_complexity / max_complexity - оценка сложности текста от 0 до 1
+  (text_complexity: длина слов и предложений, доля строк-пунктов списка).
+
+Для каждой модели копится статистика (запросы, токены, задержка, скорость
+промпта и генерации, ошибки), по которой подбираются пороги правил.
+"""
+import re
+import threading
+from typing import Dict, List, Optional
+
+
+WORD = re.compile(r"\w+")
+SENTENCE_END = re.compile(r"[.!?…]+(?=\s|$)")
+# Строка-пункт списка: маркер или номер в начале строки
+LIST_ITEM = re.compile(r"^[ \t]*(?:[-•*–—]|\d{1,3}[.)])[ \t]", re.MULTILINE)
+NONEMPTY_LINE = re.compile(r"\S[^\n]*")
+
+# Средняя длина слова и предложения (в словах), соответствующие сложности 0 и 1
+WORD_LENGTH_RANGE = (4.5, 7.5)
+SENTENCE_LENGTH_RANGE = (8.0, 30.0)
+
+CONDITIONS = ("min_chars", "max_chars", "min_complexity", "max_complexity")
+
+
+def _scale(value: float, low: float, high: float) -> float:
+    return min(1.0, max(0.0, (value - low) / (high - low)))
+
+
+def text_complexity(text: str) -> float:
+    """
+    Оценка сложности текста от 0 (простой список) до 1 (плотный текст)
+
+    Среднее из длины слов и длины предложений, уменьшенное пропорционально
+    доле строк-пунктов списка.
+    """
+    words = WORD.findall(text)
+    if not words:
+        return 0.0
+    word_length = sum(map(len, words)) / len(words)
+    sentence_length = len(words) / max(1, len(SENTENCE_END.findall(text)))
+    density = (_scale(word_length, *WORD_LENGTH_RANGE) + _scale(sentence_length, *SENTENCE_LENGTH_RANGE)) / 2
+    lines = len(NONEMPTY_LINE.findall(text))
+    list_share = min(1.0, len(LIST_ITEM.findall(text)) / lines) if lines else 0.0
+    return round(density * (1 - list_share), 3)
+
+
+class ModelRoute:
+    """Модель и сервер, куда уходят запросы, подходящие под условия"""
+
+    def __init__(
+        self,
+        model: str,
+        base_url: str,
+        name: Optional[str] = None,
+        min_chars: Optional[int] = None,
+        max_chars: Optional[int] = None,
+        min_complexity: Optional[float] = None,
+        max_complexity: Optional[float] = None
+    ):
+        self.model = model
+        self.base_url = base_url.rstrip("/")
+        self.api_url = f"{self.base_url}/v1/chat/completions"
+        self.name = name or model
+        self.min_chars = min_chars
+        self.max_chars = max_chars
+        self.min_complexity = min_complexity
+        self.max_complexity = max_complexity
+
+    @property
+    def uses_complexity(self) -> bool:
+        return self.min_complexity is not None or self.max_complexity is not None
+
+    def matches(self, chars: int, complexity: Optional[float]) -> bool:
+        if self.min_chars is not None and chars < self.min_chars:
+            return False
+        if self.max_chars is not None and chars > self.max_chars:
+            return False
+        if self.min_complexity is not None and complexity < self.min_complexity:
+            return False
+        if self.max_complexity is not None and complexity > self.max_complexity:
+            return False
+        return True
+
+    def to_dict(self) -> dict:
+        conditions = {key: getattr(self, key) for key in CONDITIONS if getattr(self, key) is not None}
+        return {"name": self.name, "model": self.model, "url": self.base_url, **conditions}
+
+
+class ModelRouter:
+    """Выбор модели для текста запроса по правилам model_routes"""
+
+    def __init__(self, rules: Optional[List[dict]], default_model: str, default_url: str):
+        self.default = ModelRoute(default_model, default_url)
+        self.routes: List[ModelRoute] = []
+        for rule in rules or []:
+            if not rule.get("model"):
+                print(f"[WARNING] Правило model_routes без модели пропущено: {rule}")
+                continue
+            self.routes.append(ModelRoute(
+                rule["model"],
+                rule.get("url") or default_url,
+                rule.get("name"),
+                **{key: rule[key] for key in CONDITIONS if rule.get(key) is not None}
+            ))
+        # Сложность считается, только если ее проверяет хотя бы одно правило
+        self._needs_complexity = any(route.uses_complexity for route in self.routes)
+
+    def route(self, text: str) -> ModelRoute:
+        complexity = text_complexity(text) if self._needs_complexity else None
+        for route in self.routes:
+            if route.matches(len(text), complexity):
+                return route
+        return self.default
+
+    def targets(self) -> List[ModelRoute]:
+        """Различные пары (сервер, модель): основная модель и модели правил"""
+        targets: Dict[tuple, ModelRoute] = {(self.default.base_url, self.default.model): self.default}
+        for route in self.routes:
+            targets.setdefault((route.base_url, route.model), route)
+        return list(targets.values())
+
+    def to_dict(self) -> dict:
+        return {"default": self.default.to_dict(), "routes": [route.to_dict() for route in self.routes]}
+
+
+class ModelStats:
+    """Задержка и токены по моделям за время работы процесса"""
+
+    def __init__(self):
+        self._models: Dict[str, dict] = {}
+        self._lock = threading.Lock()
+
+    def _entry(self, route: ModelRoute) -> dict:
+        entry = self._models.get(route.name)
+        if entry is None:
+            entry = self._models[route.name] = {
+                "model": route.model, "url": route.base_url, "requests": 0, "errors": 0, "chars": 0,
+                "prompt_tokens": 0, "completion_tokens": 0, "latency_seconds": 0.0, "latency_max_seconds": 0.0,
+                "prompt_seconds": 0.0, "gen_seconds": 0.0
+            }
+        return entry
+
+    def record(
+        self,
+        route: ModelRoute,
+        chars: int,
+        prompt_tokens: int,
+        completion_tokens: int,
+        latency: float,
+        prompt_seconds: float = 0.0,
+        gen_seconds: float = 0.0
+    ) -> None:
+        """Учет одного успешного запроса к модели маршрута"""
+        with self._lock:
+            entry = self._entry(route)
+            entry["requests"] += 1
+            entry["chars"] += chars
+            entry["prompt_tokens"] += prompt_tokens
+            entry["completion_tokens"] += completion_tokens
+            entry["latency_seconds"] += latency
+            entry["latency_max_seconds"] = max(entry["latency_max_seconds"], latency)
+            entry["prompt_seconds"] += prompt_seconds
+            entry["gen_seconds"] += gen_seconds
+
+    def record_error(self, route: ModelRoute) -> None:
+        with self._lock:
+            self._entry(route)["errors"] += 1
+
+    def to_dict(self) -> Dict[str, dict]:
+        """Суммы и средние по моделям: задержка запроса, скорость промпта и генерации"""
+        with self._lock:
+            models = {name: dict(entry) for name, entry in self._models.items()}
+        for entry in models.values():
+            requests = entry["requests"]
+            entry["latency_avg_seconds"] = round(entry["latency_seconds"] / requests, 2) if requests else None
+            entry["prompt_tps"] = (
+                round(entry["prompt_tokens"] / entry["prompt_seconds"], 1) if entry["prompt_seconds"] > 0 else None
+            )
+            entry["gen_tps"] = (
+                round(entry["completion_tokens"] / entry["gen_seconds"], 1) if entry["gen_seconds"] > 0 else None
+            )
+            for key in ("latency_seconds", "latency_max_seconds", "prompt_seconds", "gen_seconds"):
+                entry[key] = round(entry[key], 2)
+        return models
@@ -0,0 +1,264 @@
+"""
+Извлечение текста PDF в изолированных процессах.
+
+Поврежденный PDF может надолго "повесить" pdfplumber или раздуть память, а
+извлечение в процессе сервера унесло бы с собой весь backend. Поэтому страницы
+извлекаются в отдельном процессе-воркере и передаются по одной через канал,
+а родитель следит за воркером:
+
+- страница дольше page_timeout секунд или падение воркера на странице:
+  воркер завершается, страница пропускается (пустой текст), извлечение
+  продолжает новый воркер со следующей страницы;
+- документ дольше extraction_timeout секунд или RSS воркера выше
+  extraction_memory_mb: воркер завершается, извлечение документа - ошибка;
+- после extraction_max_documents документов воркер перезапускается, чтобы
+  утечки памяти не копились.
+
+Воркеры запускаются методом spawn (как на Windows) и переиспользуются между
+документами: импорт pdfplumber в новом процессе занимает заметное время.
+"""
+import multiprocessing
+import threading
+import time
+from typing import Iterator, List, Optional, Sequence
+
+from resource_usage import process_rss_mb
+
+
+DEFAULT_DOCUMENT_TIMEOUT = 600.0
+DEFAULT_PAGE_TIMEOUT = 30.0
+DEFAULT_MAX_DOCUMENTS = 20
+
+# Как часто родитель проверяет время и память воркера, пока ждет страницу
+POLL_INTERVAL = 0.25
+# Сколько ждать штатного завершения воркера перед принудительным
+STOP_TIMEOUT = 2.0
+
+
+def _worker_main(conn) -> None:
+    """Цикл воркера: запрос (путь, первая страница, ключевые слова заголовков) -> текст страниц"""
+    import pdfplumber
+    from headings import heading_detector
+    from processor import read_page_text
+
+    while True:
+        request = conn.recv()
+        if request is None:
+            return
+        pdf_path, start_page, keywords = request
+        try:
+            headings = heading_detector(keywords) if keywords is not None else None
+            with pdfplumber.open(pdf_path) as pdf:
+                pages = pdf.pages
+                conn.send(("count", len(pages)))
+                for idx in range(start_page, len(pages)):
+                    conn.send(("page", idx, read_page_text(pages[idx], headings)))
+            conn.send(("done",))
+        except Exception as e:
+            conn.send(("error", str(e)))
+
+
+class _Worker:
+    """Процесс-воркер и канал к нему"""
+
+    def __init__(self, context):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_worker_main, args=(child_conn,), name="pdf-extract", daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.documents = 0
+
+    def alive(self) -> bool:
+        return self.process.is_alive()
+
+    def stop(self) -> None:
+        """Штатное завершение свободного воркера"""
+        try:
+            self.conn.send(None)
+        except (OSError, ValueError):
+            pass
+        self.process.join(STOP_TIMEOUT)
+        self.kill()
+
+    def kill(self) -> None:
+        if self.process.is_alive():
+            self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+
+class ExtractionSandbox:
+    """Пул изолированных процессов извлечения текста с ограничениями времени и памяти"""
+
+    def __init__(
+        self,
+        document_timeout: float = DEFAULT_DOCUMENT_TIMEOUT,
+        page_timeout: float = DEFAULT_PAGE_TIMEOUT,
+        memory_limit_mb: Optional[float] = None,
+        max_documents: int = DEFAULT_MAX_DOCUMENTS
+    ):
+        self._context = multiprocessing.get_context("spawn")
+        self._idle: List[_Worker] = []
+        self._lock = threading.Lock()
+        self.stats = {"documents": 0, "skipped_pages": 0, "workers_started": 0, "workers_killed": 0}
+        self.configure(document_timeout, page_timeout, memory_limit_mb, max_documents)
+
+    @classmethod
+    def from_config(cls, config: dict) -> "ExtractionSandbox":
+        sandbox = cls()
+        sandbox.configure_from(config)
+        return sandbox
+
+    def configure(
+        self,
+        document_timeout: float,
+        page_timeout: float,
+        memory_limit_mb: Optional[float],
+        max_documents: int
+    ) -> None:
+        self.document_timeout = document_timeout
+        self.page_timeout = page_timeout
+        self.memory_limit_mb = memory_limit_mb
+        self.max_documents = max(1, int(max_documents))
+
+    def configure_from(self, config: dict) -> None:
+        """Ограничения из конфигурации (лимит памяти по умолчанию - memory_limit_mb)"""
+        self.configure(
+            config.get("extraction_timeout", DEFAULT_DOCUMENT_TIMEOUT),
+            config.get("page_timeout", DEFAULT_PAGE_TIMEOUT),
+            config.get("extraction_memory_mb", config.get("memory_limit_mb")),
+            config.get("extraction_max_documents", DEFAULT_MAX_DOCUMENTS)
+        )
+
+    def _acquire(self) -> _Worker:
+        with self._lock:
+            while self._idle:
+                worker = self._idle.pop()
+                if worker.alive():
+                    return worker
+                worker.kill()
+            self.stats["workers_started"] += 1
+        return _Worker(self._context)
+
+    def _release(self, worker: _Worker) -> None:
+        """Воркер свободен; отработавший свое число документов перезапускается"""
+        if worker.documents >= self.max_documents or not worker.alive():
+            worker.stop()
+            return
+        with self._lock:
+            self._idle.append(worker)
+
+    def _kill(self, worker: _Worker) -> None:
+        self.stats["workers_killed"] += 1
+        worker.kill()
+
+    def iter_page_texts(
+        self,
+        pdf_path: str,
+        heading_keywords: Optional[Sequence[str]] = None,
+        skipped: Optional[List[int]] = None
+    ) -> Iterator[str]:
+        """
+        Текст страниц PDF, извлеченный в процессе-воркере
+
+        Args:
+            pdf_path: Путь к PDF
+            heading_keywords: Ключевые слова заголовков для пометки строк,
+                выделенных шрифтом (None - без пометки)
+            skipped: Сюда добавляются номера (с нуля) пропущенных страниц
+
+        Пропущенная страница выдается пустой строкой, номера остальных страниц
+        не сдвигаются. Превышение времени документа или памяти воркера -
+        исключение.
+        """
+        deadline = time.monotonic() + self.document_timeout
+        keywords = list(heading_keywords) if heading_keywords is not None else None
+        total: Optional[int] = None
+        next_page = 0
+        worker: Optional[_Worker] = None
+        try:
+            while total is None or next_page < total:
+                worker = self._acquire()
+                worker.conn.send((str(pdf_path), next_page, keywords))
+                # Запуск воркера и открытие PDF ограничены только временем документа
+                opened = False
+                page_started = time.monotonic()
+                failure = None
+                while failure is None:
+                    now = time.monotonic()
+                    if now > deadline:
+                        raise Exception(f"Превышено время извлечения текста: {self.document_timeout:g} с")
+                    if opened and now - page_started > self.page_timeout:
+                        failure = f"дольше {self.page_timeout:g} с"
+                        break
+                    rss = process_rss_mb(worker.process.pid) if self.memory_limit_mb else None
+                    if rss is not None and rss > self.memory_limit_mb:
+                        raise Exception(
+                            f"Превышен лимит памяти при извлечении текста: {rss:.0f} МБ "
+                            f"при ограничении {self.memory_limit_mb:.0f} МБ"
+                        )
+                    wait = min(POLL_INTERVAL, deadline - now)
+                    if opened:
+                        wait = min(wait, self.page_timeout - (now - page_started))
+                    try:
+                        if not worker.conn.poll(max(wait, 0.0)):
+                            continue
+                        message = worker.conn.recv()
+                    except (EOFError, OSError):
+                        failure = "воркер извлечения завершился аварийно"
+                        break
+                    kind = message[0]
+                    if kind == "count":
+                        opened = True
+                        total = message[1]
+                    elif kind == "page":
+                        next_page = message[1] + 1
+                        yield message[2]
+                    elif kind == "done":
+                        break
+                    elif kind == "error":
+                        worker.documents += 1
+                        self._release(worker)
+                        worker = None
+                        raise Exception(message[1])
+                    # Время страницы отсчитывается от предыдущей (обработка страницы получателем не учитывается)
+                    page_started = time.monotonic()
+
+                if failure is None:
+                    worker.documents += 1
+                    self._release(worker)
+                    worker = None
+                    continue
+
+                self._kill(worker)
+                worker = None
+                if not opened:
+                    raise Exception(f"Не удалось открыть PDF: {failure}")
+                print(f"[WARNING] Страница {next_page + 1} пропущена: {failure}")
+                self.stats["skipped_pages"] += 1
+                if skipped is not None:
+                    skipped.append(next_page)
+                next_page += 1
+                yield ""
+            self.stats["documents"] += 1
+        finally:
+            # Извлечение прервано посреди документа: воркер занят и не может быть переиспользован
+            if worker is not None:
+                self._kill(worker)
+
+    def close(self) -> None:
+        """Завершение свободных воркеров"""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for worker in idle:
+            worker.stop()
+
+    def to_dict(self) -> dict:
+        return {
+            **self.stats,
+            "idle_workers": len(self._idle),
+            "document_timeout": self.document_timeout,
+            "page_timeout": self.page_timeout,
+            "memory_limit_mb": self.memory_limit_mb,
+            "max_documents": self.max_documents
+        }
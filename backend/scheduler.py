@@ -0,0 +1,257 @@
+"""
+Планировщик запросов к LLM между одновременно выполняющимися задачами.
+
+Каждый запрос чанка к серверу LLM проходит через планировщик: свободный слот
+(число одновременных запросов, llm_slots) получает задача, выбранная политикой.
+
+- fair: взвешенное справедливое разделение (start-time fair queueing). Каждая
+  задача копит виртуальное время "обслуженные токены / вес"; слот получает
+  задача с наименьшим временем начала. Новая или простаивавшая задача
+  начинает с текущих виртуальных часов и не накапливает кредит, поэтому
+  десятистраничная методичка получает свою долю GPU сразу, а не после книги
+  на 1000 страниц.
+- sjf: сначала задача с наименьшей оценкой оставшихся токенов.
+- fifo: в порядке запуска задач (поведение без планировщика).
+
+Задачи с большим priority всегда обслуживаются раньше, внутри одного
+приоритета действует политика. Для каждой задачи учитывается ожидание в
+очереди: до первого запроса и для каждого запроса.
+
+У задачи не больше одного запроса в очереди, а между чанками она делает
+паузу (сохранение, задержка для VRAM). Если отдавать слот любому, кто ждет,
+политика вырождается в поочередное обслуживание. Поэтому планировщик
+упреждающий: задача, только что закончившая запрос, еще anticipation секунд
+считается претендентом, и если по политике слот ее, он ее дожидается.
+"""
+import asyncio
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Deque, Dict, Iterable, List, Optional
+
+
+POLICIES = ("fair", "sjf", "fifo")
+
+# Вес задачи не может быть нулевым: ее виртуальное время росло бы бесконечно
+MIN_WEIGHT = 0.01
+
+# Сколько завершенных задач остается в отчете
+FINISHED_HISTORY = 50
+
+# Сколько секунд слот ждет следующего запроса задачи, которой он положен по политике
+DEFAULT_ANTICIPATION = 2.0
+
+
+class JobShare:
+    """Учет обслуживания одной задачи"""
+
+    def __init__(self, job_id: str, weight: float = 1.0, priority: int = 0, remaining_tokens: float = 0.0):
+        self.job_id = job_id
+        self.weight = max(float(weight), MIN_WEIGHT)
+        self.priority = int(priority)
+        self.remaining_tokens = float(remaining_tokens)
+        # Время окончания последнего выданного запроса в виртуальных часах
+        self.vtime = 0.0
+        self.registered_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.released_at: Optional[float] = None
+        self.first_wait: Optional[float] = None
+        self.turns = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.served_tokens = 0.0
+
+    def record_wait(self, waited: float) -> None:
+        if self.first_wait is None:
+            self.first_wait = time.time() - self.registered_at
+        self.turns += 1
+        self.wait_total += waited
+        self.wait_max = max(self.wait_max, waited)
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.job_id,
+            "priority": self.priority,
+            "weight": self.weight,
+            "requests": self.turns,
+            "served_tokens": int(self.served_tokens),
+            "remaining_tokens": int(self.remaining_tokens),
+            "first_wait_seconds": round(self.first_wait, 2) if self.first_wait is not None else None,
+            "wait_avg_seconds": round(self.wait_total / self.turns, 2) if self.turns else None,
+            "wait_max_seconds": round(self.wait_max, 2),
+            "wait_total_seconds": round(self.wait_total, 2),
+            "finished_at": self.finished_at
+        }
+
+
+def order_key(share, policy: str, vclock: float = 0.0) -> tuple:
+    """
+    Ключ выбора задачи (меньше - раньше)
+
+    Принимает JobShare или объект с теми же полями (priority, weight, vtime,
+    remaining_tokens, registered_at) - так же выбирает задачу очередь воркеров.
+    """
+    if policy == "sjf":
+        rank = share.remaining_tokens
+    elif policy == "fifo":
+        rank = share.registered_at
+    else:
+        rank = max(share.vtime, vclock)
+    return (-share.priority, rank, share.registered_at)
+
+
+def work_before_done(shares: Iterable, job_id: str, policy: str) -> Optional[float]:
+    """
+    Оценка токенов, которые сервер обработает до завершения задачи (включая ее собственные)
+
+    fair: задача j за это время получит min(ее остаток, остаток задачи * w_j / w);
+    sjf и fifo: все задачи, идущие раньше по ключу, обслуживаются целиком.
+    Задачи с большим приоритетом идут целиком, с меньшим - не мешают.
+    """
+    shares = list(shares)
+    own = next((share for share in shares if share.job_id == job_id), None)
+    if own is None:
+        return None
+    total = 0.0
+    for share in shares:
+        if share is own or share.priority > own.priority:
+            total += share.remaining_tokens
+        elif share.priority < own.priority:
+            continue
+        elif policy == "fair":
+            total += min(share.remaining_tokens, own.remaining_tokens * share.weight / own.weight)
+        elif order_key(share, policy) < order_key(own, policy):
+            total += share.remaining_tokens
+    return total
+
+
+class FairScheduler:
+    """Очередь запросов к LLM от нескольких задач с ограничением числа одновременных запросов"""
+
+    def __init__(self, slots: int = 1, policy: str = "fair", anticipation: float = DEFAULT_ANTICIPATION):
+        self.slots = max(1, int(slots))
+        self.policy = policy if policy in POLICIES else "fair"
+        self.anticipation = anticipation
+        self.jobs: Dict[str, JobShare] = {}
+        self.finished: Deque[JobShare] = deque(maxlen=FINISHED_HISTORY)
+        self._waiting: Dict[str, Deque[tuple]] = {}
+        self._busy = 0
+        # Виртуальные часы: время начала последнего выданного запроса
+        self._vclock = 0.0
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    def configure(self, slots: int, policy: str, anticipation: float = DEFAULT_ANTICIPATION) -> None:
+        """Смена числа слотов и политики на лету (из /config)"""
+        grown = max(1, int(slots)) > self.slots
+        self.slots = max(1, int(slots))
+        self.policy = policy if policy in POLICIES else "fair"
+        self.anticipation = anticipation
+        if grown:
+            self._dispatch()
+
+    def register(self, job_id: str, weight: float = 1.0, priority: int = 0, remaining_tokens: float = 0.0) -> JobShare:
+        """Задача начинает запрашивать LLM (повторная регистрация обновляет параметры)"""
+        share = self.jobs.get(job_id)
+        if share is None:
+            share = JobShare(job_id, weight, priority, remaining_tokens)
+            share.vtime = self._vclock
+            self.jobs[job_id] = share
+        else:
+            share.weight = max(float(weight), MIN_WEIGHT)
+            share.priority = int(priority)
+            share.remaining_tokens = float(remaining_tokens)
+        return share
+
+    def unregister(self, job_id: str) -> Optional[JobShare]:
+        """Задача завершена: ее учет переходит в историю"""
+        share = self.jobs.pop(job_id, None)
+        for future, _, _ in self._waiting.pop(job_id, ()):
+            if not future.done():
+                future.cancel()
+        if share is not None:
+            share.finished_at = time.time()
+            share.remaining_tokens = 0.0
+            self.finished.append(share)
+            # Слот мог ждать эту задачу
+            self._dispatch()
+        return share
+
+    def work_before_done(self, job_id: str) -> Optional[float]:
+        return work_before_done(self.jobs.values(), job_id, self.policy)
+
+    @asynccontextmanager
+    async def turn(self, job_id: str, tokens: float):
+        """Ожидание слота для запроса задачи объемом tokens входных токенов"""
+        share = self.jobs.get(job_id) or self.register(job_id)
+        future = asyncio.get_event_loop().create_future()
+        enqueued = time.time()
+        self._waiting.setdefault(job_id, deque()).append((future, tokens, enqueued))
+        self._dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            # Слот мог быть выдан одновременно с отменой: возвращаем его
+            if future.done() and not future.cancelled():
+                self._release(share)
+            raise
+        share.record_wait(time.time() - enqueued)
+        try:
+            yield
+        finally:
+            self._release(share)
+
+    def _release(self, share: JobShare) -> None:
+        self._busy -= 1
+        share.released_at = time.time()
+        self._dispatch()
+
+    def _anticipated(self, now: float) -> List[JobShare]:
+        """Задачи без запроса в очереди, которые недавно закончили запрос и вот-вот пришлют следующий"""
+        return [
+            share for job_id, share in self.jobs.items()
+            if not self._waiting.get(job_id) and share.released_at is not None
+            and now - share.released_at < self.anticipation
+        ]
+
+    def _dispatch(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        while self._busy < self.slots:
+            waiting = [self.jobs[job_id] for job_id, queue in self._waiting.items() if queue and job_id in self.jobs]
+            if not waiting:
+                return
+            now = time.time()
+            key = lambda s: order_key(s, self.policy, self._vclock)
+            share = min(waiting, key=key)
+            held = [other for other in self._anticipated(now) if key(other) < key(share)]
+            if held:
+                # Слот ждет задачу, которой он положен; после паузы отдается ожидающим
+                expires = min(other.released_at for other in held) + self.anticipation
+                self._timer = asyncio.get_event_loop().call_later(max(0.0, expires - now), self._dispatch)
+                return
+            future, tokens, _ = self._waiting[share.job_id].popleft()
+            if future.done():
+                continue
+            start = max(share.vtime, self._vclock)
+            self._vclock = start
+            share.vtime = start + tokens / share.weight
+            share.served_tokens += tokens
+            share.remaining_tokens = max(0.0, share.remaining_tokens - tokens)
+            self._busy += 1
+            future.set_result(None)
+
+    def to_dict(self) -> dict:
+        """Отчет для подбора политики: ожидание в очереди и обслуженные токены по задачам"""
+        active: List[dict] = []
+        for share in self.jobs.values():
+            entry = share.to_dict()
+            entry["waiting_requests"] = len(self._waiting.get(share.job_id, ()))
+            active.append(entry)
+        return {
+            "policy": self.policy,
+            "slots": self.slots,
+            "busy_slots": self._busy,
+            "active": active,
+            "finished": [share.to_dict() for share in reversed(self.finished)]
+        }
@@ -0,0 +1,186 @@
+"""
+Нормализация текста для полнотекстового поиска.
+
+Русские слова приводятся к основе алгоритмом Snowball (Russian stemmer),
+английские - упрощенным отсечением окончаний. Основа - всегда начало слова,
+поэтому в индексе FTS5 хранится исходный текст (фрагменты результатов строит
+snippet()), а запрос ищет слова по префиксу-основе: "экономика", "экономики" и
+"экономикой" находятся одним запросом.
+"""
+import re
+from functools import lru_cache
+from typing import List, Optional, Tuple
+
+WORD = re.compile(r"[0-9a-zа-яё]+", re.IGNORECASE)
+
+VOWELS = set("аеиоуыэюя")
+
+PERFECTIVE_GERUND = (("в", "вши", "вшись"), ("ив", "ивши", "ившись", "ыв", "ывши", "ывшись"))
+ADJECTIVE = (
+    "ее", "ие", "ые", "ое", "ими", "ыми", "ей", "ий", "ый", "ой", "ем", "им", "ым", "ом",
+    "его", "ого", "ему", "ому", "их", "ых", "ую", "юю", "ая", "яя", "ою", "ею"
+)
+PARTICIPLE = (("ем", "нн", "вш", "ющ", "щ"), ("ивш", "ывш", "ующ"))
+REFLEXIVE = ("ся", "сь")
+VERB = (
+    ("ла", "на", "ете", "йте", "ли", "й", "л", "ем", "н", "ло", "но", "ет", "ют", "ны", "ть", "ешь", "нно"),
+    ("ила", "ыла", "ена", "ейте", "уйте", "ите", "или", "ыли", "ей", "уй", "ил", "ыл", "им", "ым", "ен",
+     "ило", "ыло", "ено", "ят", "ует", "уют", "ит", "ыт", "ены", "ить", "ыть", "ишь", "ую", "ю")
+)
+NOUN = (
+    "а", "ев", "ов", "ие", "ье", "е", "иями", "ями", "ами", "еи", "ии", "и", "ией", "ей", "ой", "ий",
+    "й", "иям", "ям", "ием", "ем", "ам", "ом", "о", "у", "ах", "иях", "ях", "ы", "ь", "ию", "ью", "ю",
+    "ия", "ья", "я"
+)
+SUPERLATIVE = ("ейше", "ейш")
+DERIVATIONAL = ("ость", "ост")
+
+# Фрагмент исходного текста главы в индексе: из него строится цитата в результатах поиска
+PASSAGE_CHARS = 2000
+
+# Основы короче ищутся как целое слово
+MIN_PREFIX_CHARS = 3
+
+ENGLISH_SUFFIXES = ("ations", "ation", "ings", "ing", "ies", "ied", "es", "ed", "ly", "s")
+
+
+def _strip(word: str, suffixes, preceded: bool = False) -> Optional[str]:
+    """Отсечение самого длинного окончания; для группы 1 окончание должно идти после а/я"""
+    for suffix in sorted(suffixes, key=len, reverse=True):
+        if word.endswith(suffix):
+            stem = word[:-len(suffix)]
+            if preceded and not stem.endswith(("а", "я")):
+                continue
+            return stem
+    return None
+
+
+def _strip_groups(word: str, groups) -> Optional[str]:
+    """Группа 1 (после а/я) и группа 2; побеждает более длинное окончание"""
+    candidates = [stem for stem in (_strip(word, groups[0], preceded=True), _strip(word, groups[1])) if stem is not None]
+    return min(candidates, key=len) if candidates else None
+
+
+def _regions(word: str) -> Tuple[int, int]:
+    """Начала областей RV и R2"""
+    rv = len(word)
+    for i, ch in enumerate(word):
+        if ch in VOWELS:
+            rv = i + 1
+            break
+
+    def region_after(start: int) -> int:
+        for i in range(start + 1, len(word)):
+            if word[i] not in VOWELS and word[i - 1] in VOWELS:
+                return i + 1
+        return len(word)
+
+    r1 = region_after(0)
+    return rv, region_after(r1)
+
+
+def _stem_russian(word: str) -> str:
+    rv_start, r2_start = _regions(word)
+    prefix, rv = word[:rv_start], word[rv_start:]
+
+    # Шаг 1: деепричастие, иначе возвратность и прилагательное/глагол/существительное
+    stem = _strip_groups(rv, PERFECTIVE_GERUND)
+    if stem is not None:
+        rv = stem
+    else:
+        reflexive = _strip(rv, REFLEXIVE)
+        if reflexive is not None:
+            rv = reflexive
+        adjective = _strip(rv, ADJECTIVE)
+        if adjective is not None:
+            participle = _strip_groups(adjective, PARTICIPLE)
+            rv = participle if participle is not None else adjective
+        else:
+            stem = _strip_groups(rv, VERB)
+            if stem is None:
+                stem = _strip(rv, NOUN)
+            if stem is not None:
+                rv = stem
+
+    # Шаг 2
+    if rv.endswith("и"):
+        rv = rv[:-1]
+
+    # Шаг 3: словообразовательное окончание в R2
+    r2 = max(0, r2_start - rv_start)
+    for suffix in DERIVATIONAL:
+        if rv.endswith(suffix) and len(rv) - len(suffix) >= r2:
+            rv = rv[:-len(suffix)]
+            break
+
+    # Шаг 4
+    if rv.endswith("нн"):
+        rv = rv[:-1]
+    else:
+        stem = _strip(rv, SUPERLATIVE)
+        if stem is not None:
+            rv = stem[:-1] if stem.endswith("нн") else stem
+        elif rv.endswith("ь"):
+            rv = rv[:-1]
+
+    return prefix + rv
+
+
+def _stem_english(word: str) -> str:
+    for suffix in ENGLISH_SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3 and not word.endswith("ss"):
+            return word[:-len(suffix)]
+    return word
+
+
+@lru_cache(maxsize=65536)
+def stem(word: str) -> str:
+    """Основа слова (кешируется: словарь книги ограничен)"""
+    word = word.lower().replace("ё", "е")
+    if word.isdigit() or len(word) <= 2:
+        return word
+    if "а" <= word[0] <= "я":
+        return _stem_russian(word)
+    return _stem_english(word)
+
+
+def tokenize(text: str) -> List[str]:
+    return [stem(word) for word in WORD.findall(text)]
+
+
+def match_query(query: str, any_term: bool = False) -> Optional[str]:
+    """
+    Запрос FTS5: все основы запроса (AND, с any_term - любая из них), каждая в кавычках - без синтаксиса FTS
+
+    Основа ищется как префикс слова; короткие слова и числа - целиком, иначе
+    "в*" совпало бы почти с каждым словом текста.
+    """
+    stems = tokenize(query)
+    if not stems:
+        return None
+    return (" OR " if any_term else " ").join(
+        f'"{s}"*' if len(s) >= MIN_PREFIX_CHARS and not s.isdigit() else f'"{s}"'
+        for s in dict.fromkeys(stems)
+    )
+
+
+def split_passages(text: str, max_chars: int = PASSAGE_CHARS) -> List[str]:
+    """Фрагменты текста не длиннее max_chars, разрезанные по строкам (длинные строки - по пробелам)"""
+    passages = []
+    start = 0
+    while start < len(text):
+        end = start + max_chars
+        if end >= len(text):
+            cut = len(text)
+        else:
+            # Разрез во второй половине фрагмента: по переводу строки, иначе по пробелу
+            cut = text.rfind("\n", start + max_chars // 2, end)
+            if cut < 0:
+                cut = text.rfind(" ", start + max_chars // 2, end)
+            if cut < 0:
+                cut = end
+        passage = text[start:cut].strip()
+        if passage:
+            passages.append(passage)
+        start = cut
+    return passages
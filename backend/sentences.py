@@ -0,0 +1,160 @@
+"""
+Границы предложений для нарезки глав на чанки.
+
+Индекс границ строится один раз для всей главы: сначала склеиваются переносы
+слов в конце строки из PDF ("сло-\\nво"), затем находятся концы предложений
+(знак препинания, закрывающие кавычки и скобки, пробел и заглавная буква,
+цифра, кавычка или тире диалога) и пустые строки между абзацами. Каждое
+выражение начинается с литерала, поэтому движок ищет его быстрым поиском
+подстроки, а не проверяет класс символов в каждой позиции текста. Точка после
+сокращения ("рис. 5", "т.е. Москва", "проф. Иванов") или инициала ("А. С.
+Пушкин", "J. R. R. Tolkien") границей не считается.
+
+Нарезка на чанки выбирает для каждого чанка последнюю границу перед пределом
+размера двоичным поиском по индексу и не копирует окна текста.
+"""
+import re
+from bisect import bisect_left, bisect_right
+from typing import Dict, List, Tuple
+
+
+# Перенос слова: буква, дефис, перевод строки и продолжение слова со строчной буквы
+HYPHENATION = re.compile(r"-(?<=[^\W\d_]-)\n[^\S\n]*(?=[a-zа-яё])")
+
+# Конец абзаца: пустая строка
+PARAGRAPH = re.compile(r"\n[^\S\n]*\n\s*")
+
+# Сокращения, после которых точка не заканчивает предложение (в нижнем регистре, без последней точки)
+ABBREVIATIONS = {
+    # русские: ссылки, звания, адреса
+    "рис", "табл", "стр", "с", "см", "ср", "т", "тт", "гл", "п", "пп", "ч", "ст", "им", "ул", "д",
+    "г", "гг", "в", "вв", "проф", "акад", "доц", "канд", "напр", "прим", "изд", "вып", "ред", "англ", "лат",
+    "т.е", "т.к", "т.н", "т.ч", "н.э", "и.о",
+    # английские
+    "mr", "mrs", "ms", "dr", "prof", "st", "jr", "sr", "vs", "cf", "fig", "figs", "eq", "no", "vol",
+    "ch", "sec", "p", "pp", "ed", "e.g", "i.e", "al",
+}
+
+
+def _abbreviation_guard(words) -> str:
+    """Просмотр назад: точка не стоит после сокращения (без учета регистра) или инициала"""
+    by_length: Dict[int, List[str]] = {}
+    for word in sorted(words):
+        by_length.setdefault(len(word), []).append(re.escape(word))
+    # У просмотра назад фиксированная длина: сокращения группируются по длине
+    guards = [rf"(?<!\b(?i:{'|'.join(group)})\.)" for _, group in sorted(by_length.items())]
+    return "".join(guards) + r"(?<!\W[A-ZА-ЯЁ]\.)"
+
+
+# Конец предложения: знаки препинания, закрывающие кавычки/скобки, пробел и начало следующего предложения
+SENTENCE_ENDS = [
+    re.compile(
+        re.escape(mark) + (_abbreviation_guard(ABBREVIATIONS) if mark == "." else "")
+        + r"[.!?…]*(?P<mark>[»\"”')\]]*)\s+(?=[«\"„(\[—–A-ZА-ЯЁ0-9-])"
+    )
+    for mark in ".!?…"
+]
+
+# Чанк не короче этой доли предела: иначе режется по строке, слову или посимвольно
+MIN_FILL = 0.7
+
+
+class SentenceIndex:
+    """Текст главы со склеенными переносами и границами предложений в нем"""
+
+    def __init__(self, text: str, ends: List[int], starts: List[int]):
+        self.text = text
+        # ends[i] - конец i-го предложения (после знака препинания), starts[i] - начало следующего
+        self.ends = ends
+        self.starts = starts
+
+    def __len__(self) -> int:
+        return len(self.ends)
+
+    def spans(self) -> List[Tuple[int, int]]:
+        """Границы предложений [начало, конец) без пробелов по краям"""
+        text = self.text
+        begin = len(text) - len(text.lstrip())
+        spans = []
+        for end, start in zip(self.ends, self.starts):
+            if end > begin:
+                spans.append((begin, end))
+            begin = start
+        end = len(text.rstrip())
+        if end > begin:
+            spans.append((begin, end))
+        return spans
+
+
+def sentence_index(text: str) -> SentenceIndex:
+    """Индекс границ предложений всего текста (переносы слов склеиваются)"""
+    text = HYPHENATION.sub("", text)
+    # Начало следующего предложения -> конец предыдущего; "?!" и "..." находятся
+    # выражениями нескольких знаков, граница остается одна
+    boundaries: Dict[int, int] = {}
+    for pattern in SENTENCE_ENDS:
+        for match in pattern.finditer(text):
+            boundaries.setdefault(match.end(), match.end("mark"))
+    for match in PARAGRAPH.finditer(text):
+        end = match.start()
+        # Пробелы в конце последней строки абзаца
+        while end > 0 and text[end - 1] in " \t\r":
+            end -= 1
+        boundaries.setdefault(match.end(), end)
+    starts = sorted(boundaries)
+    return SentenceIndex(text, [boundaries[start] for start in starts], starts)
+
+
+def _fallback_cut(text: str, start: int, limit: int, lowest: int) -> Tuple[int, int]:
+    """Разрез без границы предложения: по переводу строки, пробелу или ровно по пределу"""
+    for separator in ("\n", " "):
+        cut = text.rfind(separator, lowest, limit)
+        if cut > start:
+            return cut, cut + 1
+    return limit, limit
+
+
+def split_chunks(text: str, max_chars: int, overlap: int = 0) -> List[str]:
+    """
+    Нарезка текста на чанки не длиннее max_chars по границам предложений
+
+    Args:
+        text: Текст главы
+        max_chars: Максимальный размер чанка в символах
+        overlap: Сколько символов конца чанка (целыми предложениями) повторяется
+            в начале следующего, не больше половины max_chars
+
+    Returns:
+        Чанки без пробелов по краям; переносы слов склеены
+    """
+    index = sentence_index(text)
+    text = index.text
+    ends, starts = index.ends, index.starts
+    overlap = min(max(0, int(overlap)), max_chars // 2)
+    length = len(text.rstrip())
+    start = len(text) - len(text.lstrip())
+    chunks: List[str] = []
+    while start < length:
+        limit = start + max_chars
+        if limit >= length:
+            chunks.append(text[start:length])
+            break
+        lowest = start + int(max_chars * MIN_FILL)
+        # Последняя граница предложения, при которой чанк не длиннее предела
+        i = bisect_right(ends, limit) - 1
+        if i >= 0 and ends[i] > lowest:
+            end, next_start = ends[i], starts[i]
+            chunks.append(text[start:end])
+        else:
+            end, next_start = _fallback_cut(text, start, limit, lowest)
+            # Разрез не по границе предложения может оставить пробелы по краям
+            chunks.append(text[start:end].strip())
+        if overlap:
+            # Первое предложение, начинающееся в последних overlap символах чанка
+            j = bisect_left(starts, end - overlap)
+            if j < len(starts) and start < starts[j] < next_start:
+                next_start = starts[j]
+        start = next_start
+        while start < length and text[start].isspace():
+            start += 1
+    return [chunk for chunk in chunks if chunk]
@@ -0,0 +1,49 @@
+"""
+Хранение списков текстов на диске.
+
+Главы записываются построчно в JSON Lines и читаются по требованию, поэтому
+в памяти держится только индекс смещений, а не весь текст книги.
+"""
+import json
+from collections.abc import Sequence
+from pathlib import Path
+from typing import Iterable, List
+
+
+def write_jsonl(path: Path, items: Iterable[str]) -> int:
+    """Потоковая запись строк в JSON Lines; возвращает число записей"""
+    count = 0
+    with open(path, "w", encoding="utf-8", newline="\n") as f:
+        for item in items:
+            f.write(json.dumps(item, ensure_ascii=False))
+            f.write("\n")
+            count += 1
+    return count
+
+
+class JsonLinesSequence(Sequence):
+    """Список строк из JSON Lines с чтением элементов по смещению"""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.offsets: List[int] = []
+        offset = 0
+        with open(self.path, "rb") as f:
+            for line in f:
+                self.offsets.append(offset)
+                offset += len(line)
+
+    def __len__(self) -> int:
+        return len(self.offsets)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        with open(self.path, "rb") as f:
+            f.seek(self.offsets[index])
+            return json.loads(f.readline().decode("utf-8"))
+
+    def __iter__(self):
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                yield json.loads(line)
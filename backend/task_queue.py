@@ -0,0 +1,471 @@
+"""
+Очередь задач для распределенной обработки глав.
+
+API ставит главы в очередь, процессы worker.py (на той же или других машинах,
+рядом со своими серверами LLM) берут их в аренду, продлевают аренду
+heartbeat-ами и возвращают результат. Задачи с просроченной арендой
+(упавший или зависший воркер) возвращаются в очередь; готовые конспекты
+чанков сохраняются в задаче, поэтому другой воркер продолжает с того же места.
+
+Главы разных задач выдаются по той же политике, что и запросы в самом API
+(scheduler_policy: fair, sjf или fifo, с учетом priority и weight задачи).
+
+Брокер по умолчанию - SQLite-файл (общий для API и локальных воркеров).
+Удаленные воркеры работают через HTTP API (HTTPBroker, только методы воркера -
+WorkerBroker); свой брокер для API (наследник TaskBroker) можно подключить
+параметром task_broker = "модуль:Класс".
+"""
+import importlib
+import json
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import requests
+
+from scheduler import JobShare, order_key
+from throughput import estimate_tokens
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    id INTEGER PRIMARY KEY,
+    job_id TEXT NOT NULL,
+    chapter_idx INTEGER NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL,
+    worker_id TEXT,
+    lease_expires REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    chunks TEXT NOT NULL DEFAULT '{}',
+    chunks_total INTEGER,
+    result TEXT,
+    error TEXT,
+    stats TEXT,
+    updated_at REAL NOT NULL,
+    UNIQUE (job_id, chapter_idx)
+);
+CREATE INDEX IF NOT EXISTS tasks_status ON tasks(status, id);
+CREATE INDEX IF NOT EXISTS tasks_lease ON tasks(status, lease_expires);
+
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id TEXT PRIMARY KEY,
+    priority INTEGER NOT NULL DEFAULT 0,
+    weight REAL NOT NULL DEFAULT 1.0,
+    vtime REAL NOT NULL DEFAULT 0,
+    submitted_at REAL NOT NULL,
+    first_lease_at REAL,
+    leases INTEGER NOT NULL DEFAULT 0,
+    wait_total REAL NOT NULL DEFAULT 0,
+    wait_max REAL NOT NULL DEFAULT 0,
+    served_tokens REAL NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS workers (
+    id TEXT PRIMARY KEY,
+    info TEXT,
+    last_seen REAL NOT NULL
+);
+"""
+
+
+class WorkerBroker(ABC):
+    """
+    Интерфейс брокера для воркера
+
+    Задача - словарь {id, job_id, chapter_idx, text, settings, chunks, attempts}.
+    Методы возвращают False, если аренда потеряна (истекла или задача отменена):
+    воркер должен прекратить обработку.
+    """
+
+    @abstractmethod
+    def lease(self, worker_id: str, lease_seconds: float) -> Optional[dict]:
+        """Аренда следующей задачи по политике очереди (None - очередь пуста)"""
+
+    @abstractmethod
+    def heartbeat(self, task_id: int, worker_id: str, lease_seconds: float) -> bool:
+        """Продление аренды"""
+
+    @abstractmethod
+    def save_chunk(self, task_id: int, worker_id: str, chunk_idx: int, total: int, summary: str) -> bool:
+        """Сохранение готового чанка главы"""
+
+    @abstractmethod
+    def complete(self, task_id: int, worker_id: str, summary: str, stats: Optional[dict] = None) -> bool:
+        """Готовый конспект главы"""
+
+    @abstractmethod
+    def fail(self, task_id: int, worker_id: str, error: str, max_attempts: int) -> bool:
+        """Ошибка: задача возвращается в очередь, пока не исчерпаны попытки"""
+
+
+class TaskBroker(WorkerBroker):
+    """Интерфейс брокера для API: постановка задач и результаты в дополнение к методам воркера"""
+
+    @abstractmethod
+    def submit(self, job_id: str, tasks: List[dict], settings: dict, priority: int = 0, weight: float = 1.0) -> None:
+        """Постановка глав задачи в очередь: [{chapter_idx, text, chunks}]"""
+
+    @abstractmethod
+    def queue_stats(self) -> List[dict]:
+        """Ожидание в очереди и обслуженные токены по задачам"""
+
+    @abstractmethod
+    def finished(self, job_id: str) -> List[dict]:
+        """Завершенные (done/failed) задачи: [{chapter_idx, status, result, error, chunks, stats}]"""
+
+    @abstractmethod
+    def progress(self, job_id: str) -> Dict[int, tuple]:
+        """Готовые чанки незавершенных глав: {chapter_idx: (готово, всего)}"""
+
+    @abstractmethod
+    def cancel_job(self, job_id: str) -> None:
+        """Отмена незавершенных задач"""
+
+    @abstractmethod
+    def clear_job(self, job_id: str) -> None:
+        """Удаление задач и статистики задачи из очереди"""
+
+    @abstractmethod
+    def requeue_expired(self) -> int:
+        """Возврат в очередь задач с просроченной арендой; возвращает их число"""
+
+    @abstractmethod
+    def active_workers(self, window: float = 60.0) -> int:
+        """Воркеры, обращавшиеся к очереди за последние window секунд"""
+
+
+class SQLiteBroker(TaskBroker):
+    """Очередь в файле SQLite; аренда выдается под блокировкой записи (BEGIN IMMEDIATE)"""
+
+    def __init__(self, db_path: Path, policy: str = "fair"):
+        self.db_path = Path(db_path)
+        self.policy = policy
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        self._conn().executescript(SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        # Отдельное соединение на поток: API вызывает брокер из пула потоков
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.db_path), timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _transaction(self):
+        broker = self
+
+        class Transaction:
+            def __enter__(self):
+                self.conn = broker._conn()
+                self.conn.execute("BEGIN IMMEDIATE")
+                return self.conn
+
+            def __exit__(self, exc_type, exc, tb):
+                self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+
+        return Transaction()
+
+    def submit(self, job_id: str, tasks: List[dict], settings: dict, priority: int = 0, weight: float = 1.0) -> None:
+        now = time.time()
+        with self._transaction() as conn:
+            # Учет ожидания начинается заново с каждой постановки задачи
+            conn.execute(
+                """INSERT OR REPLACE INTO jobs (job_id, priority, weight, submitted_at)
+                   VALUES (?, ?, ?, ?)""",
+                (job_id, priority, weight, now)
+            )
+            indices = [task["chapter_idx"] for task in tasks]
+            conn.execute(
+                f"DELETE FROM tasks WHERE job_id = ? AND chapter_idx NOT IN ({','.join('?' * len(indices))})",
+                (job_id, *indices)
+            )
+            for task in tasks:
+                payload = json.dumps({"text": task["text"], "settings": settings}, ensure_ascii=False)
+                row = conn.execute(
+                    "SELECT payload, status, chunks FROM tasks WHERE job_id = ? AND chapter_idx = ?",
+                    (job_id, task["chapter_idx"])
+                ).fetchone()
+                if row is not None and row["payload"] == payload:
+                    # Та же глава: готовый результат сохраняется, незавершенная возвращается в очередь
+                    if row["status"] != "done":
+                        conn.execute(
+                            """UPDATE tasks SET status = 'queued', worker_id = NULL, lease_expires = NULL,
+                                   attempts = 0, error = NULL, updated_at = ?
+                               WHERE job_id = ? AND chapter_idx = ?""",
+                            (now, job_id, task["chapter_idx"])
+                        )
+                    continue
+                conn.execute(
+                    """INSERT OR REPLACE INTO tasks (job_id, chapter_idx, payload, status, chunks, updated_at)
+                       VALUES (?, ?, ?, 'queued', ?, ?)""",
+                    (job_id, task["chapter_idx"], payload,
+                     json.dumps({str(k): v for k, v in (task.get("chunks") or {}).items()}, ensure_ascii=False), now)
+                )
+
+    def finished(self, job_id: str) -> List[dict]:
+        rows = self._conn().execute(
+            """SELECT chapter_idx, status, result, error, chunks, chunks_total, stats FROM tasks
+               WHERE job_id = ? AND status IN ('done', 'failed') ORDER BY chapter_idx""",
+            (job_id,)
+        ).fetchall()
+        return [
+            {
+                "chapter_idx": row["chapter_idx"],
+                "status": row["status"],
+                "result": row["result"],
+                "error": row["error"],
+                "chunks": {int(k): v for k, v in json.loads(row["chunks"]).items()},
+                "chunks_total": row["chunks_total"],
+                "stats": json.loads(row["stats"]) if row["stats"] else None
+            }
+            for row in rows
+        ]
+
+    def progress(self, job_id: str) -> Dict[int, tuple]:
+        rows = self._conn().execute(
+            """SELECT chapter_idx, chunks, chunks_total FROM tasks
+               WHERE job_id = ? AND status IN ('queued', 'leased') AND chunks_total IS NOT NULL""",
+            (job_id,)
+        ).fetchall()
+        return {row["chapter_idx"]: (len(json.loads(row["chunks"])), row["chunks_total"]) for row in rows}
+
+    def cancel_job(self, job_id: str) -> None:
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE tasks SET status = 'cancelled', updated_at = ? WHERE job_id = ? AND status IN ('queued', 'leased')",
+                (time.time(), job_id)
+            )
+
+    def clear_job(self, job_id: str) -> None:
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM tasks WHERE job_id = ?", (job_id,))
+            conn.execute("DELETE FROM jobs WHERE job_id = ?", (job_id,))
+
+    def _job_shares(self, conn) -> Tuple[List[JobShare], Dict[str, int]]:
+        """Задачи с незавершенными главами (остаток в токенах, учет обслуживания) и число глав в очереди"""
+        rows = conn.execute(
+            """SELECT jobs.*, SUM(LENGTH(tasks.payload)) AS pending_chars,
+                      SUM(tasks.status = 'queued') AS queued
+               FROM jobs JOIN tasks ON tasks.job_id = jobs.job_id
+               WHERE tasks.status IN ('queued', 'leased')
+               GROUP BY jobs.job_id"""
+        ).fetchall()
+        shares, queued = [], {}
+        for row in rows:
+            share = JobShare(row["job_id"], row["weight"], row["priority"], estimate_tokens(row["pending_chars"]))
+            share.vtime = row["vtime"]
+            share.registered_at = row["submitted_at"]
+            share.turns = row["leases"]
+            share.wait_total = row["wait_total"]
+            share.wait_max = row["wait_max"]
+            share.served_tokens = row["served_tokens"]
+            if row["first_lease_at"] is not None:
+                share.first_wait = row["first_lease_at"] - row["submitted_at"]
+            queued[share.job_id] = row["queued"]
+            shares.append(share)
+        return shares, queued
+
+    def queue_stats(self) -> List[dict]:
+        shares, queued = self._job_shares(self._conn())
+        stats = []
+        for share in sorted(shares, key=lambda s: order_key(s, self.policy)):
+            entry = share.to_dict()
+            entry["queued_chapters"] = queued[share.job_id]
+            stats.append(entry)
+        return stats
+
+    def requeue_expired(self) -> int:
+        with self._transaction() as conn:
+            return self._requeue_expired(conn)
+
+    def _requeue_expired(self, conn) -> int:
+        cursor = conn.execute(
+            """UPDATE tasks SET status = 'queued', worker_id = NULL, lease_expires = NULL, updated_at = ?
+               WHERE status = 'leased' AND lease_expires < ?""",
+            (time.time(), time.time())
+        )
+        return cursor.rowcount
+
+    def active_workers(self, window: float = 60.0) -> int:
+        row = self._conn().execute(
+            "SELECT COUNT(*) AS n FROM workers WHERE last_seen >= ?", (time.time() - window,)
+        ).fetchone()
+        return row["n"]
+
+    def _touch_worker(self, conn, worker_id: str) -> None:
+        conn.execute(
+            "INSERT INTO workers (id, last_seen) VALUES (?, ?) ON CONFLICT(id) DO UPDATE SET last_seen = excluded.last_seen",
+            (worker_id, time.time())
+        )
+
+    def lease(self, worker_id: str, lease_seconds: float) -> Optional[dict]:
+        with self._transaction() as conn:
+            self._touch_worker(conn, worker_id)
+            self._requeue_expired(conn)
+            row = self._next_task(conn)
+            if row is None:
+                return None
+            now = time.time()
+            conn.execute(
+                """UPDATE tasks SET status = 'leased', worker_id = ?, lease_expires = ?,
+                       attempts = attempts + 1, updated_at = ?
+                   WHERE id = ?""",
+                (worker_id, now + lease_seconds, now, row["id"])
+            )
+        payload = json.loads(row["payload"])
+        return {
+            "id": row["id"],
+            "job_id": row["job_id"],
+            "chapter_idx": row["chapter_idx"],
+            "text": payload["text"],
+            "settings": payload["settings"],
+            "chunks": {int(k): v for k, v in json.loads(row["chunks"]).items()},
+            "attempts": row["attempts"] + 1
+        }
+
+    def _next_task(self, conn) -> Optional[sqlite3.Row]:
+        """
+        Следующая глава по политике планировщика
+
+        Задача выбирается как в FairScheduler: виртуальные часы - наименьшее
+        время среди задач с незавершенными главами, задача без учета в jobs
+        (поставлена старой версией) идет в порядке постановки.
+        """
+        shares, queued = self._job_shares(conn)
+        candidates = [share for share in shares if queued[share.job_id]]
+        if not candidates:
+            return conn.execute("SELECT * FROM tasks WHERE status = 'queued' ORDER BY id LIMIT 1").fetchone()
+        vclock = min(share.vtime for share in shares)
+        share = min(candidates, key=lambda s: order_key(s, self.policy, vclock))
+        row = conn.execute(
+            "SELECT * FROM tasks WHERE job_id = ? AND status = 'queued' ORDER BY chapter_idx LIMIT 1",
+            (share.job_id,)
+        ).fetchone()
+        now = time.time()
+        tokens = estimate_tokens(len(row["payload"]))
+        # Ожидание главы - с момента постановки (или возврата) в очередь
+        waited = max(0.0, now - row["updated_at"])
+        conn.execute(
+            """UPDATE jobs SET vtime = ?, served_tokens = served_tokens + ?, leases = leases + 1,
+                   first_lease_at = COALESCE(first_lease_at, ?), wait_total = wait_total + ?,
+                   wait_max = MAX(wait_max, ?)
+               WHERE job_id = ?""",
+            (max(share.vtime, vclock) + tokens / share.weight, tokens, now, waited, waited, share.job_id)
+        )
+        return row
+
+    def _owned(self, conn, task_id: int, worker_id: str) -> Optional[sqlite3.Row]:
+        row = conn.execute(
+            "SELECT * FROM tasks WHERE id = ? AND worker_id = ? AND status = 'leased'", (task_id, worker_id)
+        ).fetchone()
+        return row
+
+    def heartbeat(self, task_id: int, worker_id: str, lease_seconds: float) -> bool:
+        with self._transaction() as conn:
+            self._touch_worker(conn, worker_id)
+            if self._owned(conn, task_id, worker_id) is None:
+                return False
+            conn.execute(
+                "UPDATE tasks SET lease_expires = ?, updated_at = ? WHERE id = ?",
+                (time.time() + lease_seconds, time.time(), task_id)
+            )
+            return True
+
+    def save_chunk(self, task_id: int, worker_id: str, chunk_idx: int, total: int, summary: str) -> bool:
+        with self._transaction() as conn:
+            row = self._owned(conn, task_id, worker_id)
+            if row is None:
+                return False
+            chunks = json.loads(row["chunks"])
+            chunks[str(chunk_idx)] = summary
+            conn.execute(
+                "UPDATE tasks SET chunks = ?, chunks_total = ?, updated_at = ? WHERE id = ?",
+                (json.dumps(chunks, ensure_ascii=False), total, time.time(), task_id)
+            )
+            return True
+
+    def complete(self, task_id: int, worker_id: str, summary: str, stats: Optional[dict] = None) -> bool:
+        with self._transaction() as conn:
+            if self._owned(conn, task_id, worker_id) is None:
+                return False
+            conn.execute(
+                """UPDATE tasks SET status = 'done', result = ?, stats = ?, lease_expires = NULL, updated_at = ?
+                   WHERE id = ?""",
+                (summary, json.dumps(stats) if stats else None, time.time(), task_id)
+            )
+            return True
+
+    def fail(self, task_id: int, worker_id: str, error: str, max_attempts: int) -> bool:
+        with self._transaction() as conn:
+            row = self._owned(conn, task_id, worker_id)
+            if row is None:
+                return False
+            # Повтор другим (или тем же) воркером, пока не исчерпаны попытки
+            status = "queued" if row["attempts"] < max_attempts else "failed"
+            conn.execute(
+                """UPDATE tasks SET status = ?, error = ?, worker_id = NULL, lease_expires = NULL, updated_at = ?
+                   WHERE id = ?""",
+                (status, error, time.time(), task_id)
+            )
+            return True
+
+
+class HTTPBroker(WorkerBroker):
+    """Доступ воркера к очереди через HTTP API backend (для воркеров на других машинах)"""
+
+    def __init__(self, api_url: str, timeout: float = 30):
+        self.api_url = api_url.rstrip("/")
+        self.timeout = timeout
+
+    def _post(self, path: str, payload: dict):
+        response = requests.post(f"{self.api_url}/queue/{path}", json=payload, timeout=self.timeout)
+        if response.status_code != 200:
+            raise Exception(f"Ошибка очереди: {response.status_code} - {response.text[:200]}")
+        return response.json()
+
+    def lease(self, worker_id: str, lease_seconds: float) -> Optional[dict]:
+        task = self._post("lease", {"worker_id": worker_id, "lease_seconds": lease_seconds})
+        if task is not None:
+            task["chunks"] = {int(k): v for k, v in task["chunks"].items()}
+        return task
+
+    def heartbeat(self, task_id: int, worker_id: str, lease_seconds: float) -> bool:
+        return self._post(f"{task_id}/heartbeat", {"worker_id": worker_id, "lease_seconds": lease_seconds})["ok"]
+
+    def save_chunk(self, task_id: int, worker_id: str, chunk_idx: int, total: int, summary: str) -> bool:
+        return self._post(f"{task_id}/chunk", {
+            "worker_id": worker_id, "chunk_idx": chunk_idx, "total": total, "summary": summary
+        })["ok"]
+
+    def complete(self, task_id: int, worker_id: str, summary: str, stats: Optional[dict] = None) -> bool:
+        return self._post(f"{task_id}/complete", {"worker_id": worker_id, "summary": summary, "stats": stats})["ok"]
+
+    def fail(self, task_id: int, worker_id: str, error: str, max_attempts: int) -> bool:
+        return self._post(f"{task_id}/fail", {
+            "worker_id": worker_id, "error": error, "max_attempts": max_attempts
+        })["ok"]
+
+
+def create_broker(config: dict, api_url: Optional[str] = None) -> WorkerBroker:
+    """
+    Брокер по конфигурации (у HTTP-брокера только методы воркера)
+
+    task_broker: "sqlite" (по умолчанию, файл queue_path), "http" (через API,
+    адрес api_url или broker_url) или "модуль:Класс" - класс получает config.
+    """
+    kind = "http" if api_url else config.get("task_broker", "sqlite")
+    if kind == "sqlite":
+        path = config.get("queue_path") or Path(config.get("output_dir", "output")) / "queue.sqlite3"
+        return SQLiteBroker(Path(path), config.get("scheduler_policy", "fair"))
+    if kind == "http":
+        return HTTPBroker(api_url or config.get("broker_url", "http://localhost:8000"))
+    module_name, _, class_name = kind.partition(":")
+    return getattr(importlib.import_module(module_name), class_name)(config)
@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# Модули backend импортируются напрямую (как при запуске main.py из каталога backend)
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
@@ -0,0 +1,19 @@
+from pathlib import Path
+
+from batch import book_dirs
+
+
+def test_same_named_books_get_separate_dirs(tmp_path):
+    books = tmp_path / "books"
+    pdfs = [books / "a" / "intro.pdf", books / "b" / "intro.pdf", books / "notes.pdf"]
+    output_dir = Path("out")
+    assert book_dirs(pdfs, output_dir) == {
+        pdfs[0]: output_dir / "a" / "intro",
+        pdfs[1]: output_dir / "b" / "intro",
+        pdfs[2]: output_dir / "notes",
+    }
+
+
+def test_single_book_dir_is_its_name(tmp_path):
+    pdf = tmp_path / "book.v2.pdf"
+    assert book_dirs([pdf], Path("out")) == {pdf: Path("out") / "book.v2"}
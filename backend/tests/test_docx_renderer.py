@@ -0,0 +1,23 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from docx_renderer import PandocNotFoundError, render_docx_cached
+
+
+def test_concurrent_renders_share_cache(tmp_path):
+    md_path = tmp_path / "summary.md"
+    md_path.write_text("# Конспект\n\n- пункт\n" * 200, encoding="utf-8")
+    cache_dir = tmp_path / "cache"
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        paths = set(pool.map(lambda _: render_docx_cached(md_path, cache_dir), range(16)))
+    assert len(paths) == 1
+    assert [path.name for path in cache_dir.iterdir()] == [paths.pop().name]
+
+
+def test_missing_pandoc_reported(tmp_path, monkeypatch):
+    md_path = tmp_path / "summary.md"
+    md_path.write_text("# Конспект", encoding="utf-8")
+    monkeypatch.setenv("PATH", str(tmp_path / "empty"))
+    with pytest.raises(PandocNotFoundError):
+        render_docx_cached(md_path, tmp_path / "cache", backend="pandoc")
@@ -0,0 +1,30 @@
+import library as library_module
+from library import Library
+
+
+def test_iter_pages_reads_in_batches(tmp_path, monkeypatch):
+    monkeypatch.setattr(library_module, "PAGE_BATCH", 3)
+    library = Library(tmp_path / "library.db")
+    library.add_document("doc", "book.pdf")
+    page_numbers = [7, 0, 1, 2, 3, 5, 6, 9]
+    for page_no in page_numbers:
+        library.save_page("doc", page_no, f"Страница {page_no}")
+    library.finish_pages("doc")
+    assert list(library.iter_pages("doc")) == [f"Страница {page_no}" for page_no in sorted(page_numbers)]
+
+
+def test_start_run_consumes_chapters_lazily(tmp_path):
+    library = Library(tmp_path / "library.db")
+    library.add_document("doc", "book.pdf")
+    read = []
+
+    def chapters():
+        for idx in range(3):
+            read.append(idx)
+            yield f"Глава {idx + 1}\nТекст главы."
+
+    run_id = library.start_run("job", "doc", {}, chapters())
+    assert read == [0, 1, 2]
+    assert library.latest_run("job")["total_chapters"] == 3
+    assert [hit["chapter"] for hit in library.search("глава 2")] == [2]
+    assert run_id == library.latest_run("job")["id"]
@@ -0,0 +1,83 @@
+import asyncio
+
+import pytest
+
+from lm_studio_client import LMStudioClient
+from packing import (
+    MAX_PACK_TOKENS, MIN_PACK_TOKENS, SECTION_HEADER, pack_max_tokens, pack_overhead, pack_prompt, plan_packs,
+    split_pack_response
+)
+
+
+def test_small_chapters_packed_in_order():
+    assert plan_packs([500] * 5, 15000, 3000, 8) == [[0, 1, 2, 3, 4]]
+
+
+def test_large_chapter_breaks_pack():
+    assert plan_packs([500, 500, 9000, 500, 500], 15000, 3000, 8) == [[0, 1], [2], [3, 4]]
+
+
+def test_pack_limited_by_chapter_count():
+    assert plan_packs([100] * 5, 15000, 3000, 2) == [[0, 1], [2, 3], [4]]
+
+
+def test_pack_limited_by_request_budget():
+    budget = 2 * 2000 + pack_overhead(2)
+    assert plan_packs([2000] * 3, budget, 3000, 8) == [[0, 1], [2]]
+
+
+def test_prompt_numbers_sections():
+    prompt = pack_prompt(["  Первая глава. ", "Вторая глава."])
+    assert f"{SECTION_HEADER.format(1)}\nПервая глава." in prompt
+    assert prompt.index(SECTION_HEADER.format(1)) < prompt.index(SECTION_HEADER.format(2))
+
+
+def test_max_tokens_bounds():
+    assert pack_max_tokens(1) == MIN_PACK_TOKENS
+    assert pack_max_tokens(100) == MAX_PACK_TOKENS
+
+
+def test_split_response():
+    response = "Вот конспекты:\n=== РАЗДЕЛ 1 ===\nПервый.\n\n=== РАЗДЕЛ 2 ===\nВторой.\n"
+    assert split_pack_response(response, 2) == ["Первый.", "Второй."]
+
+
+def test_split_tolerates_markdown_and_case():
+    response = "## === Раздел 1 ===\nПервый.\n**=== раздел 2 ===**\nВторой."
+    assert split_pack_response(response, 2) == ["Первый.", "Второй."]
+
+
+@pytest.mark.parametrize("response", [
+    "Общий конспект без разделов.",
+    "=== РАЗДЕЛ 1 ===\nПервый.",
+    "=== РАЗДЕЛ 2 ===\nВторой.\n=== РАЗДЕЛ 1 ===\nПервый.",
+    "=== РАЗДЕЛ 1 ===\n\n=== РАЗДЕЛ 2 ===\nВторой.",
+    "=== РАЗДЕЛ 1 ===\nПервый.\n=== РАЗДЕЛ 2 ===\nВторой.\n=== РАЗДЕЛ 3 ===\nЛишний.",
+])
+def test_split_rejects_malformed_response(response):
+    assert split_pack_response(response, 2) is None
+
+
+class FakeClient(LMStudioClient):
+    def __init__(self, response):
+        super().__init__()
+        self.response = response
+        self.calls = []
+
+    async def generate_summary_async(self, text, tags=None, slot=None, max_tokens=2000):
+        self.calls.append((text, tags, max_tokens))
+        return self.response
+
+
+def test_process_pack_splits_response():
+    client = FakeClient("=== РАЗДЕЛ 1 ===\nА.\n=== РАЗДЕЛ 2 ===\nБ.")
+    assert asyncio.run(client.process_pack(["Глава А.", "Глава Б."], tags={"chapter": 3})) == ["А.", "Б."]
+    [(prompt, tags, max_tokens)] = client.calls
+    assert "Глава Б." in prompt
+    assert tags == {"chapter": 3, "chunk": 0, "pack": 2}
+    assert max_tokens == pack_max_tokens(2)
+
+
+def test_process_pack_falls_back_on_unsplit_response():
+    client = FakeClient("Один общий конспект.")
+    assert asyncio.run(client.process_pack(["Глава А.", "Глава Б."])) is None
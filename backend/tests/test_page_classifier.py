@@ -0,0 +1,76 @@
+import pytest
+
+pytest.importorskip("numpy")
+
+from page_classifier import BIBLIOGRAPHY, INDEX, TOC, classify_pages
+from processor import PDFProcessor
+
+TERMS = "Абрис Базис Вектор Группа Дробь Ёмкость Жордан Закон Интеграл Кольцо".split()
+PAGES = [12, 45, 7, 88, 130, 23, 56, 9, 77, 41]
+
+
+def toc_page(leaders: bool = False, title: bool = False) -> str:
+    lines = ["Оглавление"] if title else []
+    for i in range(1, 12):
+        leader = " " + "." * 12 if leaders else ""
+        lines.append(f"Глава {i} Название главы {i}{leader} {i * 12 + 3}")
+    return "\n".join(lines)
+
+
+def test_toc_pages():
+    assert classify_pages([toc_page(), toc_page(leaders=True), toc_page(title=True)]) == [TOC, TOC, TOC]
+
+
+def test_toc_page_with_header_and_footer():
+    page = "Оглавление\nКурс лекций\n" + toc_page(leaders=True) + "\n4"
+    assert classify_pages([page]) == [TOC]
+
+
+@pytest.mark.parametrize("title", [False, True])
+def test_toc_followed_by_body_text_is_kept(title):
+    body = "\n".join(f"Предложение номер {i} первой главы продолжает рассказ о развитии системы." for i in range(15))
+    page = toc_page(leaders=True, title=title) + "\nВведение\n" + body
+    assert classify_pages([page]) == [None]
+
+
+def test_benchmark_corpus_first_page_is_kept():
+    from benchmarks.corpus import generate_text
+    lines = generate_text(50 * 1024, "en").split("\n")
+    assert classify_pages(["\n".join(lines[:45])]) == [None]
+
+
+def test_index_page():
+    page = "\n".join(f"{term}, {page}, {page + 30}" for term, page in zip(TERMS, PAGES))
+    assert classify_pages([page]) == [INDEX]
+
+
+def test_bibliography_page():
+    page = "Список литературы\n" + "\n".join(
+        f"{i}. Иванов И. И. Теория систем. М.: Наука, {1990 + i}. 320 с." for i in range(1, 10)
+    )
+    assert classify_pages([page]) == [BIBLIOGRAPHY]
+
+
+@pytest.mark.parametrize("page", [
+    # Статистическая таблица: номера в конце строк не растут
+    "\n".join(f"{2010 + i} {100 + i * 7} {15 + i % 5}" for i in range(12)),
+    "\n".join(f"{2010 + i}, {100 + i * 7}, {15 + i % 5}" for i in range(12)),
+    # Таблица измерений: целые и десятичные дроби
+    "\n".join(f"Температура воды {15 + i % 4}" for i in range(12)),
+    "\n".join(f"Температура воды {15 + i % 4},{i % 10}" for i in range(12)),
+])
+def test_numeric_tables_are_body_text(page):
+    assert classify_pages([page]) == [None]
+
+
+def test_plain_text_and_empty_pages():
+    text = "Это обычный абзац текста книги. В нем нет номеров страниц и списков.\n" * 5
+    assert classify_pages([text, ""]) == [None, None]
+
+
+def test_filter_pages_keeps_tables_and_reports_dropped(tmp_path, capsys):
+    table = "\n".join(f"{2010 + i} {100 + i * 7} {15 + i % 5}" for i in range(12))
+    processor = PDFProcessor({"output_dir": str(tmp_path), "page_filter": True})
+    pages = processor.filter_pages([toc_page(leaders=True), table])
+    assert pages == ["", table]
+    assert "toc: стр. 1" in capsys.readouterr().out
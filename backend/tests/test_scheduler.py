@@ -0,0 +1,116 @@
+import asyncio
+
+from lm_studio_client import LMStudioClient
+from scheduler import FairScheduler, JobShare, order_key, work_before_done
+from task_queue import SQLiteBroker
+
+
+def share(job_id, weight=1.0, priority=0, remaining=0.0, vtime=0.0, registered_at=0.0):
+    share = JobShare(job_id, weight, priority, remaining)
+    share.vtime = vtime
+    share.registered_at = registered_at
+    return share
+
+
+def test_order_key_policies():
+    big = share("big", remaining=1000, vtime=5, registered_at=1)
+    small = share("small", remaining=10, vtime=50, registered_at=2)
+    assert min([big, small], key=lambda s: order_key(s, "sjf")) is small
+    assert min([big, small], key=lambda s: order_key(s, "fair")) is big
+    assert min([big, small], key=lambda s: order_key(s, "fifo")) is big
+
+
+def test_priority_before_policy():
+    urgent = share("urgent", priority=1, remaining=1000, vtime=100, registered_at=9)
+    other = share("other", remaining=1)
+    for policy in ("fair", "sjf", "fifo"):
+        assert min([other, urgent], key=lambda s: order_key(s, policy)) is urgent
+
+
+def test_work_before_done():
+    shares = [share("a", remaining=100), share("b", remaining=1000, weight=2.0), share("c", priority=-1, remaining=50)]
+    # fair: пока "a" обслуживается, "b" получает вдвое больше токенов
+    assert work_before_done(shares, "a", "fair") == 300
+    assert work_before_done(shares, "a", "sjf") == 100
+    assert work_before_done(shares, "b", "sjf") == 1100
+    assert work_before_done(shares, "missing", "fair") is None
+
+
+def simulate(policy, jobs, slots=1):
+    """Задачи запрашивают слот друг за другом; возвращает порядок выданных запросов"""
+    order = []
+
+    async def job(scheduler, job_id, requests, tokens):
+        for _ in range(requests):
+            async with scheduler.turn(job_id, tokens):
+                order.append(job_id)
+                await asyncio.sleep(0.001)
+
+    async def main():
+        scheduler = FairScheduler(slots, policy, anticipation=0.05)
+        for job_id, requests, tokens, weight in jobs:
+            scheduler.register(job_id, weight, remaining_tokens=requests * tokens)
+        await asyncio.gather(*(job(scheduler, job_id, requests, tokens) for job_id, requests, tokens, _ in jobs))
+        return scheduler
+
+    scheduler = asyncio.run(main())
+    return order, scheduler
+
+
+def test_fair_shares_slot_by_weight():
+    order, _ = simulate("fair", [("heavy", 30, 100, 2.0), ("light", 30, 100, 1.0)])
+    first = order[:30]
+    assert first.count("heavy") == 20
+    assert first.count("light") == 10
+
+
+def test_fair_small_job_not_starved_by_big_one():
+    order, _ = simulate("fair", [("book", 40, 100, 1.0), ("notes", 3, 100, 1.0)])
+    assert max(i for i, job_id in enumerate(order) if job_id == "notes") < 8
+
+
+def test_sjf_serves_shortest_job_first():
+    order, _ = simulate("sjf", [("book", 10, 100, 1.0), ("notes", 3, 100, 1.0)])
+    # Свободный слот сразу получает единственный ожидающий запрос, дальше - короткая задача целиком
+    assert order[:4] == ["book"] + ["notes"] * 3
+
+
+def test_unregister_keeps_history():
+    _, scheduler = simulate("fair", [("a", 2, 50, 1.0)])
+    finished = scheduler.unregister("a")
+    assert finished.served_tokens == 100
+    assert scheduler.to_dict()["finished"][0]["requests"] == 2
+
+
+def test_warm_up_waits_for_slot():
+    events = []
+
+    async def main():
+        scheduler = FairScheduler(1, "fair")
+        client = LMStudioClient()
+        client.warm_up = lambda: events.append("warm_up") or 0.0
+        client.request_gate = lambda tokens: scheduler.turn("notes", tokens)
+        async with scheduler.turn("book", 100):
+            warm_up = asyncio.create_task(client.warm_up_async())
+            await asyncio.sleep(0.05)
+            events.append("book done")
+        await warm_up
+
+    asyncio.run(main())
+    assert events == ["book done", "warm_up"]
+
+
+def test_broker_fair_alternates_jobs(tmp_path):
+    broker = SQLiteBroker(tmp_path / "queue.sqlite3", policy="fair")
+    text = "x" * 400
+    broker.submit("a", [{"chapter_idx": i, "text": text} for i in range(4)], {})
+    broker.submit("b", [{"chapter_idx": i, "text": text} for i in range(4)], {})
+    leased = [broker.lease("w", 60)["job_id"] for _ in range(4)]
+    assert sorted(leased) == ["a", "a", "b", "b"]
+
+
+def test_broker_sjf_prefers_short_job(tmp_path):
+    broker = SQLiteBroker(tmp_path / "queue.sqlite3", policy="sjf")
+    broker.submit("book", [{"chapter_idx": i, "text": "x" * 4000} for i in range(5)], {})
+    broker.submit("notes", [{"chapter_idx": 0, "text": "x" * 400}], {})
+    assert broker.lease("w", 60)["job_id"] == "notes"
@@ -0,0 +1,129 @@
+import pytest
+
+from library import Library
+from search import match_query, split_passages, stem, tokenize
+
+
+@pytest.mark.parametrize("forms", [
+    ("экономика", "экономики", "экономикой", "экономике"),
+    ("рынка", "рынку", "рынком", "рынки"),
+    ("конспект", "конспекты", "конспектов", "конспектами"),
+])
+def test_russian_forms_share_stem(forms):
+    assert len({stem(word) for word in forms}) == 1
+
+
+def test_english_suffixes():
+    assert stem("markets") == stem("market")
+    assert stem("pricing") == "pric"
+    assert stem("class") == "class"
+
+
+def test_stem_normalizes_case_and_yo():
+    assert stem("Её") == "ее"
+    assert stem("ЁЛКА") == stem("елка")
+
+
+def test_short_words_and_numbers_kept():
+    assert tokenize("в 2024 году") == ["в", "2024", stem("году")]
+
+
+def test_match_query_prefixes_unique_stems():
+    assert match_query("рынка рынку OR 2024") == f'"{stem("рынка")}"* "or" "2024"'
+    assert match_query("  ...  ") is None
+    assert match_query("рынка 2024", any_term=True) == f'"{stem("рынка")}"* OR "2024"'
+
+
+def test_split_passages_cuts_at_lines_and_spaces():
+    text = "\n".join(["слово " * 30] * 10)
+    passages = split_passages(text, max_chars=500)
+    assert all(len(passage) <= 500 for passage in passages)
+    assert " ".join(" ".join(passages).split()) == " ".join(text.split())
+    assert split_passages("x" * 25, max_chars=10) == ["x" * 10, "x" * 10, "x" * 5]
+
+
+def test_stem_is_word_prefix():
+    for word in ("экономикой", "рынками", "длинный", "сильнейшая", "Ёлками", "pricing"):
+        assert word.lower().replace("ё", "е").startswith(stem(word))
+
+
+@pytest.fixture
+def library(tmp_path):
+    library = Library(tmp_path / "library.db")
+    library.add_document("doc", "book.pdf")
+    chapters = [
+        "Глава 1. Деньги\nИнфляция обесценивает сбережения граждан.",
+        "Глава 2. Торговля\nКупцы везли товары по морю.",
+    ]
+    run_id = library.start_run("job", "doc", {}, chapters)
+    return library, run_id, chapters
+
+
+def test_snippet_highlights_source_matches(library):
+    library, _, _ = library
+    [hit] = library.search("сбережений")
+    assert hit["snippet"] == "Глава 1. Деньги Инфляция обесценивает **сбережения** граждан."
+
+
+def test_source_text_searchable_before_summary(library):
+    library, _, _ = library
+    hits = library.search("инфляции")
+    assert [hit["chapter"] for hit in hits] == [1]
+    assert hits[0]["matched_in"] == ["source"]
+    assert "**Инфляция**" in hits[0]["snippet"]
+
+
+def test_scope_selects_summary_or_source(library):
+    library, run_id, chapters = library
+    library.save_chapter_summary(run_id, 1, chapters[1], "Морская торговля и пошлины.", "settings")
+    assert [hit["chapter"] for hit in library.search("пошлины", scope="summary")] == [2]
+    assert library.search("пошлины", scope="source") == []
+    assert library.search("купцы", scope="summary") == []
+    hits = library.search("купцы", scope="source")
+    assert hits[0]["matched_in"] == ["source"]
+    hits = library.search("торговля")
+    assert hits[0]["matched_in"] == ["summary", "source"]
+    assert hits[0]["snippet"].startswith("Морская")
+
+
+def test_summary_outweighs_source(library):
+    library, run_id, chapters = library
+    library.save_chapter_summary(run_id, 1, chapters[1], "Сбережения купцов.", "settings")
+    hits = library.search("сбережения")
+    assert [hit["chapter"] for hit in hits] == [2, 1]
+
+
+def test_snippet_taken_from_matching_passage(library):
+    library, _, _ = library
+    filler = "Купцы везли товары по морю.\n" * 400
+    library.start_run("job2", "doc", {}, [f"Глава 1. Порты\n{filler}Пошлины росли.\n{filler}"])
+    [hit] = library.search("пошлины")
+    assert hit["matched_in"] == ["source"]
+    assert "**Пошлины**" in hit["snippet"]
+
+
+def test_new_run_replaces_source_index(library):
+    library, _, _ = library
+    library.start_run("job2", "doc", {}, ["Глава 1. Налоги\nНалоговая система."])
+    assert library.search("инфляция") == []
+    assert [hit["job_id"] for hit in library.search("налоги")] == ["job2"]
+    assert library.rebuild_search_index() == 1
+
+
+def test_unknown_scope_rejected(library):
+    library, _, _ = library
+    with pytest.raises(ValueError):
+        library.search("деньги", scope="pages")
+
+
+def test_index_matches_content_after_updates(library):
+    library, run_id, chapters = library
+    library.save_chapter_summary(run_id, 0, chapters[0], "Первый конспект.", "settings")
+    library.save_chapter_summary(run_id, 0, chapters[0], "Второй конспект.", "settings")
+    library.start_run("job2", "doc", {}, chapters)
+    library.save_chapter_summary(run_id, 1, chapters[1], "Конспект старого запуска.", "settings")
+    # integrity-check с rank = 1 сверяет индекс с содержимым chapter_texts
+    library._conn.execute("INSERT INTO chapter_search (chapter_search, rank) VALUES ('integrity-check', 1)")
+    library._conn.execute("INSERT INTO passage_search (passage_search, rank) VALUES ('integrity-check', 1)")
+    assert library.search("старого") == []
+    assert [hit["job_id"] for hit in library.search("деньги")] == ["job2"]
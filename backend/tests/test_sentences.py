@@ -0,0 +1,84 @@
+import pytest
+
+from library import settings_hash
+from sentences import sentence_index, split_chunks
+
+
+def sentences(text):
+    index = sentence_index(text)
+    return [index.text[begin:end] for begin, end in index.spans()]
+
+
+def test_sentence_ends():
+    assert sentences("Первое предложение. Второе! Третье? «Цитата» — ответ… Конец") == [
+        "Первое предложение.", "Второе!", "Третье?", "«Цитата» — ответ…", "Конец"
+    ]
+
+
+@pytest.mark.parametrize("text", [
+    "См. рис. 5 на стр. 10 и далее.",
+    "Автор - проф. Иванов, т.е. Москва.",
+    "Стихи написал А. С. Пушкин в 1830 г. в Болдине.",
+    "As shown by J. R. R. Tolkien, e.g. Fig. 3 here.",
+])
+def test_abbreviations_and_initials_are_not_boundaries(text):
+    assert sentences(text) == [text]
+
+
+def test_closing_quotes_stay_with_sentence():
+    assert sentences('Он сказал: "Хватит." Затем ушел.') == ['Он сказал: "Хватит."', "Затем ушел."]
+
+
+def test_paragraph_break_is_boundary():
+    assert sentences("Заголовок без точки\n\nТекст абзаца.") == ["Заголовок без точки", "Текст абзаца."]
+
+
+def test_hyphenation_joined():
+    assert sentence_index("Эконо-\nмика растет.").text == "Экономика растет."
+
+
+SENTENCE = "Это предложение номер {} и в нем ровно несколько слов."
+
+
+def make_text(count):
+    return " ".join(SENTENCE.format(i) for i in range(count))
+
+
+def test_chunks_end_on_sentence_boundaries():
+    chunks = split_chunks(make_text(40), 300)
+    assert len(chunks) > 1
+    assert all(len(chunk) <= 300 for chunk in chunks)
+    assert all(chunk.endswith(".") and chunk.startswith("Это") for chunk in chunks)
+    assert " ".join(chunks) == make_text(40)
+
+
+def test_short_text_single_chunk():
+    assert split_chunks("  Короткий текст.  ", 300) == ["Короткий текст."]
+
+
+def test_overlap_repeats_whole_sentences():
+    chunks = split_chunks(make_text(40), 300, overlap=100)
+    for previous, chunk in zip(chunks, chunks[1:]):
+        first = chunk[:chunk.index(".") + 1]
+        assert previous.endswith(first)
+        assert first.startswith("Это")
+
+
+def test_overlap_capped_at_half_chunk():
+    chunks = split_chunks(make_text(40), 300, overlap=10000)
+    assert all(len(chunk) <= 300 for chunk in chunks)
+    assert len(chunks) < 40
+
+
+def test_text_without_boundaries_cut_by_words():
+    text = "слово " * 200
+    chunks = split_chunks(text, 100)
+    assert all(len(chunk) <= 100 for chunk in chunks)
+    assert all(set(chunk.split(" ")) == {"слово"} for chunk in chunks)
+    assert " ".join(chunks).split() == text.split()
+
+
+def test_settings_hash_includes_only_nonzero_overlap():
+    config = {"lm_studio_model": "model", "max_chunk_size": 15000}
+    assert settings_hash({**config, "chunk_overlap": 0}) == settings_hash(config)
+    assert settings_hash({**config, "chunk_overlap": 500}) != settings_hash(config)
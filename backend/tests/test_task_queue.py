@@ -0,0 +1,165 @@
+import asyncio
+import time
+
+import pytest
+
+from lm_studio_client import JobCancelledError
+from task_queue import HTTPBroker, SQLiteBroker, TaskBroker, WorkerBroker, create_broker
+from throughput import ThroughputTracker
+from worker import QueueWorker
+
+
+SETTINGS = {"max_chunk_size": 100}
+
+
+@pytest.fixture
+def broker(tmp_path):
+    broker = SQLiteBroker(tmp_path / "queue.sqlite3")
+    broker.submit("job", [{"chapter_idx": 0, "text": "Глава 1"}, {"chapter_idx": 1, "text": "Глава 2"}], SETTINGS)
+    return broker
+
+
+def test_lease_in_chapter_order(broker):
+    assert broker.lease("w1", 60)["chapter_idx"] == 0
+    assert broker.lease("w2", 60)["chapter_idx"] == 1
+    assert broker.lease("w3", 60) is None
+
+
+def test_expired_lease_requeued_with_saved_chunks(broker):
+    task = broker.lease("w1", 0.05)
+    assert broker.save_chunk(task["id"], "w1", 0, 3, "чанк 1")
+    time.sleep(0.1)
+    assert broker.requeue_expired() == 1
+    retry = broker.lease("w2", 60)
+    assert retry["id"] == task["id"]
+    assert retry["attempts"] == 2
+    assert retry["chunks"] == {0: "чанк 1"}
+    # Прежний воркер потерял аренду
+    assert not broker.heartbeat(task["id"], "w1", 60)
+    assert not broker.save_chunk(task["id"], "w1", 1, 3, "чанк 2")
+    assert not broker.complete(task["id"], "w1", "конспект")
+
+
+def test_lease_requeues_expired_tasks_itself(broker):
+    first = broker.lease("w1", 0.05)
+    broker.lease("w1", 60)
+    time.sleep(0.1)
+    assert broker.lease("w2", 60)["id"] == first["id"]
+
+
+def test_heartbeat_extends_lease(broker):
+    task = broker.lease("w1", 0.2)
+    time.sleep(0.1)
+    assert broker.heartbeat(task["id"], "w1", 60)
+    time.sleep(0.15)
+    assert broker.requeue_expired() == 0
+
+
+def test_fail_requeues_until_attempts_exhausted(broker):
+    task = broker.lease("w1", 60)
+    assert broker.fail(task["id"], "w1", "ошибка", max_attempts=2)
+    task = broker.lease("w1", 60)
+    assert task["chapter_idx"] == 0 and task["attempts"] == 2
+    assert broker.fail(task["id"], "w1", "ошибка", max_attempts=2)
+    assert [(row["chapter_idx"], row["status"]) for row in broker.finished("job")] == [(0, "failed")]
+
+
+def test_cancelled_job_not_leased(broker):
+    task = broker.lease("w1", 60)
+    broker.cancel_job("job")
+    assert broker.lease("w2", 60) is None
+    assert not broker.heartbeat(task["id"], "w1", 60)
+
+
+def test_http_broker_implements_worker_interface_only():
+    broker = create_broker({}, api_url="http://localhost:8000")
+    assert isinstance(broker, HTTPBroker) and isinstance(broker, WorkerBroker)
+    assert not isinstance(broker, TaskBroker)
+
+    class PartialBroker(TaskBroker, HTTPBroker):
+        pass
+
+    # Брокер для API без submit, finished и остальных методов API не создается
+    with pytest.raises(TypeError):
+        PartialBroker("http://localhost:8000")
+
+
+class FakeLLM:
+    """Клиент LLM: два чанка с паузой, отмена - JobCancelledError"""
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.cancelled = False
+        self.throughput = ThroughputTracker()
+
+    def reset_cancel(self):
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+    async def process_chapter(self, text, max_chunk_size, chunk_overlap, done_chunks, on_chunk_done, tags):
+        summaries = []
+        for idx in range(2):
+            if idx in done_chunks:
+                summaries.append(done_chunks[idx])
+                continue
+            await asyncio.sleep(self.delay)
+            if self.cancelled:
+                raise JobCancelledError("отмена")
+            summaries.append(f"{text}: чанк {idx + 1}")
+            on_chunk_done(idx, 2, summaries[-1])
+        return "\n\n".join(summaries)
+
+
+class SlowBroker(SQLiteBroker):
+    """Брокер с медленной (или недоступной) записью чанков"""
+
+    def __init__(self, path, save_delay=0.0, save_error=False):
+        super().__init__(path)
+        self.save_delay = save_delay
+        self.save_error = save_error
+        self.heartbeats = 0
+
+    def heartbeat(self, task_id, worker_id, lease_seconds):
+        self.heartbeats += 1
+        return super().heartbeat(task_id, worker_id, lease_seconds)
+
+    def save_chunk(self, task_id, worker_id, chunk_idx, total, summary):
+        time.sleep(self.save_delay)
+        if self.save_error:
+            raise ConnectionError("очередь недоступна")
+        return super().save_chunk(task_id, worker_id, chunk_idx, total, summary)
+
+
+def run_worker(broker, llm, lease_seconds=60):
+    worker = QueueWorker({"lease_seconds": lease_seconds, "warm_up": False, "queue_poll_interval": 0.01},
+                         broker, llm, "w1")
+    asyncio.run(worker.process(broker.lease("w1", lease_seconds)))
+
+
+def test_worker_completes_and_saves_chunks(tmp_path):
+    broker = SlowBroker(tmp_path / "queue.sqlite3")
+    broker.submit("job", [{"chapter_idx": 0, "text": "Глава 1"}], SETTINGS)
+    run_worker(broker, FakeLLM())
+    [row] = broker.finished("job")
+    assert row["status"] == "done"
+    assert row["result"] == "Глава 1: чанк 1\n\nГлава 1: чанк 2"
+    assert row["chunks"] == {0: "Глава 1: чанк 1", 1: "Глава 1: чанк 2"}
+
+
+def test_slow_chunk_save_does_not_block_heartbeat(tmp_path):
+    broker = SlowBroker(tmp_path / "queue.sqlite3", save_delay=0.6)
+    broker.submit("job", [{"chapter_idx": 0, "text": "Глава 1"}], SETTINGS)
+    run_worker(broker, FakeLLM(delay=0.05), lease_seconds=0.3)
+    assert broker.heartbeats >= 3
+    assert broker.finished("job")[0]["status"] == "done"
+
+
+def test_broker_failure_is_not_chapter_failure(tmp_path, capsys):
+    broker = SlowBroker(tmp_path / "queue.sqlite3", save_error=True)
+    broker.submit("job", [{"chapter_idx": 0, "text": "Глава 1"}], SETTINGS)
+    run_worker(broker, FakeLLM())
+    [row] = broker.finished("job")
+    assert row["status"] == "done" and row["error"] is None
+    assert "не сохранен в очереди" in capsys.readouterr().out
@@ -0,0 +1,96 @@
+"""
+Оценка объема работы и скорости генерации.
+
+Прогресс задачи считается по оценке числа входных токенов, а не по числу
+глав: одна большая глава весит столько же, сколько десятки маленьких.
+ETA вычисляется по скользящему окну последних запросов: отдельно скорость
+обработки промпта и скорость генерации.
+"""
+import threading
+from collections import deque
+from typing import Optional
+
+
+# Среднее число символов на токен для русского текста у типичных локальных моделей
+DEFAULT_CHARS_PER_TOKEN = 3.0
+
+
+def estimate_tokens(chars: int, chars_per_token: float = DEFAULT_CHARS_PER_TOKEN) -> int:
+    """Грубая оценка числа токенов по длине текста"""
+    return int(chars / chars_per_token) + 1 if chars else 0
+
+
+class ThroughputTracker:
+    """Скользящие оценки скорости обработки промпта и генерации (токенов в секунду)"""
+
+    def __init__(self, window: int = 20):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self.cached_tokens_total = 0
+
+    def record(
+        self,
+        prompt_tokens: int,
+        completion_tokens: int,
+        prompt_seconds: float,
+        gen_seconds: float,
+        cached_tokens: int = 0
+    ) -> None:
+        """Учет одного завершенного запроса (cached_tokens - токены промпта, взятые из кеша сервера)"""
+        with self._lock:
+            self._samples.append((prompt_tokens, completion_tokens, prompt_seconds, gen_seconds, cached_tokens))
+            self.cached_tokens_total += cached_tokens
+
+    def _totals(self):
+        with self._lock:
+            samples = list(self._samples)
+        return tuple(sum(values) for values in zip(*samples)) if samples else (0, 0, 0.0, 0.0, 0)
+
+    def totals(self) -> dict:
+        """Суммы по окну: токены и секунды промпта и генерации"""
+        prompt_tokens, completion_tokens, prompt_seconds, gen_seconds, cached_tokens = self._totals()
+        return {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "prompt_seconds": prompt_seconds,
+            "gen_seconds": gen_seconds,
+            "cached_tokens": cached_tokens
+        }
+
+    @property
+    def prompt_tps(self) -> Optional[float]:
+        prompt_tokens, _, prompt_seconds, _, _ = self._totals()
+        return prompt_tokens / prompt_seconds if prompt_seconds > 0 else None
+
+    @property
+    def gen_tps(self) -> Optional[float]:
+        _, completion_tokens, _, gen_seconds, _ = self._totals()
+        return completion_tokens / gen_seconds if gen_seconds > 0 else None
+
+    @property
+    def output_ratio(self) -> Optional[float]:
+        """Сколько токенов ответа приходится на один токен промпта"""
+        prompt_tokens, completion_tokens, _, _, _ = self._totals()
+        return completion_tokens / prompt_tokens if prompt_tokens else None
+
+    @property
+    def prompt_cache_ratio(self) -> Optional[float]:
+        """Доля токенов промпта, взятых из кеша сервера"""
+        prompt_tokens, _, _, _, cached_tokens = self._totals()
+        return cached_tokens / prompt_tokens if prompt_tokens else None
+
+    def eta_seconds(self, remaining_tokens: int) -> Optional[float]:
+        """Оставшееся время для заданного числа входных токенов (None, пока нет измерений)"""
+        prompt_tps, gen_tps, ratio = self.prompt_tps, self.gen_tps, self.output_ratio
+        if not prompt_tps or not gen_tps or ratio is None:
+            return None
+        return remaining_tokens / prompt_tps + remaining_tokens * ratio / gen_tps
+
+    def to_dict(self) -> dict:
+        prompt_tps, gen_tps, cache_ratio = self.prompt_tps, self.gen_tps, self.prompt_cache_ratio
+        return {
+            "prompt_tokens_per_sec": round(prompt_tps, 1) if prompt_tps else None,
+            "gen_tokens_per_sec": round(gen_tps, 1) if gen_tps else None,
+            "cached_prompt_tokens": self.cached_tokens_total,
+            "prompt_cache_ratio": round(cache_ratio, 3) if cache_ratio is not None else None
+        }
@@ -0,0 +1,111 @@
+"""
+Легковесная трассировка этапов обработки.
+
+Спаны (извлечение PDF, нарезка, запросы к LLM, запись файлов) записываются
+с тегами задачи/главы/чанка и экспортируются в формате Chrome trace-event
+JSON (открывается в chrome://tracing или https://ui.perfetto.dev).
+Выключенный трассировщик возвращает общий пустой спан и ничего не записывает.
+"""
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+
+class _NullSpan:
+    """Пустой спан для выключенной трассировки"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ("tracer", "name", "tags", "start")
+
+    def __init__(self, tracer: "Tracer", name: str, tags: dict):
+        self.tracer = tracer
+        self.name = name
+        self.tags = tags
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        end = time.perf_counter_ns()
+        if exc_type is not None:
+            self.tags["error"] = f"{exc_type.__name__}: {exc}"
+        self.tracer._record(self.name, self.start, end, self.tags)
+        return False
+
+
+class Tracer:
+    """Сборщик спанов одной задачи"""
+
+    def __init__(self, enabled: bool = True, job_id: Optional[str] = None):
+        self.enabled = enabled
+        self.job_id = job_id
+        self.events = []
+        self._origin = time.perf_counter_ns()
+        self._threads = {}
+        self._lock = threading.Lock()
+
+    def span(self, name: str, **tags):
+        """Контекстный менеджер, измеряющий длительность блока"""
+        if not self.enabled:
+            return _NULL_SPAN
+        if self.job_id is not None:
+            tags["job"] = self.job_id
+        return _Span(self, name, tags)
+
+    def _record(self, name: str, start: int, end: int, tags: dict):
+        thread = threading.current_thread()
+        event = {
+            "name": name,
+            "cat": name.split(".", 1)[0],
+            "ph": "X",
+            "ts": (start - self._origin) / 1000,
+            "dur": (end - start) / 1000,
+            "pid": os.getpid(),
+            "tid": thread.ident,
+            "args": tags
+        }
+        with self._lock:
+            self.events.append(event)
+            self._threads.setdefault(thread.ident, thread.name)
+
+    def to_chrome_trace(self) -> dict:
+        """Данные в формате Chrome trace-event"""
+        with self._lock:
+            events = list(self.events)
+            threads = dict(self._threads)
+        metadata = [
+            {"name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": tid, "args": {"name": name}}
+            for tid, name in threads.items()
+        ]
+        return {
+            "traceEvents": metadata + events,
+            "displayTimeUnit": "ms",
+            "otherData": {"job_id": self.job_id}
+        }
+
+    def export(self, path: Path) -> Optional[Path]:
+        """Сохранение трассы в JSON (ничего не делает, если трассировка выключена)"""
+        if not self.enabled:
+            return None
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(self.to_chrome_trace(), ensure_ascii=False), encoding="utf-8")
+        return path
+
+
+# Общий выключенный трассировщик для вызовов без трассировки
+NULL_TRACER = Tracer(enabled=False)
@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+"""
+Воркер распределенной обработки глав.
+
+Берет в аренду главы из очереди задач, конспектирует их через свой сервер LLM
+и возвращает результат. Пока глава обрабатывается, аренда продлевается
+heartbeat-ами; если воркер упадет, глава вернется в очередь по истечении
+аренды, а готовые чанки продолжит другой воркер.
+
+Пример (на той же машине, общий файл очереди):
+    python worker.py --config config.json
+На другой машине со своим LM Studio (очередь через HTTP API backend):
+    python worker.py --api-url http://server:8000 --lm-url http://localhost:1234
+"""
+import argparse
+import asyncio
+import os
+import socket
+import sys
+import uuid
+from pathlib import Path
+from typing import Optional
+
+from batch import load_config
+from extractive import compress_text, compression_available
+from lm_studio_client import LMStudioClient, JobCancelledError
+from task_queue import WorkerBroker, create_broker
+from throughput import ThroughputTracker
+
+
+class QueueWorker:
+    """Цикл аренды и обработки глав из очереди"""
+
+    def __init__(self, config: dict, broker: WorkerBroker, lm_client: LMStudioClient, worker_id: str):
+        self.config = config
+        self.broker = broker
+        self.lm_client = lm_client
+        self.worker_id = worker_id
+        self.lease_seconds = config.get("lease_seconds", 60)
+        self.max_attempts = config.get("task_max_attempts", 3)
+        self.poll_interval = config.get("queue_poll_interval", 1.0)
+        self.processed = 0
+
+    async def _call(self, method, *args):
+        """Вызов брокера в пуле потоков (SQLite и HTTP блокируют)"""
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(None, method, *args)
+
+    async def run(self, max_tasks: Optional[int] = None):
+        if self.config.get("warm_up", True):
+            try:
+                await self.lm_client.warm_up_async()
+            except Exception as e:
+                print(f"[WARNING] Прогрев модели не удался: {e}")
+        print(f"Воркер {self.worker_id} ожидает задачи")
+        while max_tasks is None or self.processed < max_tasks:
+            try:
+                task = await self._call(self.broker.lease, self.worker_id, self.lease_seconds)
+            except Exception as e:
+                print(f"[WARNING] Очередь недоступна: {e}")
+                task = None
+            if task is None:
+                await asyncio.sleep(self.poll_interval)
+                continue
+            await self.process(task)
+            self.processed += 1
+
+    async def _heartbeat(self, task: dict):
+        """Продление аренды; при потере аренды текущий запрос к LLM прерывается"""
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            try:
+                alive = await self._call(self.broker.heartbeat, task["id"], self.worker_id, self.lease_seconds)
+            except Exception as e:
+                # Временный сбой связи: аренда истечет сама, если он затянется
+                print(f"[WARNING] Heartbeat не отправлен: {e}")
+                continue
+            if not alive:
+                print(f"Аренда главы {task['chapter_idx'] + 1} задачи {task['job_id']} потеряна")
+                self.lm_client.cancel()
+                return
+
+    async def _save_chunks(self, task: dict, pending: asyncio.Queue):
+        """
+        Сохранение готовых чанков в очереди по одному, в пуле потоков
+
+        Запись в брокер (SQLite или HTTP) не блокирует event loop, поэтому
+        heartbeat продлевает аренду вовремя. Сбой брокера - не ошибка LLM:
+        чанк остается у воркера и войдет в конспект главы.
+        """
+        while True:
+            item = await pending.get()
+            if item is None:
+                return
+            chunk_idx, chunks_total, text = item
+            try:
+                saved = await self._call(self.broker.save_chunk, task["id"], self.worker_id, chunk_idx, chunks_total, text)
+            except Exception as e:
+                print(f"[WARNING] Чанк {chunk_idx + 1} главы {task['chapter_idx'] + 1} не сохранен в очереди: {e}")
+                continue
+            if not saved:
+                # Аренда потеряна: глава уже у другого воркера
+                self.lm_client.cancel()
+                return
+
+    async def _report(self, method, *args) -> None:
+        """Отчет о главе в очередь; при сбое брокера аренда истечет и глава вернется в очередь"""
+        try:
+            await self._call(method, *args)
+        except Exception as e:
+            print(f"[WARNING] Результат главы не передан в очередь: {e}")
+
+    async def process(self, task: dict):
+        idx = task["chapter_idx"]
+        settings = task["settings"]
+        print(f"Глава {idx + 1} задачи {task['job_id']} (попытка {task['attempts']})")
+        self.lm_client.reset_cancel()
+        self.lm_client.throughput = ThroughputTracker(window=10000)
+        chunks = dict(task["chunks"])
+        total = {"chunks": None}
+        pending = asyncio.Queue()
+
+        def on_chunk_done(chunk_idx, chunks_total, text):
+            # Вызывается из event loop: запись в брокер уходит в _save_chunks
+            chunks[chunk_idx] = text
+            total["chunks"] = chunks_total
+            pending.put_nowait((chunk_idx, chunks_total, text))
+
+        heartbeat = asyncio.create_task(self._heartbeat(task))
+        saver = asyncio.create_task(self._save_chunks(task, pending))
+        try:
+            try:
+                text = task["text"]
+                if settings.get("fast_mode") and compression_available():
+                    loop = asyncio.get_event_loop()
+                    text = await loop.run_in_executor(None, compress_text, text, settings.get("fast_mode_ratio", 0.4))
+                summary = await self.lm_client.process_chapter(
+                    text,
+                    settings.get("max_chunk_size", 15000),
+                    settings.get("chunk_overlap", 0),
+                    done_chunks=chunks,
+                    on_chunk_done=on_chunk_done,
+                    tags={"chapter": idx}
+                )
+            except JobCancelledError:
+                print(f"Глава {idx + 1} задачи {task['job_id']} оставлена: аренда потеряна или задача отменена")
+                return
+            except Exception as e:
+                print(f"Ошибка обработки главы {idx + 1}: {e}")
+                await self._report(self.broker.fail, task["id"], self.worker_id, str(e), self.max_attempts)
+                return
+            # Готовые чанки сохраняются в очереди до отчета о главе
+            pending.put_nowait(None)
+            await saver
+            # Глава с ошибками в чанках повторяется (готовые чанки уже сохранены в очереди)
+            if total["chunks"] is not None and len(chunks) < total["chunks"]:
+                await self._report(self.broker.fail, task["id"], self.worker_id,
+                                   "Не все чанки обработаны успешно", self.max_attempts)
+                return
+            await self._report(self.broker.complete, task["id"], self.worker_id, summary,
+                               self.lm_client.throughput.totals())
+        finally:
+            saver.cancel()
+            heartbeat.cancel()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Воркер распределенной обработки глав")
+    parser.add_argument("--config", default="config.json", help="Путь к config.json")
+    parser.add_argument("--api-url", help="Адрес API backend (очередь через HTTP вместо общего файла)")
+    parser.add_argument("--lm-url", help="Адрес сервера LLM (по умолчанию lm_studio_url из конфига)")
+    parser.add_argument("--model", help="Модель (по умолчанию lm_studio_model из конфига)")
+    parser.add_argument("--worker-id", help="Идентификатор воркера (по умолчанию хост:pid)")
+    parser.add_argument("--max-tasks", type=int, help="Завершиться после обработки N глав")
+    args = parser.parse_args()
+
+    config = load_config(Path(args.config))
+    broker = create_broker(config, api_url=args.api_url)
+    lm_client = LMStudioClient(
+        base_url=args.lm_url or config.get("lm_studio_url", "http://localhost:1234"),
+        model_name=args.model or config.get("lm_studio_model", "local-model"),
+        prompt_cache=config.get("prompt_cache", True),
+        slot_count=config.get("llm_slots", 0),
+        routes=config.get("model_routes")
+    )
+    worker_id = args.worker_id or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+    worker = QueueWorker(config, broker, lm_client, worker_id)
+    try:
+        asyncio.run(worker.run(args.max_tasks))
+    except KeyboardInterrupt:
+        print("Воркер остановлен")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -42,6 +42,15 @@ def main():
         print("  Запустите: pip install -r backend/requirements.txt")
         all_ok = False
     
+    # Необязательные пакеты: без них отключаются OCR и быстрый режим
+    for module, feature in (("pytesseract", "OCR сканированных страниц"), ("numpy", "быстрый режим и фильтр служебных страниц")):
+        try:
+            __import__(module)
+            print(f"✓ {module} установлен ({feature})")
+        except ImportError:
+            print(f"- {module} не установлен (отключено: {feature})")
+            print("  Установите: pip install -r backend/requirements-optional.txt")
+    
     # Системные утилиты
     print("\n2. Системные утилиты:")
     if not check_command("pandoc", "Pandoc"):
@@ -1,5 +1,5 @@
 import React, { useState, useEffect, useCallback } from 'react'
-import { Upload, Settings, Download, Loader2, CheckCircle2, AlertCircle } from 'lucide-react'
+import { Upload, Settings, Download, Loader2, CheckCircle2, AlertCircle, XCircle } from 'lucide-react'
 import axios from 'axios'
 import ReactMarkdown from 'react-markdown'
 import DragDropZone from './components/DragDropZone'
@@ -10,7 +10,8 @@ import LivePreview from './components/LivePreview'
 const API_URL = 'http://localhost:8000'
 
 function App() {
-  const [status, setStatus] = useState('idle') // idle, processing, completed, error
+  const [status, setStatus] = useState('idle') // idle, processing, completed, error, cancelled
+  const [jobId, setJobId] = useState(null)
   const [progress, setProgress] = useState(0)
   const [currentChapter, setCurrentChapter] = useState(0)
   const [totalChapters, setTotalChapters] = useState(0)
@@ -28,6 +29,7 @@ function App() {
         const data = response.data
         
         setStatus(data.status)
+        setJobId(data.job_id)
         setProgress(data.progress || 0)
         setCurrentChapter(data.current_chapter || 0)
         setTotalChapters(data.total_chapters || 0)
@@ -95,9 +97,20 @@ function App() {
     }
   }
 
+  const handleCancel = async () => {
+    if (!jobId) return
+    try {
+      await axios.post(`${API_URL}/jobs/${jobId}/cancel`)
+    } catch (error) {
+      alert('Ошибка отмены: ' + (error.response?.data?.detail || error.message))
+    }
+  }
+
   const handleDownloadDocx = async () => {
     try {
-      const response = await axios.get(`${API_URL}/download-docx`, {
+      // Конспект той задачи, которую показывает интерфейс (задачи выполняются одновременно)
+      const path = jobId ? `/jobs/${jobId}/download-docx` : '/download-docx'
+      const response = await axios.get(`${API_URL}${path}`, {
         responseType: 'blob'
       })
       
@@ -171,7 +184,7 @@ function App() {
           {/* Left Column */}
           <div className="space-y-6">
             {/* Drag & Drop Zone */}
-            {status === 'idle' && (
+            {(status === 'idle' || status === 'cancelled') && (
               <DragDropZone onFileSelect={handleFileUpload} />
             )}
 
@@ -182,6 +195,14 @@ function App() {
                 <div className="mt-4 text-center text-deep-sea-300">
                   Глава {currentChapter} из {totalChapters}
                 </div>
+                <button
+                  onClick={handleCancel}
+                  disabled={!jobId}
+                  className="mt-4 w-full flex items-center justify-center gap-2 px-6 py-3 bg-deep-sea-700 hover:bg-deep-sea-600 disabled:opacity-50 rounded-lg transition-colors font-medium"
+                >
+                  <XCircle className="w-5 h-5" />
+                  Отменить
+                </button>
               </div>
             )}
 
@@ -7,5 +7,6 @@ if not exist venv (
 )
 call venv\Scripts\activate
 pip install -r requirements.txt --quiet
+pip install -r requirements-optional.txt --quiet
 python main.py
 pause
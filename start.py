@@ -43,6 +43,47 @@ def print_warning(message):
     """Вывод предупреждения"""
     print(f"{YELLOW}[~] {message}{RESET}")
 
+def compute_fingerprint(files, extra=()):
+    """Хеш содержимого файлов и параметров окружения"""
+    import hashlib
+    digest = hashlib.sha256()
+    for path in files:
+        path = Path(path)
+        digest.update(str(path).encode())
+        if path.exists():
+            digest.update(path.read_bytes())
+    for item in extra:
+        digest.update(str(item).encode())
+    return digest.hexdigest()
+
+def fingerprint_matches(stamp_file, fingerprint):
+    """Совпадает ли сохраненный отпечаток зависимостей"""
+    stamp_file = Path(stamp_file)
+    return stamp_file.exists() and stamp_file.read_text().strip() == fingerprint
+
+def save_fingerprint(stamp_file, fingerprint):
+    Path(stamp_file).write_text(fingerprint)
+
+def wait_until(condition, timeout, process=None, interval=0.1):
+    """Ожидание выполнения условия; прерывается, если процесс завершился"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if condition():
+            return True
+        if process is not None and process.poll() is not None:
+            return False
+        time.sleep(interval)
+    return condition()
+
+def http_ready(url):
+    """Проверка готовности HTTP-сервиса"""
+    import urllib.request
+    try:
+        with urllib.request.urlopen(url, timeout=0.5) as response:
+            return response.status < 500
+    except Exception:
+        return False
+
 def check_command(command, name, install_hint=""):
     """Проверка наличия команды в PATH"""
     try:
@@ -156,6 +197,7 @@ def setup_backend():
     backend_dir = Path("backend")
     venv_dir = backend_dir / "venv"
     requirements_file = backend_dir / "requirements.txt"
+    optional_file = backend_dir / "requirements-optional.txt"
     
     print_status("Настройка backend...")
     
@@ -179,8 +221,17 @@ def setup_backend():
         python_exe = venv_dir / "bin" / "python"
         pip_exe = venv_dir / "bin" / "pip"
     
+    # Отпечаток requirements*.txt и окружения: если не изменился, установка не нужна
+    stamp_file = venv_dir / ".requirements.sha256"
+    fingerprint = compute_fingerprint(
+        [requirements_file, optional_file],
+        [sys.version, platform.platform(), python_exe.resolve() if python_exe.exists() else python_exe]
+    )
+    
     # Установка зависимостей
-    if requirements_file.exists():
+    if requirements_file.exists() and fingerprint_matches(stamp_file, fingerprint):
+        print_status("Зависимости backend актуальны")
+    elif requirements_file.exists():
         print_status("Установка зависимостей backend...")
         result = subprocess.run(
             [str(pip_exe), "install", "-q", "-r", str(requirements_file)],
@@ -205,10 +256,34 @@ def setup_backend():
             else:
                 print_error("Неизвестная ошибка")
             return False
+        # Необязательные пакеты (OCR, быстрый режим): без них backend работает с отключенными функциями
+        if optional_file.exists():
+            result = subprocess.run(
+                [str(pip_exe), "install", "-q", "-r", str(optional_file)],
+                cwd=backend_dir.parent,
+                capture_output=True
+            )
+            if result.returncode != 0:
+                print_warning("Не удалось установить необязательные зависимости (OCR, быстрый режим)")
+        save_fingerprint(stamp_file, fingerprint)
         print_status("Зависимости backend установлены")
     
     return str(python_exe)
 
+def get_node_version():
+    """Версия Node.js (часть отпечатка зависимостей frontend)"""
+    try:
+        result = subprocess.run(
+            ["node", "--version"],
+            capture_output=True,
+            text=True,
+            timeout=5,
+            shell=platform.system() == "Windows"
+        )
+        return result.stdout.strip()
+    except Exception:
+        return ""
+
 def setup_frontend():
     """Настройка frontend"""
     frontend_dir = Path("frontend")
@@ -221,21 +296,30 @@ def setup_frontend():
         print_error("package.json не найден")
         return False
     
+    # Отпечаток package-lock.json и версии Node.js: если не изменился, npm install не нужен
+    stamp_file = node_modules / ".package-lock.sha256"
+    fingerprint = compute_fingerprint(
+        [package_json, frontend_dir / "package-lock.json"],
+        [get_node_version(), platform.platform()]
+    )
+    
     # Установка зависимостей
-    if not node_modules.exists():
+    if node_modules.exists() and fingerprint_matches(stamp_file, fingerprint):
+        print_status("Зависимости frontend актуальны")
+    else:
         print_status("Установка зависимостей frontend (это может занять несколько минут)...")
         result = subprocess.run(
             ["npm", "install"],
             cwd=frontend_dir,
-            capture_output=True
+            capture_output=True,
+            shell=platform.system() == "Windows"
         )
         if result.returncode != 0:
             print_error("Не удалось установить зависимости frontend")
             print_error(result.stderr.decode() if result.stderr else "Неизвестная ошибка")
             return False
+        save_fingerprint(stamp_file, fingerprint)
         print_status("Зависимости frontend установлены")
-    else:
-        print_status("Зависимости frontend уже установлены")
     
     return True
 
@@ -329,8 +413,20 @@ def kill_process_on_port(port):
         except Exception:
             pass
 
+BACKEND_HEALTH_URL = "http://localhost:8000/health"
+FRONTEND_URL = "http://localhost:5173"
+
+def free_port(port):
+    """Освобождение занятого порта; True, если порт свободен"""
+    if check_port_available(port):
+        return True
+    print_warning(f"Порт {port} уже занят. Попытка освободить...")
+    kill_process_on_port(port)
+    return wait_until(lambda: check_port_available(port), timeout=5)
+
 def start_backend(python_exe):
     """Запуск backend"""
+    import tempfile
     backend_dir = Path("backend")
     main_py = backend_dir / "main.py"
     
@@ -342,131 +438,61 @@ def start_backend(python_exe):
         return None
     
     # Проверяем, свободен ли порт 8000
-    if not check_port_available(8000):
-        print_warning("Порт 8000 уже занят. Попытка освободить...")
-        if kill_process_on_port(8000):
-            time.sleep(2)
-        if not check_port_available(8000):
-            print_error("Порт 8000 все еще занят. Закройте процесс, использующий этот порт.")
-            print_warning("Или перезапустите компьютер и попробуйте снова.")
-            return None
+    if not free_port(8000):
+        print_error("Порт 8000 все еще занят. Закройте процесс, использующий этот порт.")
+        print_warning("Или перезапустите компьютер и попробуйте снова.")
+        return None
     
-    # Проверяем, свободен ли порт 8000
-    if not check_port_available(8000):
-        print_warning("Порт 8000 уже занят. Попытка освободить...")
-        kill_process_on_port(8000)
-        time.sleep(1)
-        if not check_port_available(8000):
-            print_error("Порт 8000 все еще занят. Закройте процесс, использующий этот порт, и попробуйте снова.")
-            print_warning("Или перезапустите компьютер.")
-            return None
-    
-    # Запуск в фоне с захватом ошибок для отладки
+    # Вывод ошибок пишется во временный файл: при падении на старте его можно показать
+    error_log = tempfile.TemporaryFile()
     try:
+        kwargs = {}
         if platform.system() == "Windows":
-            # Сначала пробуем запустить с выводом ошибок для диагностики
-            test_process = subprocess.Popen(
-                [str(python_exe), str(main_py)],
-                cwd=backend_dir.parent,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True
-            )
-            # Ждем немного
-            time.sleep(2)
-            if test_process.poll() is not None:
-                # Процесс завершился - получаем ошибку
-                stdout, stderr = test_process.communicate()
-                if stderr:
-                    print_error("Ошибка при запуске backend:")
-                    print_error(stderr)
-                elif stdout:
-                    print_error("Вывод backend:")
-                    print_error(stdout)
-                return None
-            
-            # Если процесс еще работает, убиваем тестовый и запускаем нормальный
-            test_process.terminate()
-            test_process.wait()
-            
-            # Запускаем нормальный процесс
-            process = subprocess.Popen(
-                [str(python_exe), str(main_py)],
-                cwd=backend_dir.parent,
-                stdout=subprocess.DEVNULL,
-                stderr=subprocess.DEVNULL,
-                creationflags=subprocess.CREATE_NO_WINDOW
-            )
-        else:
-            process = subprocess.Popen(
-                [str(python_exe), str(main_py)],
-                cwd=backend_dir.parent,
-                stdout=subprocess.DEVNULL,
-                stderr=subprocess.DEVNULL
-            )
-    except AttributeError:
-        # Fallback для старых версий Python
+            kwargs["creationflags"] = subprocess.CREATE_NO_WINDOW
         process = subprocess.Popen(
             [str(python_exe), str(main_py)],
             cwd=backend_dir.parent,
             stdout=subprocess.DEVNULL,
-            stderr=subprocess.DEVNULL
+            stderr=error_log,
+            **kwargs
         )
     except Exception as e:
         print_error(f"Ошибка при запуске backend: {e}")
         return None
     
-    # Ждем немного и проверяем, что процесс запустился
-    time.sleep(3)
-    if process.poll() is None:
-        # Проверяем, что сервер действительно запустился, проверяя порт
-        import socket
-        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        sock.settimeout(1)
-        result = sock.connect_ex(('localhost', 8000))
-        sock.close()
-        
-        if result == 0:
-            print_status("Backend запущен на http://localhost:8000")
-            return process
-        else:
-            print_warning("Backend процесс запущен, но порт 8000 еще не доступен. Подождите...")
-            time.sleep(2)
-            # Проверяем еще раз
-            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            sock.settimeout(1)
-            result = sock.connect_ex(('localhost', 8000))
-            sock.close()
-            if result == 0:
-                print_status("Backend запущен на http://localhost:8000")
-                return process
-            else:
-                print_error("Backend не отвечает на порту 8000")
-                process.terminate()
-                return None
-    else:
+    # Ожидание реальной готовности: /health отвечает, а не просто прошло время
+    if wait_until(lambda: http_ready(BACKEND_HEALTH_URL), timeout=60, process=process):
+        print_status("Backend запущен на http://localhost:8000")
+        return process
+    
+    if process.poll() is not None:
+        error_log.seek(0)
+        stderr = error_log.read().decode("utf-8", errors="replace").strip()
         print_error("Не удалось запустить backend - процесс завершился сразу")
+        if stderr:
+            print_error(stderr)
         print_warning("Попробуйте запустить backend вручную для диагностики:")
         print_warning(f"  cd backend")
         print_warning(f"  {python_exe} main.py")
-        return None
+    else:
+        print_error("Backend не отвечает на порту 8000")
+        process.terminate()
+    return None
 
 def start_frontend():
     """Запуск frontend"""
+    import tempfile
     frontend_dir = Path("frontend")
     
     print_status("Запуск frontend сервера...")
     
     # Проверяем, свободен ли порт 5173
-    if not check_port_available(5173):
-        print_warning("Порт 5173 уже занят. Попытка освободить...")
-        if kill_process_on_port(5173):
-            time.sleep(2)
-        if not check_port_available(5173):
-            print_error("Порт 5173 все еще занят. Закройте процесс, использующий этот порт.")
-            return None
-    
-    # Запуск в фоне
+    if not free_port(5173):
+        print_error("Порт 5173 все еще занят. Закройте процесс, использующий этот порт.")
+        return None
+    
+    # Запуск в фоне; вывод ошибок сохраняется для диагностики
+    error_log = tempfile.TemporaryFile()
     if platform.system() == "Windows":
         # На Windows нужно использовать shell=True и передавать команду как строку
         try:
@@ -474,7 +500,7 @@ def start_frontend():
                 "npm run dev",
                 cwd=frontend_dir,
                 stdout=subprocess.DEVNULL,
-                stderr=subprocess.DEVNULL,
+                stderr=error_log,
                 shell=True,
                 creationflags=subprocess.CREATE_NO_WINDOW
             )
@@ -484,7 +510,7 @@ def start_frontend():
                 "npm run dev",
                 cwd=frontend_dir,
                 stdout=subprocess.DEVNULL,
-                stderr=subprocess.DEVNULL,
+                stderr=error_log,
                 shell=True
             )
     else:
@@ -492,20 +518,24 @@ def start_frontend():
             ["npm", "run", "dev"],
             cwd=frontend_dir,
             stdout=subprocess.DEVNULL,
-            stderr=subprocess.DEVNULL
+            stderr=error_log
         )
     
-    # Ждем немного
-    time.sleep(3)
-    if process.poll() is None:
+    # Ожидание, пока Vite начнет отвечать
+    if wait_until(lambda: http_ready(FRONTEND_URL), timeout=60, process=process):
         print_status("Frontend запущен на http://localhost:5173")
         return process
-    else:
-        stdout, stderr = process.communicate()
+    
+    if process.poll() is not None:
+        error_log.seek(0)
+        stderr = error_log.read().decode("utf-8", errors="replace").strip()
         print_error("Не удалось запустить frontend")
         if stderr:
-            print_error(stderr.decode())
-        return None
+            print_error(stderr)
+    else:
+        print_error("Frontend не отвечает на порту 5173")
+        process.terminate()
+    return None
 
 def main():
     """Главная функция"""
@@ -585,17 +615,13 @@ def main():
     if not backend_process:
         return 1
     
-    time.sleep(2)  # Даем время backend запуститься
-    
     frontend_process = start_frontend()
     if not frontend_process:
         backend_process.terminate()
         return 1
     
-    # Открытие браузера
+    # Открытие браузера (оба сервера уже отвечают)
     print_status("\n" + "="*60)
-    print_status("Ожидание запуска серверов...")
-    time.sleep(3)
     
     try:
         webbrowser.open("http://localhost:5173")